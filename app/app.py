@@ -2,15 +2,380 @@
 TryScape - Main Application Module
 Flask web application for TryScape image generation.
 """
-from flask import Flask, render_template, request, jsonify, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, stream_with_context, url_for
+from werkzeug.security import safe_join
+import hashlib
+import json
 import os
-import uuid
+import threading
+import time
 from datetime import datetime
+from typing import Callable, Optional, Tuple
 
 from app.config import Config
-from app.azure_service import AzureOpenAIService
-from app.utils.image_utils import ImageProcessor
-from app.utils.file_utils import allowed_file, save_uploaded_file
+from app.azure_service import (
+    AzureOpenAIService, GenerationResult, ProgressCallback, UpstreamCallback, notify_progress
+)
+from app.async_azure_service import AsyncAzureOpenAIService
+from app.utils.file_utils import allowed_file, save_file_bytes
+from app.storage import GENERATED_PREFIX, UPLOAD_PREFIX, get_storage
+from app.media import derivative_candidates, send_media
+from app.image_pool import get_image_pool
+from app.janitor import forget_media, get_expiry_index, start_janitor
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, DirectoryUsage, time_stage
+from app.job_store import create_job_store, owner_alive, process_owner
+from app.jobs import Job, JobError, JobManager, QueueFullError, chain_future
+
+
+# Error shown for stored jobs that cannot be resumed after a restart
+INTERRUPTED_JOB_ERROR = 'Generation was interrupted by a restart. Please try again.'
+
+
+_azure_service = None
+
+
+def get_azure_service() -> AzureOpenAIService:
+    """Return the process-wide Azure service, creating it on first use."""
+    global _azure_service
+    if _azure_service is None:
+        if Config.JOB_WORKER_TYPE == 'async':
+            _azure_service = AsyncAzureOpenAIService()
+        else:
+            _azure_service = AzureOpenAIService()
+    return _azure_service
+
+
+def run_generation_job(
+    generation_type: str,
+    user_image_bytes: bytes,
+    user_description: str,
+    clothing_description: str,
+    location_description: str,
+    candidates: int = 1,
+    defer: bool = False,
+    progress: Optional[ProgressCallback] = None,
+    on_upstream_job: Optional[UpstreamCallback] = None
+):
+    """
+    Generate and store an image or video. Runs on a job worker.
+    
+    Args:
+        generation_type: 'image' or 'video'
+        user_image_bytes: Validated, resized user image as PNG bytes
+        user_description: Text description of user
+        clothing_description: Text description of clothing
+        location_description: Text description or name of location
+        candidates: Images to generate in one edit call (images only)
+        defer: Return a Future for videos instead of waiting on the SORA job
+        progress: Optional callback for progress stages
+        on_upstream_job: Optional callback given the SORA job id (videos only)
+    
+    Returns:
+        Dictionary with the media type and the generated filename, or a
+        Future of it when a video is deferred
+    
+    Raises:
+        JobError: If generation or download fails
+    """
+    azure_service = get_azure_service()
+    
+    # Generate image or video using Azure OpenAI
+    if generation_type == 'video':
+        pending = azure_service.start_tryscape_video(
+            user_description=user_description,
+            clothing_description=clothing_description,
+            location_description=location_description,
+            progress=progress,
+            on_upstream_job=on_upstream_job
+        )
+        if defer:
+            # Free this worker while the shared SORA poller tracks the job
+            return chain_future(pending, lambda result: _store_generated_media(result, generation_type, progress))
+        result = pending.result()
+    else:
+        result = azure_service.generate_tryscape_image(
+            user_image_path=None,
+            user_image_bytes=user_image_bytes,  # Pass the prepared image
+            user_description=user_description,
+            clothing_description=clothing_description,
+            location_description=location_description,
+            progress=progress,
+            candidates=candidates
+        )
+    
+    return _store_generated_media(result, generation_type, progress)
+
+
+async def run_generation_job_async(
+    generation_type: str,
+    user_image_bytes: bytes,
+    user_description: str,
+    clothing_description: str,
+    location_description: str,
+    candidates: int = 1,
+    progress: Optional[ProgressCallback] = None,
+    on_upstream_job: Optional[UpstreamCallback] = None
+) -> dict:
+    """
+    Coroutine version of run_generation_job for the 'async' worker type.
+    
+    Returns:
+        Dictionary with the media type and the generated filename
+    
+    Raises:
+        JobError: If generation or download fails
+    """
+    azure_service = get_azure_service()
+    
+    if generation_type == 'video':
+        result = await azure_service.agenerate_tryscape_video(
+            user_description=user_description,
+            clothing_description=clothing_description,
+            location_description=location_description,
+            progress=progress,
+            on_upstream_job=on_upstream_job
+        )
+    else:
+        result = await azure_service.agenerate_tryscape_image(
+            user_image_bytes=user_image_bytes,
+            user_description=user_description,
+            clothing_description=clothing_description,
+            location_description=location_description,
+            progress=progress,
+            candidates=candidates
+        )
+    
+    return await _astore_generated_media(result, generation_type, progress)
+
+
+def resume_video_job(sora_job_id: str, defer: bool = False, progress: Optional[ProgressCallback] = None):
+    """
+    Finish a video job whose SORA job was created before a restart. Runs on a job worker.
+    
+    Args:
+        sora_job_id: Id of the existing SORA job
+        defer: Return a Future instead of waiting on the SORA job
+        progress: Optional callback for progress stages
+    
+    Returns:
+        Same as run_generation_job
+    
+    Raises:
+        JobError: If generation or download fails
+    """
+    pending = get_azure_service().resume_tryscape_video(sora_job_id, progress=progress)
+    if defer:
+        return chain_future(pending, lambda result: _store_generated_media(result, 'video', progress))
+    return _store_generated_media(pending.result(), 'video', progress)
+
+
+async def resume_video_job_async(sora_job_id: str, progress: Optional[ProgressCallback] = None) -> dict:
+    """Coroutine version of resume_video_job for the 'async' worker type."""
+    result = await get_azure_service().aresume_tryscape_video(sora_job_id, progress=progress)
+    return await _astore_generated_media(result, 'video', progress)
+
+
+def _generation_job_call(worker_type: str) -> Tuple[Callable, dict]:
+    """The generation job function for a worker type and its extra options."""
+    if worker_type == 'async':
+        return run_generation_job_async, {}
+    # Thread workers hand SORA jobs to the shared poller instead of waiting on them
+    return run_generation_job, {'defer': worker_type == 'thread'}
+
+
+def _resume_job_call(worker_type: str) -> Tuple[Callable, dict]:
+    """The video resume job function for a worker type and its extra options."""
+    if worker_type == 'async':
+        return resume_video_job_async, {}
+    return resume_video_job, {'defer': worker_type == 'thread'}
+
+
+def _generation_inputs(user_image_bytes: bytes, user_image_key: Optional[str], params: dict) -> Tuple[dict, str]:
+    """
+    Describe a generation request for the job store.
+    
+    Args:
+        user_image_bytes: Prepared user image
+        user_image_key: Storage key the image was saved under, if it was
+        params: JSON-serializable generation parameters
+    
+    Returns:
+        Tuple of (inputs stored with the job, hash identifying the request)
+    """
+    digest = hashlib.sha256(user_image_bytes)
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return dict(params, user_image_key=user_image_key), digest.hexdigest()
+
+
+def recover_jobs(job_manager: JobManager, storage) -> int:
+    """
+    Take over stored jobs left unfinished by processes that have exited.
+    
+    Videos whose SORA job was already created go back to polling it, so
+    the work already paid for is not repeated; other jobs are resubmitted
+    from their stored inputs. Jobs whose inputs are gone are marked failed.
+    
+    Args:
+        job_manager: Manager whose store is checked and which runs the jobs
+        storage: Media storage holding saved user images
+    
+    Returns:
+        Number of jobs resumed
+    """
+    store = job_manager.store
+    if store is None:
+        return 0
+    
+    owner = process_owner()
+    resumed = 0
+    for record in store.unfinished():
+        # A record with this process's own tag is left from an earlier process that had the same pid
+        if record['owner'] != owner and owner_alive(record['owner']):
+            continue
+        if not store.claim(record['id'], record['owner'], owner):
+            continue  # another worker got there first
+        
+        inputs = record['request'] or {}
+        try:
+            if record['kind'] == 'video' and record['upstream_id']:
+                job_fn, job_options = _resume_job_call(job_manager.worker_type)
+                job_manager.resume(
+                    record, job_fn, report_progress=True, sora_job_id=record['upstream_id'], **job_options
+                )
+            elif inputs.get('user_image_key'):
+                with storage.open(inputs['user_image_key']) as f:
+                    user_image_bytes = f.read()
+                params = {key: value for key, value in inputs.items() if key != 'user_image_key'}
+                job_fn, job_options = _generation_job_call(job_manager.worker_type)
+                job_manager.resume(
+                    record,
+                    job_fn,
+                    report_progress=True,
+                    report_upstream=True,
+                    user_image_bytes=user_image_bytes,
+                    **params,
+                    **job_options
+                )
+            else:
+                job_manager.abandon(record, INTERRUPTED_JOB_ERROR)
+                continue
+            resumed += 1
+        except Exception as e:
+            print(f"Error resuming job {record['id']}: {e}")
+            job_manager.abandon(record, INTERRUPTED_JOB_ERROR)
+    
+    if resumed:
+        print(f"Resumed {resumed} interrupted job(s)")
+    return resumed
+
+
+def release_job_inputs(job: Job, store, storage):
+    """
+    Delete the user image a finished job kept only so it could be resumed.
+    
+    The image stays when PERSIST_UPLOADS is set, and while another
+    unfinished job, such as a variant of the same batch, still needs it.
+    
+    Args:
+        job: The finished job
+        store: Job store of unfinished jobs, or None
+        storage: Media storage holding saved user images
+    """
+    key = (job.inputs or {}).get('user_image_key')
+    if key is None or Config.PERSIST_UPLOADS:
+        return
+    if job.batch is not None and not job.batch.done:
+        return
+    if store is not None and any(
+        (record['request'] or {}).get('user_image_key') == key for record in store.unfinished()
+    ):
+        return
+    storage.delete(key)
+    forget_media(key)
+
+
+def _store_generated_media(
+    result: Optional[GenerationResult],
+    generation_type: str,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Make sure generated media is in media storage and describe it.
+    
+    Stored results are used as they are; only remote media is downloaded.
+    Extra candidates that fail to download are dropped.
+    """
+    if result is None:
+        raise JobError('Failed to generate ' + generation_type)
+    
+    stored = _store_remote_media(result, generation_type, progress)
+    if stored is None:
+        raise JobError('Failed to download generated ' + generation_type)
+    candidates = [
+        candidate for candidate in
+        (_store_remote_media(candidate, generation_type) for candidate in result.candidates)
+        if candidate is not None
+    ]
+    
+    return _describe_media(stored, candidates, generation_type)
+
+
+async def _astore_generated_media(
+    result: Optional[GenerationResult],
+    generation_type: str,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """Coroutine version of _store_generated_media: downloads remote media without blocking the loop."""
+    if result is None:
+        raise JobError('Failed to generate ' + generation_type)
+    
+    stored = await _astore_remote_media(result, generation_type, progress)
+    if stored is None:
+        raise JobError('Failed to download generated ' + generation_type)
+    candidates = [
+        candidate for candidate in
+        [await _astore_remote_media(candidate, generation_type) for candidate in result.candidates]
+        if candidate is not None
+    ]
+    
+    return _describe_media(stored, candidates, generation_type)
+
+
+def _describe_media(stored: GenerationResult, candidates, generation_type: str) -> dict:
+    """Job result for stored media and its extra candidates."""
+    return {
+        'media_type': generation_type,
+        'storage_key': stored.storage_key,
+        'derivatives': stored.metadata.get('derivatives', {}),
+        'candidates': [
+            {'storage_key': candidate.storage_key, 'derivatives': candidate.metadata.get('derivatives', {})}
+            for candidate in candidates
+        ]
+    }
+
+
+def _store_remote_media(
+    result: GenerationResult,
+    generation_type: str,
+    progress: Optional[ProgressCallback] = None
+) -> Optional[GenerationResult]:
+    """Download remotely hosted media into storage; stored results are returned as they are."""
+    if result.storage_key is not None:
+        return result
+    notify_progress(progress, 'downloading')
+    return get_azure_service().store_remote_media(result.remote_url, generation_type, result.metadata)
+
+
+async def _astore_remote_media(
+    result: GenerationResult,
+    generation_type: str,
+    progress: Optional[ProgressCallback] = None
+) -> Optional[GenerationResult]:
+    """Coroutine version of _store_remote_media."""
+    if result.storage_key is not None:
+        return result
+    notify_progress(progress, 'downloading')
+    return await get_azure_service().astore_remote_media(result.remote_url, generation_type, result.metadata)
 
 
 def create_app():
@@ -23,8 +388,41 @@ def create_app():
     os.makedirs(Config.GENERATED_FOLDER, exist_ok=True)
     
     # Initialize services
-    azure_service = AzureOpenAIService()
-    image_processor = ImageProcessor()
+    storage = get_storage()
+    get_azure_service()
+    image_pool = get_image_pool()
+    job_manager = JobManager(
+        worker_type=Config.JOB_WORKER_TYPE,
+        max_workers=Config.JOB_MAX_WORKERS,
+        max_queue=Config.JOB_MAX_QUEUE,
+        result_ttl=Config.JOB_RESULT_TTL,
+        store=create_job_store(),
+        on_finish=lambda job: release_job_inputs(job, job_manager.store, storage)
+    )
+    app.extensions['job_manager'] = job_manager
+    app.extensions['azure_service'] = get_azure_service()
+    app.extensions['janitor'] = None
+    recovery = {'pid': None, 'lock': threading.Lock()}
+    
+    @app.before_request
+    def start_serving_process():
+        """
+        Start the media janitor and resume jobs from exited processes once per serving process.
+        
+        Done on the first request rather than in create_app so that with
+        SERVER_PRELOAD the janitor thread and the jobs run in the forked
+        workers, not the master.
+        """
+        if recovery['pid'] == os.getpid():
+            return
+        with recovery['lock']:
+            if recovery['pid'] != os.getpid():
+                recovery['pid'] = os.getpid()
+                app.extensions['janitor'] = start_janitor(storage)
+                try:
+                    recover_jobs(job_manager, storage)
+                except Exception as e:
+                    print(f"Error recovering jobs: {e}")
     
     @app.route('/')
     def index():
@@ -34,7 +432,9 @@ def create_app():
     @app.route('/generate', methods=['POST'])
     def generate_image():
         """
-        Handle image generation request.
+        Queue an image generation request.
+        
+        Responds with 202 and a job id; poll /jobs/<job_id> for the result.
         
         Expected form data:
         - user_image: Image file of the user
@@ -42,49 +442,24 @@ def create_app():
         - user_description: Text description of user
         - clothing_description: Text description of clothing
         - location_description: Text description or name of location
+        - candidates: Images to generate in one edit call (optional, default 1)
         """
         try:
-            # Validate request
-            if 'user_image' not in request.files:
-                return jsonify({'error': 'No user image provided'}), 400
-            
-            user_image = request.files['user_image']
-            
-            if user_image.filename == '':
-                return jsonify({'error': 'No user image selected'}), 400
-            
-            if not allowed_file(user_image.filename):
-                return jsonify({'error': 'Invalid file type for user image'}), 400
-            
-            # Save uploaded user image
-            user_image_path = save_uploaded_file(
-                user_image, 
-                Config.UPLOAD_FOLDER, 
-                prefix='user_'
-            )
-            
-            # Validate and resize image
-            if not image_processor.validate_image(user_image_path):
-                os.remove(user_image_path)
-                return jsonify({'error': 'Invalid user image file'}), 400
-            
-            image_processor.resize_image(user_image_path)
+            user_image_bytes, error = prepare_user_image()
+            if error is not None:
+                return jsonify({'error': error}), 400
             
             # Process clothing image if provided
-            clothing_image_path = None
             if 'clothing_image' in request.files:
                 clothing_image = request.files['clothing_image']
                 if clothing_image.filename != '' and allowed_file(clothing_image.filename):
-                    clothing_image_path = save_uploaded_file(
-                        clothing_image,
-                        Config.UPLOAD_FOLDER,
-                        prefix='clothing_'
-                    )
-                    if image_processor.validate_image(clothing_image_path):
-                        image_processor.resize_image(clothing_image_path)
-                    else:
-                        os.remove(clothing_image_path)
-                        clothing_image_path = None
+                    with time_stage('normalize'):
+                        clothing_image_bytes = image_pool.prepare_image(
+                            clothing_image.read(), fast_resample_ratio=Config.IMAGE_FAST_RESAMPLE_RATIO
+                        )
+                    if clothing_image_bytes is not None and Config.PERSIST_UPLOADS:
+                        with time_stage('upload_save'):
+                            save_file_bytes(clothing_image_bytes, UPLOAD_PREFIX, prefix='clothing_')
             
             # Get text descriptions
             user_description = request.form.get('user_description', 'a person')
@@ -96,46 +471,388 @@ def create_app():
             if generation_type == 'video' and not Config.ENABLE_SORA:
                 return jsonify({'error': 'Video generation is not enabled'}), 400
             
-            # Generate image or video using Azure OpenAI
-            if generation_type == 'video':
-                media_url = azure_service.generate_tryscape_video(
-                    user_description=user_description,
-                    clothing_description=clothing_description,
-                    location_description=location_description
-                )
-                file_extension = 'mp4'
-            else:
-                media_url = azure_service.generate_tryscape_image(
-                    user_image_path=user_image_path,  # Pass the uploaded image path
-                    user_description=user_description,
-                    clothing_description=clothing_description,
-                    location_description=location_description
-                )
-                file_extension = 'png'
+            candidates, error = parse_candidates()
+            if error is not None:
+                return jsonify({'error': error}), 400
             
-            if not media_url:
-                return jsonify({'error': 'Failed to generate ' + generation_type}), 500
+            params = {
+                'generation_type': generation_type,
+                'user_description': user_description,
+                'clothing_description': clothing_description,
+                'location_description': location_description,
+                'candidates': candidates,
+            }
+            job_fn, job_options = _generation_job_call(job_manager.worker_type)
+            user_image_key = save_user_image(user_image_bytes)
+            inputs, inputs_hash = _generation_inputs(user_image_bytes, user_image_key, params)
             
-            # Download generated media
-            generated_filename = f"generated_{uuid.uuid4().hex}.{file_extension}"
-            generated_path = os.path.join(Config.GENERATED_FOLDER, generated_filename)
+            # Hand the slow Azure call to the worker pool and return immediately;
+            # a repeat of a request still in progress gets the same job
+            try:
+                job = job_manager.submit(
+                    job_fn,
+                    kind=generation_type,
+                    report_progress=True,
+                    report_upstream=True,
+                    inputs=inputs,
+                    inputs_hash=inputs_hash,
+                    user_image_bytes=user_image_bytes,
+                    **params,
+                    **job_options
+                )
+            except QueueFullError as e:
+                discard_user_image(user_image_key)
+                return jsonify({'error': str(e)}), 429
+            except Exception:
+                discard_user_image(user_image_key)
+                raise
             
-            if not azure_service.download_image(media_url, generated_path):
-                return jsonify({'error': 'Failed to download generated ' + generation_type}), 500
+            if job.inputs is not inputs:
+                # An identical request is already pending and has its own copy of the image
+                discard_user_image(user_image_key)
             
-            # Return success response
             return jsonify({
                 'success': True,
-                'generated_media_url': url_for('static', filename=f'generated/{generated_filename}'),
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': url_for('job_status', job_id=job.id),
+                'events_url': url_for('job_events', job_id=job.id),
                 'media_type': generation_type,
                 'timestamp': datetime.now().isoformat()
-            })
+            }), 202
             
         except Exception as e:
             print(f"Error in generate_image: {e}")
             # Don't expose internal error details to users
             return jsonify({'error': 'An error occurred while generating the image. Please try again.'}), 500
     
+    @app.route('/generate/batch', methods=['POST'])
+    def generate_batch():
+        """
+        Queue one generation per variant of a single user image.
+        
+        The image is validated and resized once and shared by every job;
+        the jobs run concurrently within the worker pool and Azure limits.
+        Responds with 202 and a batch id; follow /batches/<batch_id>/events
+        to receive each variant as it finishes.
+        
+        Expected form data:
+        - user_image: Image file of the user
+        - user_description: Text description of user
+        - generation_type: 'image' or 'video'
+        - candidates: Images per variant, from one edit call (optional)
+        - variants: JSON list of {"clothing_description", "location_description"}
+        """
+        try:
+            try:
+                variants = json.loads(request.form.get('variants', ''))
+            except ValueError:
+                return jsonify({'error': 'variants must be a JSON list'}), 400
+            if not isinstance(variants, list) or not variants:
+                return jsonify({'error': 'variants must be a non-empty JSON list'}), 400
+            if len(variants) > Config.BATCH_MAX_VARIANTS:
+                return jsonify({'error': f"At most {Config.BATCH_MAX_VARIANTS} variants per batch"}), 400
+            if not all(isinstance(variant, dict) for variant in variants):
+                return jsonify({'error': 'Each variant must be a JSON object'}), 400
+            
+            generation_type = request.form.get('generation_type', 'image')
+            if generation_type == 'video' and not Config.ENABLE_SORA:
+                return jsonify({'error': 'Video generation is not enabled'}), 400
+            
+            candidates, error = parse_candidates()
+            if error is not None:
+                return jsonify({'error': error}), 400
+            
+            user_image_bytes, error = prepare_user_image()
+            if error is not None:
+                return jsonify({'error': error}), 400
+            
+            params = {
+                'generation_type': generation_type,
+                'user_description': request.form.get('user_description', 'a person'),
+                'candidates': candidates,
+            }
+            variants = [
+                {
+                    'clothing_description': str(variant.get('clothing_description') or 'casual outfit'),
+                    'location_description': str(variant.get('location_description') or 'outdoor setting'),
+                }
+                for variant in variants
+            ]
+            job_fn, job_options = _generation_job_call(job_manager.worker_type)
+            user_image_key = save_user_image(user_image_bytes)
+            try:
+                batch = job_manager.submit_batch(
+                    job_fn,
+                    variants,
+                    kind=generation_type,
+                    report_progress=True,
+                    report_upstream=True,
+                    inputs=[
+                        _generation_inputs(user_image_bytes, user_image_key, dict(params, **variant))[0]
+                        for variant in variants
+                    ],
+                    user_image_bytes=user_image_bytes,
+                    **params,
+                    **job_options
+                )
+            except QueueFullError as e:
+                discard_user_image(user_image_key)
+                return jsonify({'error': str(e)}), 429
+            except Exception:
+                discard_user_image(user_image_key)
+                raise
+            
+            return jsonify({
+                'success': True,
+                'batch_id': batch.id,
+                'status_url': url_for('batch_status', batch_id=batch.id),
+                'events_url': url_for('batch_events', batch_id=batch.id),
+                'jobs': [
+                    {
+                        'variant': index,
+                        'job_id': job.id,
+                        'status_url': url_for('job_status', job_id=job.id),
+                    }
+                    for index, job in enumerate(batch.jobs)
+                ],
+                'media_type': generation_type,
+                'timestamp': datetime.now().isoformat()
+            }), 202
+            
+        except Exception as e:
+            print(f"Error in generate_batch: {e}")
+            return jsonify({'error': 'An error occurred while generating. Please try again.'}), 500
+    
+    def prepare_user_image():
+        """
+        Validate and normalize the uploaded user image of the current request.
+        
+        Returns:
+            Tuple of (PNG bytes, None), or (None, error message) for a bad upload
+        """
+        if 'user_image' not in request.files:
+            return None, 'No user image provided'
+        
+        user_image = request.files['user_image']
+        
+        if user_image.filename == '':
+            return None, 'No user image selected'
+        
+        if not allowed_file(user_image.filename):
+            return None, 'Invalid file type for user image'
+        
+        # Decode, validate and resize in memory straight from the request stream
+        with time_stage('normalize'):
+            user_image_bytes = image_pool.prepare_image(
+                user_image.read(), fast_resample_ratio=Config.IMAGE_FAST_RESAMPLE_RATIO
+            )
+        if user_image_bytes is None:
+            return None, 'Invalid user image file'
+        return user_image_bytes, None
+    
+    def save_user_image(user_image_bytes: bytes) -> Optional[str]:
+        """
+        Keep a prepared user image in storage if uploads are persisted or
+        jobs are durable, since resubmitting a job after a restart needs it.
+        
+        Returns:
+            Storage key, or None if the image is not kept
+        """
+        if Config.PERSIST_UPLOADS or job_manager.store is not None:
+            with time_stage('upload_save'):
+                return save_file_bytes(user_image_bytes, UPLOAD_PREFIX, prefix='user_')
+        return None
+    
+    def discard_user_image(key: Optional[str]):
+        """Delete a user image saved for a job that was not created."""
+        if key is not None:
+            storage.delete(key)
+            forget_media(key)
+    
+    def parse_candidates():
+        """
+        Read the optional 'candidates' form field: images per edit call.
+        
+        Returns:
+            Tuple of (count, None), or (None, error message) if out of range
+        """
+        try:
+            candidates = int(request.form.get('candidates', 1))
+        except ValueError:
+            candidates = 0
+        if not 1 <= candidates <= Config.IMAGE_MAX_CANDIDATES:
+            return None, f"candidates must be between 1 and {Config.IMAGE_MAX_CANDIDATES}"
+        return candidates, None
+    
+    def media_urls(media: dict) -> dict:
+        """URLs of one stored image or video and its derivatives."""
+        return {
+            'generated_media_url': storage.url(media['storage_key']),
+            'derivatives': {
+                name: {image_format: storage.url(key) for image_format, key in formats.items()}
+                for name, formats in media.get('derivatives', {}).items()
+            }
+        }
+    
+    def job_payload(job) -> dict:
+        """
+        Serialize a job for clients, with the media URL once it has succeeded.
+        
+        'candidates' lists every image the edit call returned, the first
+        being the one in generated_media_url.
+        """
+        data = job.to_dict()
+        if data['status'] == 'succeeded':
+            result = data.pop('result')
+            data['success'] = True
+            data['media_type'] = result['media_type']
+            data.update(media_urls(result))
+            data['candidates'] = [media_urls(media) for media in [result] + result.get('candidates', [])]
+        return data
+    
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        """Report the status of a generation job and its result once finished."""
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job_payload(job))
+    
+    @app.route('/jobs/<job_id>/events')
+    def job_events(job_id):
+        """
+        Stream a job's progress as Server-Sent Events until it finishes.
+        
+        Each change is sent as a 'status' event carrying the same JSON as
+        /jobs/<job_id>. Comment lines keep idle proxies from closing the
+        connection while a long generation runs.
+        """
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        def stream():
+            version = None
+            last_sent = time.monotonic()
+            while True:
+                job.refresh()  # process workers cannot report their start
+                if job.version != version:
+                    version = job.version
+                    finished = job.done  # read first so the last event always carries the outcome
+                    last_sent = time.monotonic()
+                    yield f"event: status\ndata: {json.dumps(job_payload(job))}\n\n"
+                    if finished:
+                        return
+                elif time.monotonic() - last_sent >= Config.JOB_EVENTS_KEEPALIVE:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                job.wait_for_change(version, timeout=1.0)
+        
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    def batch_payload(batch) -> dict:
+        """Serialize a batch for clients, with each job as job_payload plus its variant index."""
+        data = batch.to_dict()
+        data['jobs'] = [dict(job_payload(job), variant=index) for index, job in enumerate(batch.jobs)]
+        return data
+    
+    @app.route('/batches/<batch_id>')
+    def batch_status(batch_id):
+        """Report the status of every job in a batch."""
+        batch = job_manager.get_batch(batch_id)
+        if batch is None:
+            return jsonify({'error': 'Batch not found'}), 404
+        return jsonify(batch_payload(batch))
+    
+    @app.route('/batches/<batch_id>/events')
+    def batch_events(batch_id):
+        """
+        Stream a batch's progress as Server-Sent Events until every job finishes.
+        
+        Each job change is sent as a 'status' event carrying the job's JSON
+        (as /jobs/<job_id>, plus its variant index), so results arrive in
+        the order they finish. A final 'done' event carries the whole batch.
+        """
+        batch = job_manager.get_batch(batch_id)
+        if batch is None:
+            return jsonify({'error': 'Batch not found'}), 404
+        
+        def stream():
+            versions = [None] * len(batch.jobs)
+            last_sent = time.monotonic()
+            while True:
+                version = batch.version
+                batch.refresh()
+                for index, job in enumerate(batch.jobs):
+                    if job.version != versions[index]:
+                        versions[index] = job.version
+                        last_sent = time.monotonic()
+                        payload = dict(job_payload(job), variant=index)
+                        yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                # Finish once every job is done and the event saying so has been sent
+                if all(job.done and job.version == versions[index] for index, job in enumerate(batch.jobs)):
+                    yield f"event: done\ndata: {json.dumps(batch_payload(batch))}\n\n"
+                    return
+                if time.monotonic() - last_sent >= Config.JOB_EVENTS_KEEPALIVE:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                batch.wait_for_change(version, timeout=1.0)
+        
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    @app.route('/media/<path:key>')
+    def media(key):
+        """
+        Serve generated media with Range support, ETags derived from the key,
+        size and modification time, and immutable caching, optionally
+        offloading the bytes to a front proxy.
+        
+        ?size=<name> (e.g. thumb, preview) serves a downscaled copy in the
+        best format the client accepts, falling back to the original.
+        """
+        if not key.startswith(f"{GENERATED_PREFIX}/"):
+            return jsonify({'error': 'Media not found'}), 404
+        
+        size = request.args.get('size')
+        if size is not None and size not in Config.DERIVATIVE_SIZES:
+            return jsonify({'error': f"Unknown size: {size}"}), 400
+        candidates = [key]
+        if size is not None:
+            candidates = derivative_candidates(key, size, Config.DERIVATIVE_FORMATS, request.accept_mimetypes)
+        
+        if storage.local_path(key) is None:
+            # Remote backends serve their own objects
+            chosen = next((candidate for candidate in candidates if storage.exists(candidate)), key)
+            response = redirect(storage.url(chosen))
+        else:
+            paths = (safe_join(Config.STORAGE_LOCAL_ROOT, candidate) for candidate in candidates)
+            found = next(
+                ((candidate, path) for candidate, path in zip(candidates, paths) if path and os.path.isfile(path)),
+                None
+            )
+            if found is None:
+                return jsonify({'error': 'Media not found'}), 404
+            response = send_media(
+                found[1],
+                found[0],
+                max_age=Config.MEDIA_MAX_AGE,
+                offload=Config.MEDIA_OFFLOAD,
+                accel_prefix=Config.MEDIA_ACCEL_PREFIX
+            )
+        
+        if size is not None:
+            response.vary.add('Accept')
+        return response
+    
     @app.route('/health')
     def health():
         """Health check endpoint."""
@@ -145,6 +862,78 @@ def create_app():
             'timestamp': datetime.now().isoformat()
         })
     
+    # Only scanned when the janitor's index is not there to say what is stored
+    generated_usage = DirectoryUsage(Config.GENERATED_FOLDER, max_age=Config.METRICS_DISK_USAGE_TTL)
+    
+    def component_metrics():
+        """Gauges and component counters read at scrape time, as metric families."""
+        azure_service = get_azure_service()
+        index = get_expiry_index()
+        if index is not None:
+            generated_bytes, generated_files = index.usage(GENERATED_PREFIX)
+        else:
+            generated_bytes, generated_files = generated_usage.get() or (None, None)
+        families = [
+            ('tryscape_jobs_in_flight', 'gauge', 'Jobs queued, running or waiting on SORA',
+             [({}, job_manager.pending_count())]),
+            ('tryscape_sora_jobs_tracked', 'gauge', 'SORA jobs being polled',
+             [({}, azure_service.sora_poller.pending_count())]),
+            ('tryscape_generated_folder_bytes', 'gauge', 'Bytes of media in GENERATED_FOLDER',
+             [({}, generated_bytes)]),
+            ('tryscape_generated_folder_files', 'gauge', 'Files in GENERATED_FOLDER',
+             [({}, generated_files)]),
+        ]
+        
+        if azure_service.result_cache is not None:
+            cache = azure_service.result_cache.stats()
+            families += [
+                ('tryscape_result_cache_hits_total', 'counter', 'Result cache hits', [({}, cache['hits'])]),
+                ('tryscape_result_cache_misses_total', 'counter', 'Result cache misses', [({}, cache['misses'])]),
+                ('tryscape_result_cache_evictions_total', 'counter', 'Result cache evictions',
+                 [({}, cache['evictions'])]),
+                ('tryscape_result_cache_entries', 'gauge', 'Result cache entries', [({}, cache['entries'])]),
+                ('tryscape_result_cache_bytes', 'gauge', 'Result cache size', [({}, cache['bytes'])]),
+            ]
+        
+        governors = [
+            governor.stats() for governor in (azure_service.image_governor, azure_service.sora_governor)
+        ]
+        families += [
+            ('tryscape_deployment_acquired_total', 'counter', 'Slots granted per Azure deployment',
+             [({'deployment': stats['deployment']}, stats['acquired']) for stats in governors]),
+            ('tryscape_deployment_wait_seconds_total', 'counter', 'Time spent waiting for Azure deployment capacity',
+             [({'deployment': stats['deployment']}, stats['total_wait_seconds']) for stats in governors]),
+            ('tryscape_deployment_active', 'gauge', 'Operations holding a deployment slot',
+             [({'deployment': stats['deployment']}, stats['active']) for stats in governors]),
+            ('tryscape_deployment_waiting', 'gauge', 'Operations waiting for a deployment slot',
+             [({'deployment': stats['deployment']}, stats['waiting']) for stats in governors]),
+        ]
+        
+        janitor = app.extensions['janitor']
+        if janitor is not None:
+            stats = janitor.stats()
+            families += [
+                ('tryscape_janitor_files_reclaimed_total', 'counter', 'Expired media files deleted',
+                 [({}, stats['files_reclaimed'])]),
+                ('tryscape_janitor_bytes_reclaimed_total', 'counter', 'Bytes freed by deleting expired media',
+                 [({}, stats['bytes_reclaimed'])]),
+                ('tryscape_janitor_indexed_bytes', 'gauge', 'Media bytes tracked for expiry',
+                 [({}, stats['indexed_bytes'])]),
+            ]
+        return families
+    
+    @app.route('/metrics')
+    def metrics():
+        """
+        Metrics of this worker process in the Prometheus text format.
+        
+        Stage latency histograms, upstream response and retry counters,
+        and gauges for jobs in flight and GENERATED_FOLDER disk usage.
+        """
+        if not Config.METRICS_ENABLED:
+            return jsonify({'error': 'Not found'}), 404
+        return Response(REGISTRY.render([component_metrics]), content_type=METRICS_CONTENT_TYPE)
+    
     return app
 
 
@@ -0,0 +1,344 @@
+"""
+TryScape - Async Azure OpenAI Service
+asyncio/httpx variant of AzureOpenAIService for holding many generations in flight on one thread.
+"""
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Optional
+
+import httpx
+
+from app.azure_service import (
+    AzureOpenAIService, GenerationResult, ProgressCallback, UpstreamCallback, DOWNLOAD_CHUNK_SIZE, notify_progress
+)
+from app.config import Config
+from app.http_client import create_async_client, send_with_retry
+from app.metrics import record_upstream_response, time_stage
+from app.result_cache import ResultCache
+from app.utils.b64_stream import StreamingB64JsonDecoder
+
+
+class AsyncAzureOpenAIService(AzureOpenAIService):
+    """
+    Azure OpenAI service with coroutine versions of the generation calls.
+
+    Prompt construction, masks, caching, request coalescing, rate limits and
+    result handling are shared with AzureOpenAIService, and the synchronous
+    API keeps working. The async methods must all run on one event loop,
+    which owns the httpx client.
+    """
+
+    def __init__(self):
+        """Initialize the shared service state; the async client is created on first use."""
+        super().__init__()
+        self._async_http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def async_http(self) -> httpx.AsyncClient:
+        """Keep-alive async client bound to the running event loop."""
+        if self._async_http is None:
+            self._async_http = create_async_client(pool_size=Config.HTTP_POOL_SIZE)
+        return self._async_http
+
+    async def aclose(self):
+        """Close the async connection pool."""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    async def agenerate_tryscape_image(
+        self,
+        user_image_bytes: bytes,
+        user_description: str,
+        clothing_description: str,
+        location_description: str,
+        style: str = "photorealistic",
+        progress: Optional[ProgressCallback] = None,
+        candidates: int = 1
+    ) -> Optional[GenerationResult]:
+        """
+        Coroutine version of generate_tryscape_image.
+
+        Args:
+            user_image_bytes: Prepared PNG bytes of the user's image
+            user_description: Description of the user's appearance
+            clothing_description: Description of the clothing items
+            location_description: Description of the location
+            style: Image style (default: photorealistic)
+            progress: Optional callback for progress stages
+            candidates: Images to request in the one edit call (the edits n parameter)
+
+        Returns:
+            GenerationResult for the first generated image, with the others in
+            its candidates, or None if generation fails
+        """
+        prompt = self._construct_prompt(
+            user_description,
+            clothing_description,
+            location_description,
+            style
+        )
+
+        # Publishing placeholders and cache hits writes files and renders derivatives, so keep it off the loop
+        if getattr(Config, 'DEBUG', False):
+            return await asyncio.to_thread(self._mock_image_result, candidates)
+
+        try:
+            request_key = ResultCache.make_key(user_image_bytes, prompt, candidates)
+
+            cached = await asyncio.to_thread(self._cached_image_result, request_key, candidates)
+            if cached is not None:
+                return cached
+
+            # Concurrent identical requests share a single upstream call
+            loop = asyncio.get_running_loop()
+            shared = self.single_flight.do_async(
+                request_key,
+                lambda: asyncio.run_coroutine_threadsafe(
+                    self._aedit_image(user_image_bytes, prompt, request_key, progress, candidates), loop
+                )
+            )
+            return await asyncio.wrap_future(shared)
+
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            return None
+
+    async def _aedit_image(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        request_key: str,
+        progress: Optional[ProgressCallback] = None,
+        candidates: int = 1
+    ) -> Optional[GenerationResult]:
+        """Coroutine version of _edit_image."""
+        part_paths = []
+        try:
+            url, headers, files, data = self._build_edit_request(image_bytes, prompt, candidates)
+
+            async with self.image_governor.async_slot():
+                notify_progress(progress, 'uploading')
+                with time_stage('edit_call'):
+                    response = await send_with_retry(
+                        self.async_http,
+                        lambda: self.async_http.build_request(
+                            'POST', url, headers=headers, files=files, data=data, timeout=120
+                        ),
+                        max_retries=Config.HTTP_MAX_RETRIES,
+                        backoff_factor=Config.HTTP_BACKOFF_FACTOR,
+                        stream=True
+                    )
+
+            try:
+                print(f"Response status: {response.status_code}")
+                record_upstream_response('edit', response.status_code)
+
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"Error response: {response.text}")
+                    return None
+
+                notify_progress(progress, 'downloading')
+
+                # Decode base64 images straight to disk as the body streams in
+                decoder = StreamingB64JsonDecoder(lambda index: self._open_part_file(part_paths))
+                try:
+                    with time_stage('download'):
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            decoder.feed(chunk)
+                        result = decoder.close()
+                except Exception as e:
+                    print(f"Error saving base64 image: {e}")
+                    return None
+                finally:
+                    for sink in decoder.sinks:
+                        sink.close()
+            finally:
+                await response.aclose()
+
+            # Storage uploads may block, so keep them off the loop
+            return await asyncio.to_thread(self._edit_result, result, part_paths, request_key)
+
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            return None
+
+        finally:
+            # Drop any decoded files that were not kept
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    async def agenerate_tryscape_video(
+        self,
+        user_description: str,
+        clothing_description: str,
+        location_description: str,
+        style: str = "photorealistic",
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ) -> Optional[GenerationResult]:
+        """
+        Coroutine version of generate_tryscape_video.
+
+        The job is created with the async client and then tracked by the
+        shared SORA poller, so waiting costs no thread.
+
+        Args:
+            user_description: Description of the user's appearance
+            clothing_description: Description of the clothing items
+            location_description: Description of the location
+            style: Video style (default: photorealistic)
+            progress: Optional callback for progress stages
+            on_upstream_job: Optional callback given the SORA job id once created
+
+        Returns:
+            GenerationResult for the generated video or None if generation fails
+        """
+        prompt = self._construct_prompt(
+            user_description,
+            clothing_description,
+            location_description,
+            style
+        )
+
+        if getattr(Config, 'DEBUG', False):
+            return self._mock_video_result()
+
+        loop = asyncio.get_running_loop()
+        request_key = self._video_request_key(prompt)
+        shared = self.single_flight.do_async(
+            request_key,
+            lambda: asyncio.run_coroutine_threadsafe(
+                self._astart_video_job(
+                    prompt, progress, lambda job_id: self.single_flight.notify(request_key, job_id)
+                ),
+                loop
+            ),
+            listener=on_upstream_job
+        )
+        return await asyncio.wrap_future(shared)
+
+    async def aresume_tryscape_video(
+        self,
+        sora_job_id: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> Optional[GenerationResult]:
+        """Coroutine version of resume_tryscape_video."""
+        loop = asyncio.get_running_loop()
+        future = Future()
+
+        await self.sora_governor.acquire_async()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.sora_governor.release_async))
+
+        print(f"Resuming video generation job: {sora_job_id}")
+        self._track_video_job(sora_job_id, future, progress)
+        return await asyncio.wrap_future(future)
+
+    async def _astart_video_job(
+        self,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ) -> Optional[GenerationResult]:
+        """Create a SORA job and wait for the poller to finish it."""
+        loop = asyncio.get_running_loop()
+        future = Future()
+
+        # A SORA job holds its concurrency slot until it finishes, whatever the outcome
+        await self.sora_governor.acquire_async()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.sora_governor.release_async))
+
+        try:
+            create_url, payload = self._build_video_job_request(prompt)
+            notify_progress(progress, 'uploading')
+            create_response = await send_with_retry(
+                self.async_http,
+                lambda: self.async_http.build_request(
+                    'POST', create_url, headers=self._sora_headers(), json=payload, timeout=30
+                ),
+                max_retries=Config.HTTP_MAX_RETRIES,
+                backoff_factor=Config.HTTP_BACKOFF_FACTOR
+            )
+
+            job_id = self._parse_video_job_response(create_response.status_code, create_response.text)
+            if not job_id:
+                future.set_result(None)
+                return None
+
+            if on_upstream_job is not None:
+                on_upstream_job(job_id)
+            self._track_video_job(job_id, future, progress, created_at=time.monotonic())
+
+        except Exception as e:
+            print(f"Error generating video: {e}")
+            future.set_result(None)
+            return None
+
+        return await asyncio.wrap_future(future)
+
+    async def astore_remote_media(
+        self,
+        media_url: str,
+        media_type: str,
+        metadata: Optional[dict] = None
+    ) -> Optional[GenerationResult]:
+        """
+        Coroutine version of store_remote_media.
+
+        Args:
+            media_url: URL of the image or video
+            media_type: 'image' or 'video'
+            metadata: Metadata for the result
+
+        Returns:
+            GenerationResult for the stored media, or None if the download fails
+        """
+        save_path = self._staging_path(media_type)
+        with time_stage('download'):
+            downloaded = await self.adownload_image(media_url, save_path)
+        if not downloaded:
+            return None
+        return await asyncio.to_thread(self._publish, save_path, media_type, metadata=metadata)
+
+    async def adownload_image(self, image_url: str, save_path: str) -> bool:
+        """
+        Coroutine version of download_image: streamed, size-capped and atomic.
+
+        Args:
+            image_url: URL of the image or video to download
+            save_path: Local path to save the media
+
+        Returns:
+            True if successful, False otherwise
+        """
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        tmp_path = f"{save_path}.{uuid.uuid4().hex}.part"
+
+        try:
+            written = 0
+            with open(tmp_path, 'wb') as f:
+                async with self.async_http.stream('GET', image_url, timeout=30) as response:
+                    record_upstream_response('download', response.status_code)
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > Config.DOWNLOAD_MAX_BYTES:
+                            print(f"Download exceeds {Config.DOWNLOAD_MAX_BYTES} bytes: {image_url}")
+                            return False
+                        f.write(chunk)
+
+            os.replace(tmp_path, save_path)
+            return True
+
+        except Exception as e:
+            print(f"Error downloading image: {e}")
+            return False
+
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -2,14 +2,82 @@
 TryScape - Azure OpenAI Service
 Handles integration with Azure OpenAI API for image generation.
 """
+import hashlib
+import json
 import os
 import requests
-from typing import Optional
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
 from openai import AzureOpenAI
 from app.config import Config
+from app.http_client import create_session
+from app.image_pool import get_image_pool
+from app.janitor import record_media
+from app.metrics import STAGE_SECONDS, record_upstream_response, time_stage
+from app.rate_limiter import DeploymentGovernor
+from app.result_cache import ResultCache
+from app.single_flight import SingleFlight
+from app.sora_poller import SoraJobPoller
+from app.storage import derivative_key, generated_key, get_storage, shard_path
+from app.utils.b64_stream import StreamingB64JsonDecoder
+from app.utils.image_utils import MaskProvider
 from PIL import Image
 import uuid
-import base64
+from io import BytesIO
+
+
+# Minimum page size when listing SORA jobs to batch status checks
+SORA_LIST_PAGE_SIZE = 50
+
+# Bytes read per chunk when streaming downloads to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Receives progress stages: 'uploading', 'notStarted', 'running', 'downloading'
+ProgressCallback = Callable[[str], None]
+# Receives the id of an upstream job as soon as it is created
+UpstreamCallback = Callable[[str], None]
+
+# Progress stage reported for each pending SORA job status
+SORA_PROGRESS_STAGES = {
+    'queued': 'notStarted',
+    'preprocessing': 'notStarted',
+    'notStarted': 'notStarted',
+    'running': 'running',
+    'processing': 'running',
+}
+
+
+def notify_progress(progress: Optional[ProgressCallback], stage: str):
+    """Report a progress stage if the caller asked for updates."""
+    if progress is not None:
+        progress(stage)
+
+
+def governor_processes() -> int:
+    """Processes that each enforce their own share of the deployment limits."""
+    processes = max(1, Config.SERVER_WORKERS)
+    if Config.JOB_WORKER_TYPE == 'process':
+        processes *= max(1, Config.JOB_MAX_WORKERS)
+    return processes
+
+
+@dataclass
+class GenerationResult:
+    """
+    Outcome of a generation: media in storage, or only hosted remotely.
+    
+    Either storage_key or remote_url is set. local_path is also set when a
+    local copy of the stored media exists.
+    """
+    media_type: str  # 'image' or 'video'
+    local_path: Optional[str] = None
+    remote_url: Optional[str] = None
+    metadata: dict = field(default_factory=dict)
+    storage_key: Optional[str] = None
+    candidates: List['GenerationResult'] = field(default_factory=list)  # further images from the same call
 
 
 class AzureOpenAIService:
@@ -24,27 +92,74 @@ class AzureOpenAIService:
         )
         self.deployment_name = Config.AZURE_OPENAI_DEPLOYMENT_NAME
         self.sora_deployment_name = Config.AZURE_OPENAI_SORA_DEPLOYMENT_NAME
+        # Client-side smoothing of traffic to each deployment's quota, split across processes
+        self.image_governor = DeploymentGovernor(
+            self.deployment_name,
+            requests_per_minute=Config.AZURE_IMAGE_RPM,
+            max_concurrency=Config.AZURE_IMAGE_MAX_CONCURRENCY,
+            processes=governor_processes()
+        )
+        self.sora_governor = DeploymentGovernor(
+            self.sora_deployment_name,
+            requests_per_minute=Config.AZURE_SORA_RPM,
+            max_concurrency=Config.AZURE_SORA_MAX_CONCURRENCY,
+            processes=governor_processes()
+        )
+        # Shared keep-alive pool for all REST calls
+        self.http = create_session(
+            pool_size=Config.HTTP_POOL_SIZE,
+            max_retries=Config.HTTP_MAX_RETRIES,
+            backoff_factor=Config.HTTP_BACKOFF_FACTOR
+        )
+        self.sora_poller = SoraJobPoller(
+            self._fetch_video_job_statuses,
+            initial_interval=Config.SORA_POLL_INITIAL_INTERVAL,
+            max_interval=Config.SORA_POLL_MAX_INTERVAL,
+            timeout=Config.SORA_JOB_TIMEOUT
+        )
+        # SORA create calls run here once admitted, never on a job worker waiting for a slot
+        self.sora_create_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sora-create')
+        self.single_flight = SingleFlight()
+        self.storage = get_storage()
+        self.mask_provider = MaskProvider(max_entries=Config.MASK_CACHE_SIZE)
+        if Config.MASK_PREWARM:
+            self.mask_provider.prewarm()
+        self.result_cache = None
+        if Config.RESULT_CACHE_ENABLED:
+            self.result_cache = ResultCache(
+                os.path.join(Config.GENERATED_FOLDER, 'cache'),
+                max_entries=Config.RESULT_CACHE_MAX_ENTRIES,
+                max_bytes=Config.RESULT_CACHE_MAX_BYTES,
+                ttl=Config.RESULT_CACHE_TTL
+            )
     
     def generate_tryscape_image(
         self,
-        user_image_path: str,
+        user_image_path: Optional[str],
         user_description: str,
         clothing_description: str,
         location_description: str,
-        style: str = "photorealistic"
-    ) -> Optional[str]:
+        style: str = "photorealistic",
+        user_image_bytes: Optional[bytes] = None,
+        progress: Optional[ProgressCallback] = None,
+        candidates: int = 1
+    ) -> Optional[GenerationResult]:
         """
         Generate a photorealistic image using Azure OpenAI gpt-image-1 (image editing).
         
         Args:
-            user_image_path: Path to the user's uploaded image
+            user_image_path: Path to the user's uploaded image (ignored if user_image_bytes is given)
             user_description: Description of the user's appearance
             clothing_description: Description of the clothing items
             location_description: Description of the location
             style: Image style (default: photorealistic)
+            user_image_bytes: Prepared PNG bytes of the user's image
+            progress: Optional callback for progress stages
+            candidates: Images to request in the one edit call (the edits n parameter)
         
         Returns:
-            URL of the generated image or None if generation fails
+            GenerationResult for the first generated image, with the others in
+            its candidates, or None if generation fails
         """
         # Construct detailed prompt for image editing
         prompt = self._construct_prompt(
@@ -55,131 +170,417 @@ class AzureOpenAIService:
         )
         
         # If we're running in debug mode, avoid calling Azure and return
-        # a local placeholder image URL so the rest of the pipeline can be exercised.
+        # a local placeholder image so the rest of the pipeline can be exercised.
         if getattr(Config, 'DEBUG', False):
-            try:
-                os.makedirs(Config.GENERATED_FOLDER, exist_ok=True)
+            return self._mock_image_result(candidates)
+
+        try:
+            if user_image_bytes is None:
+                with open(user_image_path, 'rb') as img_file:
+                    user_image_bytes = img_file.read()
+            request_key = ResultCache.make_key(user_image_bytes, prompt, candidates)
+            
+            # Serve repeated requests for the same image and prompt from the cache
+            cached = self._cached_image_result(request_key, candidates)
+            if cached is not None:
+                return cached
+            
+            # Concurrent identical requests share a single upstream call
+            return self.single_flight.do(
+                request_key, self._edit_image, user_image_bytes, prompt, request_key, progress, candidates
+            )
+        
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def _mock_image_result(self, candidates: int = 1) -> Optional[GenerationResult]:
+        """Save placeholder images so debug runs exercise the pipeline without Azure."""
+        try:
+            results = []
+            for _ in range(candidates):
                 placeholder = Image.new('RGB', (1024, 1024), color=(200, 200, 200))
-                filename = f"mock_generated_{uuid.uuid4().hex}.png"
-                filepath = os.path.join(Config.GENERATED_FOLDER, filename)
+                filepath = self._generated_path(f"mock_generated_{uuid.uuid4().hex}.png")
                 placeholder.save(filepath, format='PNG')
-                host = getattr(Config, 'FLASK_RUN_HOST', '127.0.0.1')
-                port = getattr(Config, 'FLASK_RUN_PORT', 5000)
-                return f"http://{host}:{port}/static/generated/{filename}"
-            except Exception as e:
-                print(f"Error creating mock image: {e}")
+                results.append(self._publish(filepath, 'image', metadata={'mock': True}))
+            results[0].candidates = results[1:]
+            return results[0]
+        except Exception as e:
+            print(f"Error creating mock image: {e}")
+            return None
+    
+    def _cached_image_result(self, request_key: str, candidates: int = 1) -> Optional[GenerationResult]:
+        """
+        Return the cached result for a request key, or None on a miss or with caching off.
+        
+        Multi-candidate requests hit only when every candidate is still cached.
+        """
+        if self.result_cache is None:
+            return None
+        cached_paths = []
+        for index in range(candidates):
+            cached_path = self.result_cache.get(ResultCache.candidate_key(request_key, index))
+            if not cached_path:
                 return None
-
+            cached_paths.append(cached_path)
+        print(f"Result cache hit: {request_key}")
+        results = [
+            self._publish_cached(ResultCache.candidate_key(request_key, index), cached_path, metadata={'cached': True})
+            for index, cached_path in enumerate(cached_paths)
+        ]
+        results[0].candidates = results[1:]
+        return results[0]
+    
+    def _edit_image(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        request_key: str,
+        progress: Optional[ProgressCallback] = None,
+        candidates: int = 1
+    ) -> Optional[GenerationResult]:
+        """
+        Call the gpt-image-1 edits endpoint and save the result.
+        
+        Args:
+            image_bytes: PNG-encoded user image
+            prompt: Constructed edit prompt
+            request_key: Cache key for this image and prompt
+            progress: Optional callback for progress stages
+            candidates: Images to request (the edits n parameter)
+        
+        Returns:
+            GenerationResult for the generated images or None if generation fails
+        """
+        part_paths = []
         try:
-            # Create a mask for the entire image (edit everything)
-            # For image editing API, we need both the original image and a mask
-            mask_path = self._create_full_mask(user_image_path)
-            
-            # Use REST API since OpenAI SDK may not support image editing yet
-            endpoint = Config.AZURE_OPENAI_ENDPOINT.rstrip('/')
-            url = f"{endpoint}/openai/deployments/{self.deployment_name}/images/edits?api-version={Config.AZURE_OPENAI_API_VERSION}"
+            url, headers, files, data = self._build_edit_request(image_bytes, prompt, candidates)
             
-            headers = {
-                'Authorization': f'Bearer {Config.AZURE_OPENAI_API_KEY}'
-            }
+            with self.image_governor.slot():
+                notify_progress(progress, 'uploading')
+                with time_stage('edit_call'):
+                    response = self.http.post(url, headers=headers, files=files, data=data, timeout=120, stream=True)
             
-            # Prepare files for multipart upload
-            with open(user_image_path, 'rb') as img_file, open(mask_path, 'rb') as mask_file:
-                files = {
-                    'image': ('image.png', img_file, 'image/png'),
-                    'mask': ('mask.png', mask_file, 'image/png'),
-                }
-                data = {
-                    'prompt': prompt
-                }
-                
-                print(f"Sending image edit request to gpt-image-1...")
-                print(f"URL: {url}")
-                print(f"Prompt: {prompt[:100]}...")
-                
-                response = requests.post(url, headers=headers, files=files, data=data, timeout=120)
-                
+            with response:
                 print(f"Response status: {response.status_code}")
+                record_upstream_response('edit', response.status_code)
                 
                 if response.status_code != 200:
                     print(f"Error response: {response.text}")
                     return None
                 
-                result = response.json()
-            
-            # Clean up mask file
-            try:
-                os.remove(mask_path)
-            except Exception:
-                pass
-            
-            # Extract the base64 image from response
-            if 'data' in result and len(result['data']) > 0:
-                first_result = result['data'][0]
-                
-                # Handle base64-encoded image
-                if 'b64_json' in first_result:
-                    try:
-                        image_bytes = base64.b64decode(first_result['b64_json'])
-                        os.makedirs(Config.GENERATED_FOLDER, exist_ok=True)
-                        filename = f"generated_{uuid.uuid4().hex}.png"
-                        save_path = os.path.join(Config.GENERATED_FOLDER, filename)
-                        with open(save_path, 'wb') as f:
-                            f.write(image_bytes)
-                        host = getattr(Config, 'FLASK_RUN_HOST', '127.0.0.1')
-                        port = getattr(Config, 'FLASK_RUN_PORT', 5000)
-                        return f"http://{host}:{port}/static/generated/{filename}"
-                    except Exception as e:
-                        print(f"Error saving base64 image: {e}")
-                        return None
+                notify_progress(progress, 'downloading')
                 
-                # Handle URL response
-                if 'url' in first_result:
-                    return first_result['url']
+                # Decode base64 images straight to disk as the body streams in
+                decoder = StreamingB64JsonDecoder(lambda index: self._open_part_file(part_paths))
+                try:
+                    with time_stage('download'):
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            decoder.feed(chunk)
+                        result = decoder.close()
+                except Exception as e:
+                    print(f"Error saving base64 image: {e}")
+                    return None
+                finally:
+                    for sink in decoder.sinks:
+                        sink.close()
             
-            print("Image editing returned no usable image data:", result)
-            return None
-
+            return self._edit_result(result, part_paths, request_key)
+        
         except Exception as e:
             print(f"Error generating image: {e}")
             import traceback
             traceback.print_exc()
             return None
+        
+        finally:
+            # Drop any decoded files that were not kept
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
     
-    def _create_full_mask(self, image_path: str) -> str:
+    def _build_edit_request(self, image_bytes: bytes, prompt: str, candidates: int = 1):
         """
-        Create a full white mask for the image (indicating entire image should be edited).
+        Build the URL, headers and multipart fields of an edits request.
         
         Args:
-            image_path: Path to the source image
+            image_bytes: PNG-encoded user image
+            prompt: Constructed edit prompt
+            candidates: Images to request (the edits n parameter)
+        
+        Returns:
+            Tuple of (url, headers, files, data)
+        """
+        # Create a mask for the entire image (edit everything)
+        # For image editing API, we need both the original image and a mask
+        mask_bytes = self._create_full_mask(image_bytes)
+        
+        # Use REST API since OpenAI SDK may not support image editing yet
+        endpoint = Config.AZURE_OPENAI_ENDPOINT.rstrip('/')
+        url = f"{endpoint}/openai/deployments/{self.deployment_name}/images/edits?api-version={Config.AZURE_OPENAI_API_VERSION}"
+        
+        headers = {
+            'Authorization': f'Bearer {Config.AZURE_OPENAI_API_KEY}'
+        }
+        
+        # Prepare in-memory files for multipart upload
+        files = {
+            'image': ('image.png', image_bytes, 'image/png'),
+            'mask': ('mask.png', mask_bytes, 'image/png'),
+        }
+        data = {
+            'prompt': prompt
+        }
+        if candidates > 1:
+            data['n'] = str(candidates)
+        
+        print(f"Sending image edit request to gpt-image-1...")
+        print(f"URL: {url}")
+        print(f"Prompt: {prompt[:100]}...")
+        
+        return url, headers, files, data
+    
+    @classmethod
+    def _open_part_file(cls, part_paths: List[str]):
+        """Open a new partial output file in GENERATED_FOLDER and record its path."""
+        part_paths.append(cls._generated_path(f"generated_{uuid.uuid4().hex}.png") + '.part')
+        return open(part_paths[-1], 'wb')
+    
+    def _edit_result(self, result: dict, part_paths: List[str], request_key: str) -> Optional[GenerationResult]:
+        """
+        Turn a decoded edits response into a GenerationResult.
+        
+        Every returned image is kept, in response order: the first becomes
+        the result and the rest its candidates.
+        
+        Args:
+            result: Response JSON with b64_json values stripped
+            part_paths: Files holding the decoded b64_json images, in order
+            request_key: Cache key for the request
+        
+        Returns:
+            GenerationResult for the first image or None if there is none
+        """
+        results = []
+        decoded = iter(part_paths)
+        for item in result.get('data') or []:
+            # Handle base64-encoded image, already decoded to disk
+            part_path = next(decoded, None) if 'b64_json' in item else None
+            if part_path is not None:
+                results.append(self._keep_edit_output(part_path, ResultCache.candidate_key(request_key, len(results))))
             
+            # Handle URL response
+            elif 'url' in item:
+                results.append(GenerationResult('image', remote_url=item['url']))
+        
+        if not results:
+            print("Image editing returned no usable image data:", result)
+            return None
+        results[0].candidates = results[1:]
+        return results[0]
+    
+    def _keep_edit_output(self, part_path: str, cache_key: str) -> GenerationResult:
+        """Move a decoded edit output into the result cache (or a staging file) and publish it."""
+        if self.result_cache is not None:
+            return self._publish_cached(cache_key, self.result_cache.put_file(cache_key, part_path))
+        save_path = part_path[:-len('.part')]
+        os.replace(part_path, save_path)
+        return self._publish(save_path, 'image')
+    
+    def _publish_cached(self, cache_key: str, cached_path: str, metadata: Optional[dict] = None) -> GenerationResult:
+        """
+        Publish a result cache entry under a key of its own.
+        
+        The entry and its thumbnails and previews are hard-linked (or copied)
+        to new staging files, so the published media expires with the janitor
+        and evicting the cache entry never removes media a job result points
+        to. Derivatives are rendered into the cache once, on the first publish.
+        
+        Args:
+            cache_key: Key of the entry in the result cache
+            cached_path: File in the result cache
+            metadata: Metadata for the result
+        
         Returns:
-            Path to the generated mask file
+            GenerationResult pointing at the stored image
         """
+        staged_path = self._staging_path('image')
+        self._link_or_copy(cached_path, staged_path)
+        
+        rendered = None
+        if Config.DERIVATIVE_SIZES:
+            staged_stem = os.path.splitext(staged_path)[0]
+            rendered = {}
+            for (name, image_format), derived in self._cached_derivatives(cache_key, cached_path).items():
+                staged_derivative = f"{staged_stem}.{name}.{image_format}"
+                self._link_or_copy(derived, staged_derivative)
+                rendered[(name, image_format)] = staged_derivative
+        return self._publish(staged_path, 'image', metadata=metadata, rendered=rendered)
+    
+    def _cached_derivatives(self, cache_key: str, cached_path: str) -> Dict[tuple, str]:
+        """
+        Thumbnails and previews of a cache entry, rendered beside it if any are missing.
+        
+        Returns:
+            Paths keyed by (name, format); empty if rendering fails
+        """
+        paths = {
+            (name, image_format): ResultCache.derivative_path(cached_path, name, image_format)
+            for name in Config.DERIVATIVE_SIZES
+            for image_format in Config.DERIVATIVE_FORMATS
+        }
+        if all(os.path.exists(path) for path in paths.values()):
+            return paths
+        
+        written = get_image_pool().create_derivatives(
+            cached_path,
+            Config.DERIVATIVE_SIZES,
+            Config.DERIVATIVE_FORMATS,
+            quality=Config.DERIVATIVE_QUALITY
+        )
+        self.result_cache.add_derivatives(cache_key, written.values())
+        return written
+    
+    @staticmethod
+    def _link_or_copy(source_path: str, target_path: str):
+        """Hard-link source_path to target_path, copying when linking is not possible."""
         try:
-            # Open the source image to get dimensions
-            with Image.open(image_path) as img:
-                # Convert to RGBA if not already
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                
-                # Create a white mask (fully transparent in alpha = edit everywhere)
-                # For gpt-image-1, white areas indicate where to edit
-                mask = Image.new('RGBA', img.size, (255, 255, 255, 255))
-                
-                # Save mask
-                mask_filename = f"mask_{uuid.uuid4().hex}.png"
-                mask_path = os.path.join(Config.UPLOAD_FOLDER, mask_filename)
-                mask.save(mask_path, 'PNG')
-                
-                return mask_path
-        except Exception as e:
-            print(f"Error creating mask: {e}")
-            # Return a default mask if creation fails
-            mask = Image.new('RGBA', (1024, 1024), (255, 255, 255, 255))
-            mask_path = os.path.join(Config.UPLOAD_FOLDER, f"mask_default_{uuid.uuid4().hex}.png")
-            mask.save(mask_path, 'PNG')
-            return mask_path
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)  # e.g. the cache is on another filesystem
+    
+    def _publish(
+        self,
+        local_path: str,
+        media_type: str,
+        metadata: Optional[dict] = None,
+        rendered: Optional[Dict[tuple, str]] = None
+    ) -> GenerationResult:
+        """
+        Hand a file staged under GENERATED_FOLDER to media storage.
+        
+        Args:
+            local_path: Staged file, consumed by the call
+            media_type: 'image' or 'video'
+            metadata: Metadata for the result
+            rendered: Derivatives of an image already staged beside it, keyed
+                by (name, format); rendered here when None
+        
+        Returns:
+            GenerationResult pointing at the stored media
+        """
+        key = generated_key(local_path)
+        metadata = dict(metadata or {})
+        
+        staged = {key: local_path}
+        if media_type == 'image' and Config.DERIVATIVE_SIZES:
+            derivatives, missing = self._prepare_derivatives(local_path, key, rendered)
+            staged.update(missing)
+            metadata['derivatives'] = derivatives
+        
+        for staged_key, staged_path in staged.items():
+            size = os.path.getsize(staged_path)
+            self.storage.put_file(staged_key, staged_path)
+            record_media(staged_key, size)
+        
+        return GenerationResult(media_type, local_path=self.storage.local_path(key), metadata=metadata, storage_key=key)
+    
+    def _prepare_derivatives(self, local_path: str, key: str, rendered: Optional[Dict[tuple, str]] = None):
+        """
+        Render the configured thumbnails and previews of a staged image.
+        
+        Args:
+            local_path: Staged image
+            key: Storage key the image is published under
+            rendered: Derivatives already staged, used instead of rendering
+        
+        Returns:
+            Tuple of ({name: {format: key}} for every available derivative,
+            {key: staged path} for newly rendered files still to be stored)
+        """
+        wanted = {
+            (name, image_format): derivative_key(key, name, image_format)
+            for name in Config.DERIVATIVE_SIZES
+            for image_format in Config.DERIVATIVE_FORMATS
+        }
+        
+        written = rendered
+        if written is None:
+            written = get_image_pool().create_derivatives(
+                local_path,
+                Config.DERIVATIVE_SIZES,
+                Config.DERIVATIVE_FORMATS,
+                quality=Config.DERIVATIVE_QUALITY
+            )
+        if not written:
+            return {}, {}
+        missing = {wanted[spec]: path for spec, path in written.items()}
+        
+        derivatives = {}
+        for (name, image_format), derived in wanted.items():
+            derivatives.setdefault(name, {})[image_format] = derived
+        return derivatives, missing
+    
+    def store_remote_media(
+        self,
+        media_url: str,
+        media_type: str,
+        metadata: Optional[dict] = None
+    ) -> Optional[GenerationResult]:
+        """
+        Download remotely hosted media into storage.
+        
+        Args:
+            media_url: URL of the image or video
+            media_type: 'image' or 'video'
+            metadata: Metadata for the result
+        
+        Returns:
+            GenerationResult for the stored media, or None if the download fails
+        """
+        save_path = self._staging_path(media_type)
+        with time_stage('download'):
+            downloaded = self.download_image(media_url, save_path)
+        if not downloaded:
+            return None
+        return self._publish(save_path, media_type, metadata=metadata)
+    
+    @classmethod
+    def _staging_path(cls, media_type: str) -> str:
+        """New local path under GENERATED_FOLDER for media on its way to storage."""
+        file_extension = 'mp4' if media_type == 'video' else 'png'
+        return cls._generated_path(f"generated_{uuid.uuid4().hex}.{file_extension}")
+    
+    @staticmethod
+    def _generated_path(filename: str) -> str:
+        """Sharded local path for filename under GENERATED_FOLDER, with its folders created."""
+        path = os.path.join(Config.GENERATED_FOLDER, *shard_path(filename).split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+    
+    def _create_full_mask(self, image_bytes: bytes) -> bytes:
+        """
+        Get a full white mask for the image (indicating entire image should be edited).
+        
+        Args:
+            image_bytes: Encoded source image
+            
+        Returns:
+            PNG-encoded mask bytes, shared across requests of the same size
+        """
+        with time_stage('mask'):
+            try:
+                # Only the header is read to get dimensions
+                with Image.open(BytesIO(image_bytes)) as img:
+                    size = img.size
+            except Exception as e:
+                print(f"Error reading image size for mask: {e}")
+                # Fall back to a default mask size
+                size = (1024, 1024)
+            
+            return self.mask_provider.get_mask(size)
     
     def _construct_prompt(
         self,
@@ -214,48 +615,125 @@ The image should be high-quality, {style}, and show the person naturally posed i
     
     def download_image(self, image_url: str, save_path: str) -> bool:
         """
-        Download generated image from URL and save to local path.
+        Download generated media from URL and save to local path.
+        
+        The body is streamed in chunks to a temporary file that is renamed
+        into place only when complete, so memory use is bounded regardless of
+        media size. Interrupted transfers resume with Range requests when the
+        server advertises byte-range support.
         
         Args:
-            image_url: URL of the image to download
-            save_path: Local path to save the image
+            image_url: URL of the image or video to download
+            save_path: Local path to save the media
         
         Returns:
             True if successful, False otherwise
         """
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        tmp_path = f"{save_path}.{uuid.uuid4().hex}.part"
+        
         try:
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
+            written = 0
+            attempts = 0
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    headers = {'Range': f'bytes={written}-'} if written else {}
+                    try:
+                        with self.http.get(image_url, headers=headers, stream=True, timeout=30) as response:
+                            record_upstream_response('download', response.status_code)
+                            response.raise_for_status()
+                            
+                            if written and response.status_code != 206:
+                                # Server ignored the range; start over
+                                f.seek(0)
+                                f.truncate()
+                                written = 0
+                            
+                            expected = response.headers.get('Content-Length')
+                            if expected is not None and written + int(expected) > Config.DOWNLOAD_MAX_BYTES:
+                                print(f"Download exceeds {Config.DOWNLOAD_MAX_BYTES} bytes: {image_url}")
+                                return False
+                            resumable = response.headers.get('Accept-Ranges') == 'bytes' or response.status_code == 206
+                            
+                            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                                written += len(chunk)
+                                if written > Config.DOWNLOAD_MAX_BYTES:
+                                    print(f"Download exceeds {Config.DOWNLOAD_MAX_BYTES} bytes: {image_url}")
+                                    return False
+                                f.write(chunk)
+                        break
+                    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                        attempts += 1
+                        if not written or not resumable or attempts > Config.DOWNLOAD_RESUME_ATTEMPTS:
+                            raise
+                        print(f"Download interrupted after {written} bytes, resuming: {e}")
             
+            os.replace(tmp_path, save_path)
             return True
             
         except Exception as e:
             print(f"Error downloading image: {e}")
             return False
+        
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
     def generate_tryscape_video(
         self,
         user_description: str,
         clothing_description: str,
         location_description: str,
-        style: str = "photorealistic"
-    ) -> Optional[str]:
+        style: str = "photorealistic",
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ) -> Optional[GenerationResult]:
         """
-        Generate a video using Azure OpenAI SORA.
+        Generate a video using Azure OpenAI SORA, blocking until it finishes.
         
         Args:
             user_description: Description of the user's appearance
             clothing_description: Description of the clothing items
             location_description: Description of the location
             style: Video style (default: photorealistic)
+            progress: Optional callback for progress stages
+            on_upstream_job: Optional callback given the SORA job id once created
         
         Returns:
-            URL of the generated video or None if generation fails
+            GenerationResult for the generated video or None if generation fails
+        """
+        return self.start_tryscape_video(
+            user_description,
+            clothing_description,
+            location_description,
+            style,
+            progress=progress,
+            on_upstream_job=on_upstream_job
+        ).result()
+    
+    def start_tryscape_video(
+        self,
+        user_description: str,
+        clothing_description: str,
+        location_description: str,
+        style: str = "photorealistic",
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ) -> Future:
+        """
+        Create a SORA video job and hand it to the shared poller.
+        
+        Args:
+            user_description: Description of the user's appearance
+            clothing_description: Description of the clothing items
+            location_description: Description of the location
+            style: Video style (default: photorealistic)
+            progress: Optional callback for progress stages
+            on_upstream_job: Optional callback given the SORA job id once created,
+                so the job can be resumed with resume_tryscape_video
+        
+        Returns:
+            Future resolving to a GenerationResult for the video, or None if generation fails
         """
         # Construct detailed prompt for SORA
         prompt = self._construct_prompt(
@@ -267,112 +745,336 @@ The image should be high-quality, {style}, and show the person naturally posed i
         
         # If we're running in debug mode, return a placeholder
         if getattr(Config, 'DEBUG', False):
-            return "http://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4"
+            future = Future()
+            future.set_result(self._mock_video_result())
+            return future
+        
+        # Concurrent identical requests share a single SORA job, and each records its id
+        request_key = self._video_request_key(prompt)
+        return self.single_flight.do_async(
+            request_key,
+            lambda: self._start_video_job(
+                prompt, progress, lambda job_id: self.single_flight.notify(request_key, job_id)
+            ),
+            listener=on_upstream_job
+        )
+    
+    def resume_tryscape_video(self, sora_job_id: str, progress: Optional[ProgressCallback] = None) -> Future:
+        """
+        Resume waiting for a SORA job created before a restart.
+        
+        The job keeps running upstream while the app is down, so it is
+        polled again instead of being paid for twice.
+        
+        Args:
+            sora_job_id: Id of the existing SORA job
+            progress: Optional callback for progress stages
+        
+        Returns:
+            Future resolving to a GenerationResult for the video, or None if generation fails
+        """
+        future = Future()
+        
+        # The job still occupies a SORA slot upstream; tracking waits for one without holding the caller
+        future.add_done_callback(lambda _: self.sora_governor.release())
+        
+        def track():
+            try:
+                self._track_video_job(sora_job_id, future, progress)
+            except Exception as e:
+                future.set_exception(e)
+        
+        print(f"Resuming video generation job: {sora_job_id}")
+        self.sora_governor.acquire_later(track)
+        return future
+    
+    @staticmethod
+    def _mock_video_result() -> GenerationResult:
+        """Placeholder video used in debug runs."""
+        return GenerationResult(
+            'video',
+            remote_url="http://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4",
+            metadata={'mock': True}
+        )
+    
+    @staticmethod
+    def _video_request_key(prompt: str) -> str:
+        """Key identifying equivalent video requests."""
+        return hashlib.sha256(f"video\0{prompt}".encode('utf-8')).hexdigest()
+    
+    def _start_video_job(
+        self,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ) -> Future:
+        """
+        Create a SORA job for the prompt and register it with the poller.
+        
+        Args:
+            prompt: Constructed video prompt
+            progress: Optional callback for progress stages
+            on_upstream_job: Optional callback given the SORA job id once created
         
+        Returns:
+            Future resolving to a GenerationResult for the video, or None if generation fails
+        """
+        future = Future()
+        
+        # A SORA job holds its concurrency slot until it finishes, whatever the outcome.
+        # The create call is queued for a free slot so the caller returns at once.
+        future.add_done_callback(lambda _: self.sora_governor.release())
+        self.sora_governor.acquire_later(
+            lambda: self.sora_create_executor.submit(
+                self._create_video_job, prompt, future, progress, on_upstream_job
+            )
+        )
+        return future
+    
+    def _create_video_job(
+        self,
+        prompt: str,
+        future: Future,
+        progress: Optional[ProgressCallback] = None,
+        on_upstream_job: Optional[UpstreamCallback] = None
+    ):
+        """
+        Create the SORA job once admitted and resolve future through the poller.
+        
+        Args:
+            prompt: Constructed video prompt
+            future: Future returned by _start_video_job
+            progress: Optional callback for progress stages
+            on_upstream_job: Optional callback given the SORA job id once created
+        """
         try:
-            import time
-            import requests as req
-            
-            # SORA uses REST API with job-based async pattern
-            # Endpoint: POST {endpoint}/openai/v1/video/generations/jobs?api-version=preview
-            headers = {
-                'api-key': Config.AZURE_OPENAI_API_KEY,
-                'Content-Type': 'application/json'
-            }
+            create_url, payload = self._build_video_job_request(prompt)
+            notify_progress(progress, 'uploading')
+            create_response = self.http.post(create_url, headers=self._sora_headers(), json=payload, timeout=30)
             
-            # Create video generation job
-            endpoint = Config.AZURE_OPENAI_ENDPOINT.rstrip('/')
-            create_url = f"{endpoint}/openai/v1/video/generations/jobs?api-version=preview"
-            
-            payload = {
-                "prompt": prompt
-            }
-            
-            print(f"Creating SORA video generation job...")
-            print(f"Endpoint: {create_url}")
-            print(f"Payload: {payload}")
-            
-            create_response = req.post(create_url, headers=headers, json=payload, timeout=30)
-            
-            # Log response for debugging
-            print(f"SORA API Response Status: {create_response.status_code}")
-            print(f"SORA API Response Body: {create_response.text}")
-            
-            if create_response.status_code != 200:
-                print(f"SORA API Error: {create_response.text}")
-                return None
-            
-            job_data = create_response.json()
-            
-            job_id = job_data.get('id')
+            job_id = self._parse_video_job_response(create_response.status_code, create_response.text)
             if not job_id:
-                print(f"No job ID in response: {job_data}")
-                return None
+                future.set_result(None)
+                return
             
-            print(f"Video generation job created: {job_id}")
-            
-            # Poll for job completion (timeout after 5 minutes)
-            max_wait = 300  # 5 minutes
-            poll_interval = 5  # 5 seconds
-            elapsed = 0
-            
-            status_url = f"{endpoint}/openai/v1/video/generations/jobs/{job_id}?api-version=preview"
-            
-            while elapsed < max_wait:
-                time.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                # Check job status
-                status_response = req.get(status_url, headers=headers, timeout=30)
-                status_response.raise_for_status()
-                status_data = status_response.json()
-                
-                status = status_data.get('status')
-                print(f"Video generation status: {status} (elapsed: {elapsed}s)")
-                
-                if status == "succeeded":
-                    # Get the video URL
-                    output = status_data.get('output', {})
-                    video_url = output.get('url') if isinstance(output, dict) else None
-                    
-                    if video_url:
-                        # Download and save the video
-                        try:
-                            os.makedirs(Config.GENERATED_FOLDER, exist_ok=True)
-                            filename = f"generated_{uuid.uuid4().hex}.mp4"
-                            save_path = os.path.join(Config.GENERATED_FOLDER, filename)
-                            
-                            if self.download_image(video_url, save_path):  # Reuse download method
-                                host = getattr(Config, 'FLASK_RUN_HOST', '127.0.0.1')
-                                port = getattr(Config, 'FLASK_RUN_PORT', 5000)
-                                return f"http://{host}:{port}/static/generated/{filename}"
-                            else:
-                                return video_url  # Return Azure URL if download fails
-                        except Exception as e:
-                            print(f"Error downloading video: {e}")
-                            return video_url  # Return Azure URL as fallback
-                    else:
-                        print(f"Video generation succeeded but no URL found in output: {output}")
-                        return None
-                
-                elif status == "failed":
-                    error = status_data.get('error', 'Unknown error')
-                    print(f"Video generation failed: {error}")
-                    return None
-                
-                elif status in ["notStarted", "running"]:
-                    # Continue polling
-                    continue
-                else:
-                    print(f"Unknown status: {status}")
-                    return None
-            
-            print(f"Video generation timed out after {max_wait} seconds")
-            return None
+            if on_upstream_job is not None:
+                on_upstream_job(job_id)
+            self._track_video_job(job_id, future, progress, created_at=time.monotonic())
             
         except Exception as e:
             print(f"Error generating video: {e}")
             import traceback
             traceback.print_exc()
+            if not future.done():
+                future.set_result(None)
+    
+    def _track_video_job(
+        self,
+        job_id: str,
+        future: Future,
+        progress: Optional[ProgressCallback] = None,
+        created_at: Optional[float] = None
+    ):
+        """
+        Hand a created SORA job to the poller, resolving future when it finishes.
+        
+        Args:
+            job_id: SORA job id
+            future: Future to resolve with the GenerationResult or None
+            progress: Optional callback for progress stages
+            created_at: time.monotonic() when the job was created; times the
+                sora_queue and sora_run stages. Omitted for resumed jobs,
+                whose creation time is unknown.
+        """
+        started = {}  # time the job was first seen running
+        
+        def on_status(status: str):
+            stage = SORA_PROGRESS_STAGES.get(status, 'running')
+            if stage == 'running' and created_at is not None and not started:
+                started['at'] = time.monotonic()
+                STAGE_SECONDS.observe(started['at'] - created_at, stage='sora_queue')
+            notify_progress(progress, stage)
+        
+        def on_done(status: str, status_data: dict):
+            if started:
+                STAGE_SECONDS.observe(time.monotonic() - started['at'], stage='sora_run')
+            self._on_video_job_done(job_id, status, status_data, future, progress)
+        
+        def on_error(error: Exception):
+            if not future.done():
+                future.set_exception(error)
+        
+        self.sora_poller.track(job_id, on_done, on_status=on_status, on_error=on_error)
+    
+    def _build_video_job_request(self, prompt: str):
+        """
+        Build the URL and JSON payload that create a SORA job.
+        
+        Args:
+            prompt: Constructed video prompt
+        
+        Returns:
+            Tuple of (url, payload)
+        """
+        # SORA uses REST API with job-based async pattern
+        # Endpoint: POST {endpoint}/openai/v1/video/generations/jobs?api-version=preview
+        create_url = f"{self._sora_jobs_url()}?api-version=preview"
+        
+        payload = {
+            "prompt": prompt
+        }
+        
+        print(f"Creating SORA video generation job...")
+        print(f"Endpoint: {create_url}")
+        print(f"Payload: {payload}")
+        
+        return create_url, payload
+    
+    @staticmethod
+    def _parse_video_job_response(status_code: int, body: str) -> Optional[str]:
+        """
+        Log a SORA create-job response and extract the job id.
+        
+        Args:
+            status_code: HTTP status of the create call
+            body: Response body text
+        
+        Returns:
+            The SORA job id, or None if the job was not created
+        """
+        # Log response for debugging
+        print(f"SORA API Response Status: {status_code}")
+        record_upstream_response('sora_create', status_code)
+        print(f"SORA API Response Body: {body}")
+        
+        if status_code != 200:
+            print(f"SORA API Error: {body}")
             return None
-
+        
+        job_data = json.loads(body)
+        
+        job_id = job_data.get('id')
+        if not job_id:
+            print(f"No job ID in response: {job_data}")
+            return None
+        
+        print(f"Video generation job created: {job_id}")
+        return job_id
+    
+    def _on_video_job_done(
+        self,
+        job_id: str,
+        status: str,
+        status_data: dict,
+        future: Future,
+        progress: Optional[ProgressCallback] = None
+    ):
+        """
+        Completion callback for a tracked SORA job: download the output and resolve the future.
+        
+        Args:
+            job_id: SORA job id
+            status: Final job status reported by the poller
+            status_data: Last status payload for the job
+            future: Future to resolve with the GenerationResult or None
+            progress: Optional callback for progress stages
+        """
+        try:
+            future.set_result(self._resolve_video_job(job_id, status, status_data, progress))
+        except Exception as e:
+            print(f"Error downloading video: {e}")
+            future.set_result(None)
+    
+    def _resolve_video_job(
+        self,
+        job_id: str,
+        status: str,
+        status_data: dict,
+        progress: Optional[ProgressCallback] = None
+    ) -> Optional[GenerationResult]:
+        """Turn a finished SORA job into a local (or, failing that, Azure-hosted) video."""
+        print(f"Video generation job {job_id} finished with status: {status}")
+        
+        if status == "failed":
+            error = status_data.get('error', 'Unknown error')
+            print(f"Video generation failed: {error}")
+            return None
+        
+        if status == "timeout":
+            print(f"Video generation timed out after {self.sora_poller.timeout} seconds")
+            return None
+        
+        if status != "succeeded":
+            print(f"Unknown status: {status}")
+            return None
+        
+        # Get the video URL
+        output = status_data.get('output', {})
+        video_url = output.get('url') if isinstance(output, dict) else None
+        
+        if not video_url:
+            print(f"Video generation succeeded but no URL found in output: {output}")
+            return None
+        
+        # Download and store the video
+        notify_progress(progress, 'downloading')
+        stored = self.store_remote_media(video_url, 'video', metadata={'sora_job_id': job_id})
+        if stored is not None:
+            return stored
+        # Return Azure URL if download fails
+        return GenerationResult('video', remote_url=video_url, metadata={'sora_job_id': job_id})
+    
+    def _fetch_video_job_statuses(self, job_ids: List[str]) -> Dict[str, dict]:
+        """
+        Fetch the status of several SORA jobs, batching through the list endpoint.
+        
+        Args:
+            job_ids: SORA job ids to check
+        
+        Returns:
+            Mapping of job id to status payload for the jobs that could be checked
+        """
+        headers = self._sora_headers()
+        wanted = set(job_ids)
+        statuses = {}
+        
+        if len(wanted) > 1:
+            try:
+                list_url = f"{self._sora_jobs_url()}?api-version=preview&limit={max(len(wanted), SORA_LIST_PAGE_SIZE)}"
+                response = self.http.get(list_url, headers=headers, timeout=30)
+                record_upstream_response('sora_status', response.status_code)
+                response.raise_for_status()
+                for job in response.json().get('data', []):
+                    if job.get('id') in wanted:
+                        statuses[job['id']] = job
+            except Exception as e:
+                print(f"Error listing SORA jobs, falling back to per-job checks: {e}")
+        
+        # Anything the list did not cover is checked individually
+        for job_id in wanted - statuses.keys():
+            try:
+                response = self.http.get(
+                    f"{self._sora_jobs_url()}/{job_id}?api-version=preview",
+                    headers=headers,
+                    timeout=30
+                )
+                record_upstream_response('sora_status', response.status_code)
+                response.raise_for_status()
+                statuses[job_id] = response.json()
+            except Exception as e:
+                print(f"Error checking SORA job {job_id}: {e}")
+        
+        return statuses
+    
+    def _sora_jobs_url(self) -> str:
+        """Base URL of the SORA video generation jobs collection."""
+        endpoint = Config.AZURE_OPENAI_ENDPOINT.rstrip('/')
+        return f"{endpoint}/openai/v1/video/generations/jobs"
+    
+    @staticmethod
+    def _sora_headers() -> dict:
+        """Request headers for the SORA REST API."""
+        return {
+            'api-key': Config.AZURE_OPENAI_API_KEY,
+            'Content-Type': 'application/json'
+        }
@@ -9,6 +9,32 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _get_int(name: str, default: int) -> int:
+    """Read an integer environment variable, falling back to default."""
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _get_sizes(name: str, default: str) -> dict:
+    """Read a 'name:pixels,...' environment variable into {name: pixels}."""
+    sizes = {}
+    for item in os.getenv(name, default).split(','):
+        label, _, pixels = item.strip().partition(':')
+        if label and pixels.isdigit():
+            sizes[label] = int(pixels)
+    return sizes
+
+
+def _get_float(name: str, default: float) -> float:
+    """Read a float environment variable, falling back to default."""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
 class Config:
     """Application configuration class."""
     
@@ -22,6 +48,26 @@ class Config:
     # Feature Flags
     ENABLE_SORA = os.getenv('ENABLE_SORA', 'false').lower() == 'true'
     
+    # Client-side Rate Limits per Deployment (0 disables a limit), divided among worker processes
+    AZURE_IMAGE_RPM = _get_float('AZURE_IMAGE_RPM', 30)  # requests per minute
+    AZURE_IMAGE_MAX_CONCURRENCY = _get_int('AZURE_IMAGE_MAX_CONCURRENCY', 4)
+    AZURE_SORA_RPM = _get_float('AZURE_SORA_RPM', 10)
+    AZURE_SORA_MAX_CONCURRENCY = _get_int('AZURE_SORA_MAX_CONCURRENCY', 2)  # running SORA jobs
+    
+    # Azure HTTP Connection Pool
+    HTTP_POOL_SIZE = _get_int('HTTP_POOL_SIZE', 20)
+    HTTP_MAX_RETRIES = _get_int('HTTP_MAX_RETRIES', 3)  # on 429/503 and connection errors
+    HTTP_BACKOFF_FACTOR = _get_float('HTTP_BACKOFF_FACTOR', 1.0)  # seconds
+    
+    # Media Downloads
+    DOWNLOAD_MAX_BYTES = _get_int('DOWNLOAD_MAX_BYTES', 512 * 1024 * 1024)
+    DOWNLOAD_RESUME_ATTEMPTS = _get_int('DOWNLOAD_RESUME_ATTEMPTS', 3)
+    
+    # SORA Job Polling
+    SORA_POLL_INITIAL_INTERVAL = _get_int('SORA_POLL_INITIAL_INTERVAL', 2)  # seconds
+    SORA_POLL_MAX_INTERVAL = _get_int('SORA_POLL_MAX_INTERVAL', 15)  # seconds
+    SORA_JOB_TIMEOUT = _get_int('SORA_JOB_TIMEOUT', 300)  # seconds
+    
     # Flask Configuration
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
     DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
@@ -32,11 +78,82 @@ class Config:
     except ValueError:
         FLASK_RUN_PORT = 5000
     
+    # Production Server (python run.py serve)
+    SERVER_WORKERS = _get_int('SERVER_WORKERS', 1)
+    SERVER_THREADS = _get_int('SERVER_THREADS', 16)
+    SERVER_WORKER_CLASS = os.getenv('SERVER_WORKER_CLASS', 'gthread')
+    # Longer than the 120s edit call so a busy worker is never killed mid-request
+    SERVER_TIMEOUT = _get_int('SERVER_TIMEOUT', 150)
+    SERVER_GRACEFUL_TIMEOUT = _get_int('SERVER_GRACEFUL_TIMEOUT', 130)
+    SERVER_KEEPALIVE = _get_int('SERVER_KEEPALIVE', 5)
+    SERVER_PRELOAD = os.getenv('SERVER_PRELOAD', 'true').lower() == 'true'
+    
     # Upload Configuration
     UPLOAD_FOLDER = 'app/static/uploads'
     GENERATED_FOLDER = 'app/static/generated'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    # Uploads are processed in memory; set to keep a copy in media storage
+    PERSIST_UPLOADS = os.getenv('PERSIST_UPLOADS', 'false').lower() == 'true'
+    
+    # Media Storage ('local' or 's3'); generated files are staged in GENERATED_FOLDER first
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+    STORAGE_LOCAL_ROOT = 'app/static'  # holds UPLOAD_FOLDER and GENERATED_FOLDER
+    STORAGE_LOCAL_URL = os.getenv('STORAGE_LOCAL_URL', '/media')
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.getenv('S3_REGION')
+    S3_URL_EXPIRY = _get_int('S3_URL_EXPIRY', 3600)  # seconds presigned URLs stay valid
+    S3_PUBLIC_URL = os.getenv('S3_PUBLIC_URL')  # CDN or public bucket URL; skips presigning
+    
+    # Image Derivatives (downscaled copies stored beside each generated image)
+    DERIVATIVE_SIZES = _get_sizes('DERIVATIVE_SIZES', 'thumb:256,preview:768')  # empty to disable
+    DERIVATIVE_FORMATS = [f.strip().lower() for f in os.getenv('DERIVATIVE_FORMATS', 'webp').split(',') if f.strip()]
+    DERIVATIVE_QUALITY = _get_int('DERIVATIVE_QUALITY', 80)
+    
+    # Media Serving (/media endpoint for local storage)
+    MEDIA_MAX_AGE = _get_int('MEDIA_MAX_AGE', 31536000)  # stored media never changes under a key
+    MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '').lower()  # '', 'x-sendfile' or 'x-accel-redirect'
+    MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media')  # nginx internal location
+    
+    # Media Expiry (background janitor)
+    MEDIA_TTL = _get_int('MEDIA_TTL', 86400)  # seconds uploads and generated media are kept
+    JANITOR_ENABLED = os.getenv('JANITOR_ENABLED', 'true').lower() == 'true'
+    JANITOR_INDEX_PATH = os.getenv('JANITOR_INDEX_PATH', 'data/media_index.db')
+    JANITOR_INTERVAL = _get_int('JANITOR_INTERVAL', 300)  # seconds between cleanup passes
+    JANITOR_MAX_BYTES = _get_int('JANITOR_MAX_BYTES', 0)  # disk quota for media (0 for none)
+    JANITOR_BATCH_SIZE = _get_int('JANITOR_BATCH_SIZE', 500)
+    
+    # Upload Normalization
+    IMAGE_FAST_RESAMPLE_RATIO = _get_float('IMAGE_FAST_RESAMPLE_RATIO', 2.0)  # bilinear above this downscale ratio
+    IMAGE_POOL_WORKERS = _get_int('IMAGE_POOL_WORKERS', 2)  # processes for image work (0 to run inline)
+    IMAGE_POOL_INLINE_MAX_BYTES = _get_int('IMAGE_POOL_INLINE_MAX_BYTES', 512 * 1024)  # smaller inputs stay inline
+    
+    # Edit Mask Cache (masks depend only on image size)
+    MASK_CACHE_SIZE = _get_int('MASK_CACHE_SIZE', 64)
+    MASK_PREWARM = os.getenv('MASK_PREWARM', 'true').lower() == 'true'
+    
+    # Background Job Configuration
+    JOB_WORKER_TYPE = os.getenv('JOB_WORKER_TYPE', 'thread').lower()  # 'thread', 'process' or 'async'
+    JOB_MAX_WORKERS = _get_int('JOB_MAX_WORKERS', 4)  # concurrent coroutines in 'async' mode
+    JOB_MAX_QUEUE = _get_int('JOB_MAX_QUEUE', 32)  # jobs waiting beyond the busy workers
+    BATCH_MAX_VARIANTS = _get_int('BATCH_MAX_VARIANTS', 8)  # jobs per /generate/batch request
+    IMAGE_MAX_CANDIDATES = _get_int('IMAGE_MAX_CANDIDATES', 4)  # images per edit call (the edits n parameter)
+    JOB_RESULT_TTL = _get_int('JOB_RESULT_TTL', 3600)  # seconds finished jobs stay queryable
+    JOB_EVENTS_KEEPALIVE = _get_int('JOB_EVENTS_KEEPALIVE', 15)  # seconds between SSE keepalive comments
+    JOB_STORE_BACKEND = os.getenv('JOB_STORE_BACKEND', 'sqlite').lower()  # 'sqlite', 'memory' or 'none'
+    JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'data/jobs.db')
+    
+    # Metrics (/metrics in the Prometheus text format)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DISK_USAGE_TTL = _get_int('METRICS_DISK_USAGE_TTL', 60)  # seconds between GENERATED_FOLDER scans without the janitor
+    
+    # Result Cache Configuration (identical image + prompt requests)
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_MAX_ENTRIES = _get_int('RESULT_CACHE_MAX_ENTRIES', 500)
+    RESULT_CACHE_MAX_BYTES = _get_int('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    RESULT_CACHE_TTL = _get_int('RESULT_CACHE_TTL', 86400)  # seconds
     
     @staticmethod
     def validate():
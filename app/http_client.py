@@ -0,0 +1,144 @@
+"""
+TryScape - HTTP Client
+Shared, pooled HTTP sessions with retry/backoff for Azure calls.
+"""
+import asyncio
+import random
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.metrics import UPSTREAM_RETRIES
+
+
+# Statuses that mean the request was throttled or not processed and is safe to retry
+RETRY_STATUSES = (429, 503)
+
+
+class CountingRetry(Retry):
+    """Retry policy that counts each retry it allows in UPSTREAM_RETRIES."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        UPSTREAM_RETRIES.inc(reason=str(response.status) if response is not None else 'error')
+        return retry
+
+
+def create_session(
+    pool_size: int = 20,
+    max_retries: int = 3,
+    backoff_factor: float = 1.0,
+    backoff_max: float = 60.0
+) -> requests.Session:
+    """
+    Create a keep-alive session with a bounded connection pool.
+
+    Throttled (429) and unavailable (503) responses are retried for every
+    method, honoring Retry-After when present and otherwise backing off
+    exponentially with jitter. The final response is returned rather than
+    raised so callers keep their existing status handling.
+
+    Args:
+        pool_size: Connections kept alive per host
+        max_retries: Retries per request on throttling, connection errors or 503
+        backoff_factor: Base delay in seconds for exponential backoff
+        backoff_max: Upper bound on a single backoff delay
+
+    Returns:
+        Configured requests.Session, safe to share across threads
+    """
+    retry = CountingRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,  # a timed out edit may have been billed; don't resend it
+        status=max_retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # 429/503 mean the request was not processed, so POST is safe too
+        backoff_factor=backoff_factor,
+        backoff_max=backoff_max,
+        backoff_jitter=backoff_factor,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def retry_delay(attempt: int, retry_after: str = None, backoff_factor: float = 1.0, backoff_max: float = 60.0) -> float:
+    """
+    Seconds to wait before retry number attempt (1-based), matching create_session.
+
+    Args:
+        attempt: Retry number, starting at 1
+        retry_after: Retry-After header value in seconds, if the server sent one
+        backoff_factor: Base delay in seconds for exponential backoff
+        backoff_max: Upper bound on the backoff delay
+
+    Returns:
+        Delay in seconds
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    delay = min(backoff_max, backoff_factor * (2 ** (attempt - 1)))
+    return delay + random.uniform(0, backoff_factor)
+
+
+def create_async_client(pool_size: int = 20) -> httpx.AsyncClient:
+    """
+    Create a keep-alive async client with a bounded connection pool.
+
+    Connection errors are retried by the transport; use send_with_retry for
+    429/503 handling.
+
+    Args:
+        pool_size: Maximum open connections
+
+    Returns:
+        httpx.AsyncClient; create and use it on a single event loop
+    """
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(limits=limits, retries=2))
+
+
+async def send_with_retry(
+    client: httpx.AsyncClient,
+    build_request,
+    max_retries: int = 3,
+    backoff_factor: float = 1.0,
+    backoff_max: float = 60.0,
+    stream: bool = False
+) -> httpx.Response:
+    """
+    Send a request, retrying throttled (429) and unavailable (503) responses.
+
+    Args:
+        client: Async client to send with
+        build_request: Callable returning a fresh httpx.Request for each attempt
+        max_retries: Retries on 429/503
+        backoff_factor: Base delay in seconds for exponential backoff
+        backoff_max: Upper bound on a single backoff delay
+        stream: Leave the body unread; the caller must close the response
+
+    Returns:
+        The final response, which may still be a 429/503 once retries run out
+    """
+    attempt = 0
+    while True:
+        response = await client.send(build_request(), stream=stream)
+        if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+            return response
+        attempt += 1
+        UPSTREAM_RETRIES.inc(reason=str(response.status_code))
+        delay = retry_delay(attempt, response.headers.get('Retry-After'), backoff_factor, backoff_max)
+        await response.aclose()
+        print(f"Azure returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt}/{max_retries})")
+        await asyncio.sleep(delay)
@@ -0,0 +1,156 @@
+"""
+TryScape - Image Worker Pool
+Runs CPU-heavy Pillow work in worker processes so it does not compete with request threads for the GIL.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from app.config import Config
+from app.utils.image_utils import FAST_RESAMPLE_RATIO, ImageProcessor
+
+
+def _prepare_shared(name: str, size: int, max_size: int, fast_resample_ratio: float) -> Optional[bytes]:
+    """Worker side of ImagePool.prepare_image: read the upload from shared memory."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+    return ImageProcessor.prepare_image(data, max_size, fast_resample_ratio)
+
+
+class ImagePool:
+    """
+    Process pool for upload normalization and derivative rendering.
+
+    Uploads reach the workers through a shared memory block instead of
+    being pickled down a pipe, and derivatives are rendered from the file
+    on disk. Inputs smaller than inline_max_bytes, and all work in
+    processes that are themselves workers (process job mode), run inline,
+    where the round trip would cost more than it saves.
+
+    The executor is created on first use in each process, so an app built
+    before a pre-forking server forks its workers gets one pool per worker.
+    """
+
+    def __init__(self, max_workers: int = 2, inline_max_bytes: int = 512 * 1024):
+        """
+        Args:
+            max_workers: Worker processes (0 runs everything inline)
+            inline_max_bytes: Inputs below this size are processed inline
+        """
+        self.max_workers = max_workers
+        self.inline_max_bytes = inline_max_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def prepare_image(
+        self,
+        data: bytes,
+        max_size: int = 1024,
+        fast_resample_ratio: float = FAST_RESAMPLE_RATIO
+    ) -> Optional[bytes]:
+        """
+        ImageProcessor.prepare_image, in a worker for large uploads.
+
+        Returns:
+            PNG-encoded bytes, or None if the data is not a valid image
+        """
+        def inline():
+            return ImageProcessor.prepare_image(data, max_size, fast_resample_ratio)
+
+        if not self._offload(len(data)):
+            return inline()
+
+        block = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            block.buf[:len(data)] = data
+            return self._run(inline, _prepare_shared, block.name, len(data), max_size, fast_resample_ratio)
+        finally:
+            block.close()
+            block.unlink()
+
+    def create_derivatives(
+        self,
+        source_path: str,
+        sizes: Dict[str, int],
+        formats: Iterable[str] = ('webp',),
+        quality: int = 80
+    ) -> Dict[Tuple[str, str], str]:
+        """
+        ImageProcessor.create_derivatives, in a worker for large sources.
+
+        Returns:
+            Paths of the written files keyed by (name, format); empty on error
+        """
+        formats = tuple(formats)
+
+        def inline():
+            return ImageProcessor.create_derivatives(source_path, sizes, formats, quality)
+
+        try:
+            size = os.path.getsize(source_path)
+        except OSError:
+            size = 0
+        if not self._offload(size):
+            return inline()
+        return self._run(inline, ImageProcessor.create_derivatives, source_path, sizes, formats, quality)
+
+    def shutdown(self, wait: bool = True):
+        """Stop this process's workers; the pool restarts on next use."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait)
+
+    def _offload(self, size: int) -> bool:
+        return (
+            self.max_workers > 0
+            and size >= self.inline_max_bytes
+            and multiprocessing.parent_process() is None
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Workers only need Pillow, so spawn them clean rather than forking a threaded server
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, inline: Callable, fn: Callable, *args):
+        """Run fn(*args) in a worker, or inline if the pool has died."""
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            print('Image worker pool broke; restarting it and processing inline')
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return inline()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool() -> ImagePool:
+    """Return the process-wide image worker pool configured by IMAGE_POOL_* settings."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImagePool(
+                max_workers=Config.IMAGE_POOL_WORKERS,
+                inline_max_bytes=Config.IMAGE_POOL_INLINE_MAX_BYTES
+            )
+        return _pool
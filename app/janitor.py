@@ -0,0 +1,426 @@
+"""
+TryScape - Media Janitor
+Expires uploads and generated media from an index written at creation time.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from app.config import Config
+from app.job_store import process_owner
+from app.storage import GENERATED_PREFIX, UPLOAD_PREFIX, LocalStorage, Storage
+
+
+class ExpiryIndex:
+    """
+    SQLite table of stored media keys, their sizes and expiry times.
+
+    Files are recorded when they are written, so finding what to delete is
+    an indexed range query rather than a directory scan. The database can be
+    shared by every worker process on the host; a lease row picks the one
+    process that runs cleanup passes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if needed) the index database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.created = not os.path.exists(path)
+        with self._lock:
+            self._connection().executescript(
+                """
+                CREATE TABLE IF NOT EXISTS media (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS media_expires_at ON media (expires_at);
+                CREATE INDEX IF NOT EXISTS media_created_at ON media (created_at);
+                CREATE TABLE IF NOT EXISTS lease (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection for this process, reopened after a fork. Caller holds the lock."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    def add(self, key: str, size: int, ttl: float, created_at: Optional[float] = None):
+        """
+        Record a stored file.
+
+        Args:
+            key: Storage key
+            size: Size in bytes
+            ttl: Seconds until the file expires
+            created_at: Creation time (default: now)
+        """
+        self.add_many([(key, size, created_at or time.time())], ttl)
+
+    def add_many(self, files: Iterable[Tuple[str, int, float]], ttl: float):
+        """Record (key, size, created_at) tuples in one transaction."""
+        rows = [(key, size, created_at, created_at + ttl) for key, size, created_at in files]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)', rows)
+
+    def expired(self, now: float, limit: int) -> List[Tuple[str, int]]:
+        """Up to limit (key, size) pairs whose expiry has passed, earliest first."""
+        with self._lock:
+            return self._connection().execute(
+                'SELECT key, size FROM media WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+                (now, limit)
+            ).fetchall()
+
+    def oldest(self, limit: int) -> List[Tuple[str, int]]:
+        """Up to limit (key, size) pairs, oldest first."""
+        with self._lock:
+            return self._connection().execute(
+                'SELECT key, size FROM media ORDER BY created_at LIMIT ?', (limit,)
+            ).fetchall()
+
+    def remove(self, keys: List[str]):
+        """Forget the given keys."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany('DELETE FROM media WHERE key = ?', [(key,) for key in keys])
+
+    def rename_many(self, renames: Iterable[Tuple[str, str]]):
+        """Re-key (old_key, new_key) pairs in one transaction, keeping sizes and expiry."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany('UPDATE media SET key = ? WHERE key = ?', [(new, old) for old, new in renames])
+
+    def claim_lease(self, owner: str, ttl: float, now: Optional[float] = None) -> bool:
+        """
+        Take or renew the cleanup lease.
+
+        The lease passes to another owner only once it has run out, so a
+        process that exits hands cleanup over after at most ttl seconds.
+
+        Args:
+            owner: Tag of the claiming process
+            ttl: Seconds the lease lasts unless renewed
+            now: Current time (default: now)
+
+        Returns:
+            True if owner holds the lease
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    'INSERT INTO lease VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE '
+                    'SET owner = excluded.owner, expires_at = excluded.expires_at '
+                    'WHERE lease.owner = excluded.owner OR lease.expires_at <= ?',
+                    ('janitor', owner, now + ttl, now)
+                )
+                row = conn.execute('SELECT owner FROM lease WHERE name = ?', ('janitor',)).fetchone()
+            return row[0] == owner
+
+    def total_bytes(self) -> int:
+        """Total size of all indexed files."""
+        with self._lock:
+            return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+
+    def usage(self, key_prefix: str) -> Tuple[int, int]:
+        """
+        Total bytes and number of indexed files under a key prefix such as 'generated'.
+
+        Returns:
+            Tuple of (bytes, files)
+        """
+        with self._lock:
+            return tuple(self._connection().execute(
+                'SELECT COALESCE(SUM(size), 0), COUNT(*) FROM media WHERE key >= ? AND key < ?',
+                (f"{key_prefix}/", f"{key_prefix}0")  # '0' sorts right after '/'
+            ).fetchone())
+
+    def count(self) -> int:
+        """Number of indexed files."""
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def backfill(self, folder: str, key_prefix: str, ttl: float, skip: Tuple[str, ...] = ()) -> int:
+        """
+        Index files that were written before the index existed.
+
+        This is a one-off full scan; run it only when the index is new.
+
+        Args:
+            folder: Local folder to walk
+            key_prefix: Storage key prefix for files in folder
+            ttl: Seconds files live after their modification time
+            skip: Subfolders (relative to folder) to leave out
+
+        Returns:
+            Number of files indexed
+        """
+        files = []
+        for dirpath, dirnames, filenames in os.walk(folder):
+            relative_dir = os.path.relpath(dirpath, folder)
+            dirnames[:] = [d for d in dirnames if os.path.normpath(os.path.join(relative_dir, d)) not in skip]
+            for filename in filenames:
+                if filename.startswith('.') or filename.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                key = '/'.join([key_prefix, os.path.relpath(path, folder).replace(os.sep, '/')])
+                files.append((key, stat.st_size, stat.st_mtime))
+        self.add_many(files, ttl)
+        return len(files)
+
+
+class MediaJanitor:
+    """
+    Background thread that deletes expired media and enforces a disk quota.
+
+    Deletes go through the storage backend in batches, oldest first, and
+    each pass reports what it reclaimed. Every serving process may start a
+    janitor, but only the holder of the index's lease runs passes.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        index: ExpiryIndex,
+        interval: float = 300,
+        max_bytes: int = 0,
+        batch_size: int = 500,
+        backfill: Iterable[Tuple[str, str, Tuple[str, ...]]] = (),
+        backfill_ttl: float = 86400
+    ):
+        """
+        Args:
+            storage: Backend holding the indexed media
+            index: Expiry index of that media
+            interval: Seconds between cleanup passes
+            max_bytes: Total size budget for indexed media (0 for no quota)
+            batch_size: Files deleted per batch
+            backfill: (folder, key_prefix, skip) folders to index before the first pass
+            backfill_ttl: Lifetime given to backfilled files
+        """
+        self.storage = storage
+        self.index = index
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.backfill = list(backfill)
+        self.backfill_ttl = backfill_ttl
+        self.runs = 0
+        self.files_reclaimed = 0
+        self.bytes_reclaimed = 0
+        self.last_run = None
+        self.owner = process_owner()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the cleanup thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='media-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the cleanup thread to exit after its current batch."""
+        self._stop.set()
+
+    def run_once(self) -> dict:
+        """
+        Run one cleanup pass.
+
+        Returns:
+            Files and bytes reclaimed by expiry and by the quota
+        """
+        expired_files, expired_bytes = self._reclaim(lambda: self.index.expired(time.time(), self.batch_size))
+
+        quota_files = quota_bytes = 0
+        if self.max_bytes > 0:
+            excess = self.index.total_bytes() - self.max_bytes
+            if excess > 0:
+                def over_quota():
+                    nonlocal excess
+                    if excess <= 0:
+                        return []
+                    batch = []
+                    for key, size in self.index.oldest(self.batch_size):
+                        batch.append((key, size))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    return batch
+                quota_files, quota_bytes = self._reclaim(over_quota)
+
+        report = {
+            'expired_files': expired_files,
+            'expired_bytes': expired_bytes,
+            'quota_files': quota_files,
+            'quota_bytes': quota_bytes,
+        }
+        with self._lock:
+            self.runs += 1
+            self.files_reclaimed += expired_files + quota_files
+            self.bytes_reclaimed += expired_bytes + quota_bytes
+            self.last_run = report
+        if expired_files or quota_files:
+            print(
+                f"Janitor reclaimed {expired_files + quota_files} files "
+                f"({(expired_bytes + quota_bytes) / 1024 / 1024:.1f} MB): "
+                f"{expired_files} expired, {quota_files} over quota"
+            )
+        return report
+
+    def stats(self) -> dict:
+        """Cumulative cleanup counters and the current index size."""
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'files_reclaimed': self.files_reclaimed,
+                'bytes_reclaimed': self.bytes_reclaimed,
+                'last_run': self.last_run,
+                'indexed_files': self.index.count(),
+                'indexed_bytes': self.index.total_bytes(),
+            }
+
+    def _reclaim(self, next_batch) -> Tuple[int, int]:
+        """Delete batches until next_batch returns nothing. Returns (files, bytes)."""
+        files = reclaimed = 0
+        while not self._stop.is_set():
+            batch = next_batch()
+            if not batch:
+                break
+            deleted = []
+            for key, size in batch:
+                try:
+                    self.storage.delete(key)
+                except Exception as e:
+                    print(f"Error removing {key}: {e}")
+                    continue
+                deleted.append(key)
+                reclaimed += size
+            self.index.remove(deleted)
+            files += len(deleted)
+            if len(deleted) < len(batch):
+                break  # storage errors; retry on the next pass
+        return files, reclaimed
+
+    def _run(self):
+        # Long enough to survive a slow pass, short enough to hand over after a crash
+        lease_ttl = 2 * self.interval + 60
+        while not self._stop.is_set():
+            try:
+                if self.index.claim_lease(self.owner, lease_ttl):
+                    self._backfill()
+                    self.run_once()
+                else:
+                    self.backfill = []  # the lease holder indexes existing files
+            except Exception as e:
+                print(f"Error in media janitor: {e}")
+            self._stop.wait(self.interval)
+
+    def _backfill(self):
+        for folder, key_prefix, skip in self.backfill:
+            try:
+                indexed = self.index.backfill(folder, key_prefix, self.backfill_ttl, skip)
+                print(f"Janitor indexed {indexed} existing files in {folder}")
+            except Exception as e:
+                print(f"Error indexing {folder}: {e}")
+        self.backfill = []
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_expiry_index() -> Optional[ExpiryIndex]:
+    """Return the process-wide expiry index, or None when the janitor is disabled."""
+    global _index
+    if not Config.JANITOR_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = ExpiryIndex(Config.JANITOR_INDEX_PATH)
+        return _index
+
+
+def record_media(key: str, size: int):
+    """Record newly stored media so the janitor can expire it."""
+    index = get_expiry_index()
+    if index is not None:
+        index.add(key, size, Config.MEDIA_TTL)
+
+
+def forget_media(key: str):
+    """Drop media deleted before it expired from the janitor's index."""
+    index = get_expiry_index()
+    if index is not None:
+        index.remove([key])
+
+
+def start_janitor(storage: Storage) -> Optional[MediaJanitor]:
+    """
+    Start the background janitor configured by JANITOR_* settings.
+
+    Call this in each serving process after it has forked, never in a
+    preloading master: a thread does not survive the fork but the locks it
+    holds do. When the index is new and media is on local disk, files
+    already there are indexed once so they expire too.
+
+    Returns:
+        The running janitor, or None when disabled
+    """
+    index = get_expiry_index()
+    if index is None:
+        return None
+
+    backfill = []
+    if index.created and isinstance(storage, LocalStorage):
+        backfill = [
+            (Config.GENERATED_FOLDER, GENERATED_PREFIX, ('cache',)),  # the result cache manages its own files
+            (Config.UPLOAD_FOLDER, UPLOAD_PREFIX, ()),
+        ]
+
+    janitor = MediaJanitor(
+        storage,
+        index,
+        interval=Config.JANITOR_INTERVAL,
+        max_bytes=Config.JANITOR_MAX_BYTES,
+        batch_size=Config.JANITOR_BATCH_SIZE,
+        backfill=backfill,
+        backfill_ttl=Config.MEDIA_TTL
+    )
+    janitor.start()
+    return janitor
@@ -0,0 +1,266 @@
+"""
+TryScape - Durable Job Store
+Persists generation jobs so they can be looked up from any worker and resumed after a restart.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app.config import Config
+
+
+# Job fields kept in a store record; 'request' and 'result' are JSON-serializable dicts
+RECORD_FIELDS = (
+    'id', 'kind', 'status', 'stage', 'inputs_hash', 'upstream_id', 'request',
+    'result', 'error', 'owner', 'created_at', 'updated_at', 'expires_at',
+)
+
+
+def process_owner() -> str:
+    """Owner tag for jobs run by this process: '<host>:<pid>'."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """
+    Whether the process that owns a job is still running.
+
+    Only processes on this host can be checked; owners elsewhere are
+    assumed alive.
+    """
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore(ABC):
+    """
+    Interface for durable job records.
+
+    Records are dicts with the keys in RECORD_FIELDS. Backends for shared
+    stores such as Redis or Postgres implement the same methods; claim must
+    be an atomic compare-and-set so only one process resumes a job.
+    """
+
+    @abstractmethod
+    def save(self, record: dict):
+        """Insert or replace a job record."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        """Record for job_id, or None if unknown or expired."""
+
+    @abstractmethod
+    def find_active(self, inputs_hash: str) -> Optional[dict]:
+        """A queued or running job with the given inputs, if any."""
+
+    @abstractmethod
+    def unfinished(self) -> List[dict]:
+        """Every queued or running job, oldest first."""
+
+    @abstractmethod
+    def claim(self, job_id: str, previous_owner: Optional[str], owner: str) -> bool:
+        """
+        Take over a job if it still belongs to previous_owner.
+
+        Returns:
+            True if this caller now owns the job
+        """
+
+    @abstractmethod
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete finished records past their expiry. Returns the number removed."""
+
+
+class MemoryJobStore(JobStore):
+    """In-process stand-in for a durable store; nothing survives a restart."""
+
+    def __init__(self):
+        self._records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def save(self, record: dict):
+        with self._lock:
+            self._records[record['id']] = dict(record)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            record = self._records.get(job_id)
+            return dict(record) if record is not None else None
+
+    def find_active(self, inputs_hash: str) -> Optional[dict]:
+        with self._lock:
+            for record in self._records.values():
+                if record['inputs_hash'] == inputs_hash and record['status'] in ('queued', 'running'):
+                    return dict(record)
+        return None
+
+    def unfinished(self) -> List[dict]:
+        with self._lock:
+            records = [dict(r) for r in self._records.values() if r['status'] in ('queued', 'running')]
+        return sorted(records, key=lambda record: record['created_at'])
+
+    def claim(self, job_id: str, previous_owner: Optional[str], owner: str) -> bool:
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is None or record['owner'] != previous_owner:
+                return False
+            record['owner'] = owner
+            return True
+
+    def prune(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, record in self._records.items()
+                if record['expires_at'] is not None and record['expires_at'] <= now
+            ]
+            for job_id in expired:
+                del self._records[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job records in a SQLite database shared by every worker process on the host.
+
+    Writes are single-row upserts in WAL mode, so recording a stage change
+    costs one small transaction.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if needed) the job database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._connection().executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    inputs_hash TEXT,
+                    upstream_id TEXT,
+                    request TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    expires_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+                CREATE INDEX IF NOT EXISTS jobs_inputs_hash ON jobs (inputs_hash);
+                CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at);
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection for this process, reopened after a fork. Caller holds the lock."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.row_factory = sqlite3.Row
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _to_record(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        record = dict(row)
+        for key in ('request', 'result'):
+            if record[key] is not None:
+                record[key] = json.loads(record[key])
+        return record
+
+    def save(self, record: dict):
+        values = dict(record)
+        for key in ('request', 'result'):
+            if values.get(key) is not None:
+                values[key] = json.dumps(values[key])
+        with self._lock:
+            self._connection().execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(RECORD_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in RECORD_FIELDS)})",
+                [values.get(key) for key in RECORD_FIELDS]
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_record(row)
+
+    def find_active(self, inputs_hash: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT * FROM jobs WHERE inputs_hash = ? AND status IN ('queued', 'running') LIMIT 1",
+                (inputs_hash,)
+            ).fetchone()
+        return self._to_record(row)
+
+    def unfinished(self) -> List[dict]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def claim(self, job_id: str, previous_owner: Optional[str], owner: str) -> bool:
+        with self._lock:
+            cursor = self._connection().execute(
+                'UPDATE jobs SET owner = ? WHERE id = ? AND owner IS ?', (owner, job_id, previous_owner)
+            )
+        return cursor.rowcount == 1
+
+    def prune(self, now: Optional[float] = None) -> int:
+        with self._lock:
+            cursor = self._connection().execute(
+                'DELETE FROM jobs WHERE expires_at <= ?', (now or time.time(),)
+            )
+        return cursor.rowcount
+
+
+def create_job_store() -> Optional[JobStore]:
+    """
+    Build the job store selected by JOB_STORE_BACKEND.
+
+    Returns:
+        The store, or None when JOB_STORE_BACKEND is 'none'
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if Config.JOB_STORE_BACKEND == 'sqlite':
+        return SQLiteJobStore(Config.JOB_STORE_PATH)
+    if Config.JOB_STORE_BACKEND == 'memory':
+        return MemoryJobStore()
+    if Config.JOB_STORE_BACKEND == 'none':
+        return None
+    raise ValueError(f"Unknown job store backend: {Config.JOB_STORE_BACKEND}")
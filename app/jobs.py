@@ -0,0 +1,641 @@
+"""
+TryScape - Background Job Module
+Runs long generation work on a bounded worker pool so requests return immediately.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.job_store import JobStore, owner_alive, process_owner
+from app.metrics import JOB_SECONDS
+
+
+# Fine-grained progress stages reported to clients, in the order they occur
+JOB_STAGES = ('queued', 'uploading', 'notStarted', 'running', 'downloading', 'done', 'failed')
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its configured depth."""
+
+
+class JobError(Exception):
+    """Job failure whose message is safe to show to users."""
+
+
+def chain_future(future: Future, fn: Callable) -> Future:
+    """
+    Return a Future for fn applied to the result of another Future.
+    
+    fn runs on whichever thread completes the source future.
+    
+    Args:
+        future: Source future
+        fn: Callable taking the source result
+    
+    Returns:
+        Future resolving to fn's return value or exception
+    """
+    chained = Future()
+    
+    def _apply(source: Future):
+        try:
+            chained.set_result(fn(source.result()))
+        except Exception as e:
+            chained.set_exception(e)
+    
+    future.add_done_callback(_apply)
+    return chained
+
+
+class AsyncLoopExecutor:
+    """
+    Executor that runs coroutine functions on one background event loop.
+    
+    Jobs waiting on network I/O cost a coroutine rather than a thread, so a
+    single thread can hold thousands of generations in flight.
+    """
+    
+    def __init__(self, max_concurrency: int):
+        """
+        Args:
+            max_concurrency: Maximum coroutines running at once
+        """
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+    
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Schedule a coroutine function on the loop.
+        
+        Returns:
+            concurrent.futures.Future for its result
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._run(fn, *args, **kwargs), self.loop)
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the event loop once scheduled work has been handed off."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if wait:
+                self._thread.join()
+    
+    async def _run(self, fn: Callable, *args, **kwargs):
+        async with self._semaphore:
+            return await fn(*args, **kwargs)
+    
+    def _ensure_started(self):
+        """Start the loop thread lazily so forked workers get their own."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._thread = threading.Thread(target=self.loop.run_forever, name='tryscape-async-jobs', daemon=True)
+            self._thread.start()
+
+
+class Job:
+    """A single unit of background work and its current state."""
+    
+    def __init__(self, kind: str, job_id: Optional[str] = None):
+        """Create a queued job of the given kind, with a new id unless one is given."""
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.version = 0  # bumped on every status or stage change
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.updated_at = self.created_at
+        self.submitted_at = time.monotonic()
+        self.finished_at = None  # monotonic time, used for expiry
+        self.future: Optional[Future] = None
+        self.batch: Optional['JobBatch'] = None
+        self.inputs: Optional[dict] = None  # stored so the job can be resubmitted after a restart
+        self.inputs_hash: Optional[str] = None
+        self.upstream_id: Optional[str] = None  # SORA job id, once created
+        self.owner: Optional[str] = None
+        self._store: Optional[JobStore] = None
+        self._result_ttl = 0
+        self._detached = False  # a read-only view of a job run by another process
+        self._changed = threading.Condition()  # reentrant, so refresh can hold it across _set_status
+    
+    @classmethod
+    def from_record(cls, record: dict, store: JobStore) -> 'Job':
+        """
+        Read-only view of a job stored by another process.
+        
+        refresh() re-reads the record, so status requests and event streams
+        can follow the job from any worker sharing the store.
+        """
+        job = cls(record['kind'], job_id=record['id'])
+        job.created_at = datetime.fromisoformat(record['created_at'])
+        job._store = store
+        job._detached = True
+        job._apply_record(record)
+        return job
+    
+    @property
+    def done(self) -> bool:
+        """Whether the job has finished, successfully or not."""
+        return self.status in ('succeeded', 'failed')
+    
+    def refresh(self):
+        """Pick up the running state from the underlying future, or from the store for detached jobs."""
+        if self._detached:
+            record = self._store.get(self.id)
+            if record is not None:
+                with self._changed:
+                    if self._apply_record(record):
+                        self.version += 1
+                        self._changed.notify_all()
+            return
+        if self.status == 'queued' and self.future is not None and self.future.running():
+            with self._changed:
+                if self.status == 'queued':
+                    self._set_status('running')
+    
+    def set_stage(self, stage: str):
+        """
+        Record a progress stage reported by the work itself.
+        
+        Safe to call from any thread; ignored once the job has finished.
+        
+        Args:
+            stage: One of JOB_STAGES
+        """
+        with self._changed:
+            if self.done or stage == self.stage:
+                return
+            if self.status == 'queued':
+                self.status = 'running'
+            self.stage = stage
+            self._touch()
+    
+    def set_upstream_id(self, upstream_id: str):
+        """
+        Record the id of the upstream (SORA) job doing this job's work.
+        
+        Stored so a restart resumes polling that job instead of paying for
+        a new one. Safe to call from any thread.
+        """
+        with self._changed:
+            self.upstream_id = upstream_id
+            self._persist()
+    
+    def wait_for_change(self, version: int, timeout: float) -> bool:
+        """
+        Block until the job moves past version or the timeout expires.
+        
+        Returns:
+            True if the job changed
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+    
+    def _set_status(self, status: str):
+        with self._changed:
+            if status == self.status:
+                return
+            self.status = status
+            if self.done:
+                self.finished_at = time.monotonic()
+                self.stage = 'done' if status == 'succeeded' else 'failed'
+            elif self.stage == 'queued' and status == 'running':
+                self.stage = 'running'
+            self._touch()
+    
+    def _touch(self):
+        """Note a change and wake any waiters. Caller holds the condition."""
+        self.version += 1
+        self.updated_at = datetime.now()
+        self._changed.notify_all()
+        self._persist()
+        if self.batch is not None:
+            self.batch._notify()
+    
+    def _attach(self, store: Optional[JobStore], result_ttl: int):
+        """Persist this job to store from now on, keeping finished records for result_ttl seconds."""
+        self._store = store
+        self._result_ttl = result_ttl
+        self.owner = process_owner()
+        self._persist()
+    
+    def _persist(self):
+        """Write the job's record to its store, if any."""
+        if self._store is None or self._detached:
+            return
+        try:
+            self._store.save(self.to_record())
+        except Exception as e:
+            print(f"Error saving job {self.id}: {e}")
+    
+    def _apply_record(self, record: dict) -> bool:
+        """Copy mutable state from a store record. Returns True if anything changed."""
+        state = (record['status'], record['stage'], record['result'], record['error'])
+        if state == (self.status, self.stage, self.result, self.error):
+            return False
+        self.status, self.stage, self.result, self.error = state
+        self.upstream_id = record['upstream_id']
+        self.updated_at = datetime.fromisoformat(record['updated_at'])
+        return True
+    
+    def to_record(self) -> dict:
+        """Full job state for a JobStore."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'inputs_hash': self.inputs_hash,
+            'upstream_id': self.upstream_id,
+            'request': self.inputs,
+            'result': self.result,
+            'error': self.error,
+            'owner': self.owner,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'expires_at': time.time() + self._result_ttl if self.done else None,
+        }
+    
+    def to_dict(self) -> dict:
+        """
+        Serialize the job for API responses.
+        
+        Returns:
+            Dictionary with the job id, status, timestamps and result or error
+        """
+        self.refresh()
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+        }
+        if self.status == 'succeeded':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobBatch:
+    """Jobs submitted together, such as the variants of one try-on, tracked as a group."""
+    
+    def __init__(self, jobs: List[Job]):
+        """Group jobs; each reports its changes to the batch."""
+        self.id = uuid.uuid4().hex
+        self.jobs = jobs
+        self.version = 0  # bumped whenever any job changes
+        self.created_at = datetime.now()
+        self._changed = threading.Condition()
+        for job in jobs:
+            job.batch = self
+    
+    @property
+    def done(self) -> bool:
+        """Whether every job has finished."""
+        return all(job.done for job in self.jobs)
+    
+    @property
+    def finished_at(self) -> Optional[float]:
+        """Monotonic time the last job finished, or None while any is pending."""
+        return max(job.finished_at for job in self.jobs) if self.done else None
+    
+    def refresh(self):
+        """Pick up running states from the underlying futures."""
+        for job in self.jobs:
+            job.refresh()
+    
+    def wait_for_change(self, version: int, timeout: float) -> bool:
+        """
+        Block until any job changes after version or the timeout expires.
+        
+        Returns:
+            True if a job changed
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+    
+    def _notify(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+    
+    def to_dict(self) -> dict:
+        """
+        Serialize the batch for API responses.
+        
+        Returns:
+            Dictionary with the batch id, progress counts and each job's to_dict
+        """
+        jobs = [job.to_dict() for job in self.jobs]
+        return {
+            'batch_id': self.id,
+            'status': 'finished' if self.done else 'running',
+            'completed': sum(1 for job in jobs if job['status'] in ('succeeded', 'failed')),
+            'total': len(jobs),
+            'created_at': self.created_at.isoformat(),
+            'jobs': jobs,
+        }
+
+
+class JobManager:
+    """
+    Bounded worker pool that tracks submitted jobs by id.
+    
+    With a JobStore, every status and stage change is also written to the
+    store, so other workers can serve the job and a restarted process can
+    pick up where this one stopped (see resume).
+    """
+    
+    def __init__(
+        self,
+        worker_type: str = 'thread',
+        max_workers: int = 4,
+        max_queue: int = 32,
+        result_ttl: int = 3600,
+        store: Optional[JobStore] = None,
+        on_finish: Optional[Callable[[Job], None]] = None
+    ):
+        """
+        Initialize the worker pool.
+        
+        Args:
+            worker_type: 'thread', 'process' or 'async' (coroutine functions on one event loop)
+            max_workers: Number of concurrent workers (coroutines in async mode)
+            max_queue: Number of jobs allowed to wait for a free worker
+            result_ttl: Seconds a finished job stays queryable
+            store: Durable job records, or None to keep jobs in memory only
+            on_finish: Called with each job once it succeeds or fails, e.g. to
+                release inputs kept only for resuming it
+        """
+        if worker_type == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        elif worker_type == 'async':
+            self.executor = AsyncLoopExecutor(max_concurrency=max_workers)
+        elif worker_type == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tryscape-job')
+        else:
+            raise ValueError(f"Unknown job worker type: {worker_type}")
+        
+        self.worker_type = worker_type
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.store = store
+        self.on_finish = on_finish
+        self._jobs: Dict[str, Job] = {}
+        self._batches: Dict[str, JobBatch] = {}
+        self._lock = threading.Lock()
+    
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        kind: str = 'generation',
+        report_progress: bool = False,
+        report_upstream: bool = False,
+        inputs: Optional[dict] = None,
+        inputs_hash: Optional[str] = None,
+        **kwargs
+    ) -> Job:
+        """
+        Queue a callable for background execution.
+        
+        In process mode fn and its arguments must be picklable; in async mode
+        fn must be a coroutine function.
+        
+        Args:
+            fn: Callable to run; its return value becomes the job result
+            kind: Label stored with the job
+            report_progress: Pass fn a progress=Job.set_stage callback. Not
+                available in process mode, where stages follow the status only.
+            report_upstream: Pass fn an on_upstream_job=Job.set_upstream_id
+                callback (not available in process mode)
+            inputs: JSON-serializable description of the request, stored so
+                the job can be resubmitted after a restart
+            inputs_hash: Identity of the inputs; while a job with the same hash
+                is queued or running, that job is returned instead of a new one
+        
+        Returns:
+            The queued Job, or the pending job with the same inputs_hash
+        
+        Raises:
+            QueueFullError: If the pool and its queue are saturated
+        """
+        with self._lock:
+            existing = self._find_active(inputs_hash)
+            if existing is not None:
+                return existing
+            self._reserve(1)
+            job = Job(kind)
+            job.inputs, job.inputs_hash = inputs, inputs_hash
+            self._start(job, fn, args, kwargs, report_progress, report_upstream)
+        
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+    
+    def submit_batch(
+        self,
+        fn: Callable,
+        variants: List[dict],
+        kind: str = 'generation',
+        report_progress: bool = False,
+        report_upstream: bool = False,
+        inputs: Optional[List[dict]] = None,
+        **kwargs
+    ) -> JobBatch:
+        """
+        Queue one job per variant, all or none.
+        
+        Each job runs fn(**kwargs, **variant), so shared inputs such as a
+        prepared image are passed once and reused by every job.
+        
+        Args:
+            fn: Callable to run for each variant
+            variants: Keyword arguments specific to each job
+            kind: Label stored with the jobs
+            report_progress: Pass fn a progress=Job.set_stage callback (see submit)
+            report_upstream: Pass fn an on_upstream_job callback (see submit)
+            inputs: Stored request description for each variant (see submit)
+        
+        Returns:
+            The queued JobBatch, with jobs in variant order
+        
+        Raises:
+            QueueFullError: If the pool and its queue cannot take every variant
+        """
+        with self._lock:
+            self._reserve(len(variants))
+            batch = JobBatch([Job(kind) for _ in variants])
+            self._batches[batch.id] = batch
+            for index, (job, variant) in enumerate(zip(batch.jobs, variants)):
+                job.inputs = inputs[index] if inputs else None
+                self._start(job, fn, (), {**kwargs, **variant}, report_progress, report_upstream)
+        
+        for job in batch.jobs:
+            job.future.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return batch
+    
+    def resume(
+        self,
+        record: dict,
+        fn: Callable,
+        *args,
+        report_progress: bool = False,
+        report_upstream: bool = False,
+        **kwargs
+    ) -> Job:
+        """
+        Run fn for a stored job left unfinished by a previous process.
+        
+        The job keeps its id, so clients polling it see it continue. Resumed
+        jobs are not counted against the queue limit: they were accepted
+        before the restart.
+        
+        Args:
+            record: The job's store record, already claimed by this process
+            fn: Callable that completes the job (see submit)
+        
+        Returns:
+            The running Job
+        """
+        job = Job(record['kind'], job_id=record['id'])
+        job.created_at = datetime.fromisoformat(record['created_at'])
+        job.inputs = record['request']
+        job.inputs_hash = record['inputs_hash']
+        job.upstream_id = record['upstream_id']
+        with self._lock:
+            self._start(job, fn, args, kwargs, report_progress, report_upstream)
+        
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+    
+    def abandon(self, record: dict, error: str):
+        """Mark a stored job that cannot be resumed as failed."""
+        if self.store is None:
+            return
+        job = Job(record['kind'], job_id=record['id'])
+        job.created_at = datetime.fromisoformat(record['created_at'])
+        job.inputs = record['request']
+        job.inputs_hash = record['inputs_hash']
+        job.error = error
+        job._attach(self.store, self.result_ttl)
+        job._set_status('failed')
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id, or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            # Started by another worker process, or finished before a restart
+            record = self.store.get(job_id)
+            if record is not None:
+                job = Job.from_record(record, self.store)
+        return job
+    
+    def get_batch(self, batch_id: str) -> Optional[JobBatch]:
+        """Look up a batch by id, or None if unknown or expired."""
+        with self._lock:
+            return self._batches.get(batch_id)
+    
+    def pending_count(self) -> int:
+        """Number of jobs that are queued, running or waiting on deferred work."""
+        return sum(1 for job in list(self._jobs.values()) if not job.done)
+    
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and release the workers."""
+        self.executor.shutdown(wait=wait)
+    
+    def _reserve(self, count: int):
+        """Check that count more jobs fit in the pool and queue. Caller holds the lock."""
+        self._prune()
+        if self.pending_count() + count > self.max_workers + self.max_queue:
+            raise QueueFullError('Too many generations in progress. Please try again shortly.')
+    
+    def _find_active(self, inputs_hash: Optional[str]) -> Optional[Job]:
+        """A pending job with the given inputs, here or in a live process sharing the store. Caller holds the lock."""
+        if inputs_hash is None:
+            return None
+        for job in self._jobs.values():
+            if job.inputs_hash == inputs_hash and not job.done:
+                return job
+        if self.store is not None:
+            record = self.store.find_active(inputs_hash)
+            if record is not None and owner_alive(record['owner']):
+                return Job.from_record(record, self.store)
+        return None
+    
+    def _start(
+        self,
+        job: Job,
+        fn: Callable,
+        args: tuple,
+        kwargs: dict,
+        report_progress: bool,
+        report_upstream: bool
+    ) -> Job:
+        """Register a job, record it in the store and hand it to the executor. Caller holds the lock."""
+        self._jobs[job.id] = job
+        job._attach(self.store, self.result_ttl)
+        if report_progress and self.worker_type != 'process':
+            kwargs['progress'] = job.set_stage
+        if report_upstream and self.worker_type != 'process':
+            kwargs['on_upstream_job'] = job.set_upstream_id
+        job.future = self.executor.submit(fn, *args, **kwargs)
+        return job
+    
+    def _finish(self, job: Job, future: Future):
+        """Record the outcome of a completed future on its job."""
+        try:
+            result = future.result()
+            if isinstance(result, Future):
+                # The task handed off to another subsystem; finish when that does
+                job._set_status('running')
+                result.add_done_callback(lambda deferred: self._finish(job, deferred))
+                return
+            job.result = result
+            job._set_status('succeeded')
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.error = str(e) if isinstance(e, JobError) else 'An error occurred while generating. Please try again.'
+            job._set_status('failed')
+        JOB_SECONDS.observe(job.finished_at - job.submitted_at, kind=job.kind, status=job.status)
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"Error finishing job {job.id}: {e}")
+    
+    def _prune(self):
+        """Forget finished jobs older than the result TTL. Caller holds the lock."""
+        cutoff = time.monotonic() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        expired_batches = [
+            batch_id for batch_id, batch in self._batches.items()
+            if batch.done and batch.finished_at < cutoff
+        ]
+        for batch_id in expired_batches:
+            del self._batches[batch_id]
+        if self.store is not None:
+            try:
+                self.store.prune()
+            except Exception as e:
+                print(f"Error pruning job store: {e}")
@@ -0,0 +1,104 @@
+"""
+TryScape - Media Serving
+Cache-friendly responses for stored media, with optional front-proxy offload.
+"""
+import hashlib
+import mimetypes
+import os
+from typing import Iterable, List
+
+from flask import Response, request
+from werkzeug.utils import send_file
+
+from app.storage import derivative_key
+
+
+def media_etag(path: str, key: str) -> str:
+    """
+    Strong ETag for a stored media file, without reading it.
+
+    Media is never rewritten under a key, so the key together with the
+    file's size and modification time identifies the bytes; a replaced
+    file gets a new ETag.
+
+    Args:
+        path: Local file to describe
+        key: Storage key of the file
+
+    Returns:
+        Hex digest identifying this version of the file
+    """
+    stat = os.stat(path)
+    return hashlib.sha256(f"{key}\0{stat.st_size}\0{stat.st_mtime_ns}".encode('utf-8')).hexdigest()
+
+
+def derivative_candidates(key: str, size: str, formats: Iterable[str], accept) -> List[str]:
+    """
+    Keys to try for a sized copy of key, best first.
+
+    Formats the client accepts are tried in the order configured; the
+    original key comes last so a missing derivative still gets an answer.
+
+    Args:
+        key: Key of the original image
+        size: Derivative size name, e.g. 'thumb'
+        formats: Configured derivative formats
+        accept: The request's Accept header (werkzeug MIMEAccept)
+
+    Returns:
+        Candidate keys ending with key itself
+    """
+    accepted = [fmt for fmt in formats if accept[f"image/{fmt}"]]
+    return [derivative_key(key, size, fmt) for fmt in accepted] + [key]
+
+
+def send_media(
+    path: str,
+    key: str,
+    max_age: int = 31536000,
+    offload: str = '',
+    accel_prefix: str = '/protected-media'
+) -> Response:
+    """
+    Build the response for a stored media file.
+
+    Stored media never changes under a key, so responses are marked
+    immutable and revalidated by an ETag built from the key, size and
+    modification time. Range requests are answered
+    with 206 so video seeking fetches only what it needs.
+
+    Args:
+        path: Local file to send
+        key: Storage key of the file
+        max_age: Seconds clients and proxies may cache the response
+        offload: '' to stream from Python, 'x-sendfile' (Apache, lighttpd)
+            or 'x-accel-redirect' (nginx) to let the front proxy send the bytes
+        accel_prefix: Internal nginx location that maps to the storage root
+
+    Returns:
+        Flask response
+    """
+    etag = media_etag(path, key)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if offload == 'x-accel-redirect':
+        # nginx serves the body (and Range) from the internal location
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{key}"
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        response = send_file(
+            path,
+            request.environ,
+            mimetype=mimetype,
+            etag=etag,
+            use_x_sendfile=offload == 'x-sendfile',
+            conditional=True,
+            max_age=max_age
+        )
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
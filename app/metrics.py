@@ -0,0 +1,282 @@
+"""
+TryScape - Metrics
+In-process counters, gauges and histograms rendered in the Prometheus text exposition format.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram buckets in seconds, from a mask lookup to a long SORA job
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples at scrape time
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    """Base for labelled metrics: one value (or histogram state) per label combination."""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Current (sample name, labels, value) triples."""
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. responses by status code."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = STAGE_BUCKETS
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            states = [(key, dict(state, counts=list(state['counts']))) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, state in states:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_sum", labels, state['sum']))
+            samples.append((f"{self.name}_count", labels, state['count']))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms updated as this process works.
+
+    Gauges such as jobs in flight come from collectors passed to render,
+    which read them at scrape time. Each server worker process has its own
+    registry, so scrape every worker (or run one) for complete numbers.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = STAGE_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self, collectors: Iterable[Collector] = ()) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+
+        Args:
+            collectors: Callables returning further metric families, read now
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+def directory_size(folder: str) -> Tuple[int, int]:
+    """
+    Total bytes and number of files under folder, recursively.
+
+    Returns:
+        Tuple of (bytes, files)
+    """
+    total = files = 0
+    pending = [folder]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        continue  # removed while scanning
+        except OSError:
+            continue
+    return total, files
+
+
+class DirectoryUsage:
+    """
+    Disk usage of a folder, rescanned every max_age seconds on a background thread.
+
+    Readers only see the last scan, so a large tree never holds up a
+    scrape. The thread starts in each process on first use, after any fork.
+    """
+
+    def __init__(self, folder: str, max_age: float = 60):
+        self.folder = folder
+        self.max_age = max_age
+        self._value: Optional[Tuple[int, int]] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Tuple[int, int]]:
+        """(bytes, files) from the last scan, or None until the first scan finishes."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='directory-usage', daemon=True).start()
+            return self._value
+
+    def _run(self):
+        while True:
+            value = directory_size(self.folder)
+            with self._lock:
+                self._value = value
+            time.sleep(self.max_age)
+
+
+REGISTRY = MetricsRegistry()
+
+# Stages: upload_save, normalize (validate and resize in one pass), mask, edit_call,
+# download, sora_queue and sora_run; whole jobs are timed by JOB_SECONDS
+STAGE_SECONDS = REGISTRY.histogram(
+    'tryscape_stage_duration_seconds',
+    'Time spent in each generation stage',
+    ('stage',)
+)
+JOB_SECONDS = REGISTRY.histogram(
+    'tryscape_job_duration_seconds',
+    'Time from submitting a job to its outcome',
+    ('kind', 'status')
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    'tryscape_upstream_responses_total',
+    'Azure OpenAI responses by API and HTTP status',
+    ('api', 'status')
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    'tryscape_upstream_retries_total',
+    'Azure OpenAI requests retried, by the status or error that caused the retry',
+    ('reason',)
+)
+
+
+def time_stage(stage: str):
+    """Context manager observing the duration of a generation stage."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_upstream_response(api: str, status_code: int):
+    """Count an Azure OpenAI response by API ('edit', 'sora_create', ...) and status."""
+    UPSTREAM_RESPONSES.inc(api=api, status=str(status_code))
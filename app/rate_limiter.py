@@ -0,0 +1,279 @@
+"""
+TryScape - Rate Limiting
+Client-side token bucket and fair concurrency limits for Azure deployments.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at a fixed rate.
+
+    Callers that find the bucket empty reserve the next token by driving
+    the balance negative, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate_per_minute: Sustained requests per minute
+            burst: Maximum tokens that can accumulate
+        """
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token without waiting for it.
+
+        Returns:
+            Seconds the caller must wait before using the token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self) -> float:
+        """
+        Take one token, sleeping until it is available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class FairSemaphore:
+    """Counting semaphore that admits waiters in FIFO order."""
+
+    def __init__(self, limit: int):
+        """
+        Args:
+            limit: Maximum concurrent holders
+        """
+        self.limit = limit
+        self.active = 0
+        self._next_ticket = 0
+        self._serving = 0
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        """Number of callers queued for a slot."""
+        return self._next_ticket - self._serving
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._serving or self.active >= self.limit:
+                self._cond.wait()
+            self._serving += 1
+            self.active += 1
+            self._cond.notify_all()
+        return time.monotonic() - start
+
+    def try_acquire(self) -> bool:
+        """Take a slot without waiting, if one is free and nobody is queued for it."""
+        with self._cond:
+            if self.waiting or self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        """Free a slot for the next waiter."""
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+
+class DeploymentGovernor:
+    """
+    Rate and concurrency limits for one Azure deployment, with wait-time metrics.
+
+    A limit of 0 disables that control. The bucket and semaphore live in
+    this process, so when several processes call the same deployment each
+    enforces an equal share of the limits, given by processes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        max_concurrency: int = 0,
+        processes: int = 1
+    ):
+        """
+        Args:
+            name: Deployment name, used in stats and logs
+            requests_per_minute: Sustained request rate (0 for unlimited)
+            max_concurrency: Maximum in-flight operations (0 for unlimited)
+            processes: Processes sharing these limits; concurrency never drops below 1
+        """
+        processes = max(1, processes)
+        requests_per_minute = requests_per_minute / processes
+        if max_concurrency > 0:
+            max_concurrency = max(1, max_concurrency // processes)
+        self.name = name
+        self.bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.semaphore = FairSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.max_concurrency = max_concurrency
+        self._async_semaphore = None  # created on the event loop that first uses it
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+        self._deferred = deque()  # (start, queued_at) admitted by acquire_later
+
+    def acquire(self) -> float:
+        """
+        Block until a concurrency slot and a rate token are both available.
+
+        Every acquire must be paired with release, even when the work fails.
+
+        Returns:
+            Seconds spent waiting
+        """
+        wait = 0.0
+        if self.semaphore is not None:
+            wait += self.semaphore.acquire()
+        if self.bucket is not None:
+            wait += self.bucket.acquire()
+        self._record_wait(wait)
+        return wait
+
+    def acquire_later(self, start: Callable[[], None]):
+        """
+        Call start once a concurrency slot and a rate token are available, without blocking.
+
+        start runs on the thread that frees the slot (or on a timer thread
+        while the rate limit recovers), so it must hand any slow work off
+        and return quickly. Pair it with release like acquire.
+
+        Args:
+            start: Called with no arguments once admitted
+        """
+        with self._lock:
+            self._deferred.append((start, time.monotonic()))
+        self._admit_deferred()
+
+    def release(self):
+        """Return the concurrency slot taken by acquire or acquire_later."""
+        if self.semaphore is not None:
+            self.semaphore.release()
+        self._admit_deferred()
+
+    def _admit_deferred(self):
+        """Start queued acquire_later callers, in order, while slots are free."""
+        while True:
+            with self._lock:
+                if not self._deferred:
+                    return
+                if self.semaphore is not None and not self.semaphore.try_acquire():
+                    return
+                start, queued_at = self._deferred.popleft()
+            delay = self.bucket.reserve() if self.bucket is not None else 0.0
+            self._record_wait(time.monotonic() - queued_at + delay)
+            if delay > 0:
+                timer = threading.Timer(delay, self._start_deferred, (start,))
+                timer.daemon = True
+                timer.start()
+            else:
+                self._start_deferred(start)
+
+    def _start_deferred(self, start: Callable[[], None]):
+        try:
+            start()
+        except Exception as e:
+            # The caller never got going, so its slot is not coming back through release
+            print(f"Error starting deferred work for Azure deployment '{self.name}': {e}")
+            self.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of a with block."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire_async(self) -> float:
+        """
+        Event-loop variant of acquire that never blocks the loop.
+
+        Pair with release_async. asyncio.Semaphore queues waiters in FIFO order.
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        if self.max_concurrency > 0:
+            if self._async_semaphore is None:
+                self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            await self._async_semaphore.acquire()
+        if self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        wait = time.monotonic() - start
+        self._record_wait(wait)
+        return wait
+
+    def release_async(self):
+        """Return the concurrency slot taken by acquire_async."""
+        if self._async_semaphore is not None:
+            self._async_semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Hold a slot for the duration of an async with block."""
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release_async()
+
+    def _record_wait(self, wait: float):
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        if wait > 0.5:
+            print(f"Waited {wait:.1f}s for Azure deployment '{self.name}' capacity")
+
+    def stats(self) -> dict:
+        """Wait-time and occupancy metrics for this deployment."""
+        with self._lock:
+            return {
+                'deployment': self.name,
+                'acquired': self.acquired,
+                'total_wait_seconds': self.total_wait,
+                'max_wait_seconds': self.max_wait,
+                'active': self.semaphore.active if self.semaphore else None,
+                'waiting': (self.semaphore.waiting if self.semaphore else 0) + len(self._deferred),
+            }
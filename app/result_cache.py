@@ -0,0 +1,271 @@
+"""
+TryScape - Result Cache
+Content-addressed cache of generated images keyed on input image and prompt.
+"""
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.storage import shard_path
+
+
+class _CacheEntry:
+    """Location and bookkeeping for one cached result."""
+
+    def __init__(self, path: str, size: int, created_at: float):
+        self.path = path
+        self.size = size  # including derivatives
+        self.created_at = created_at
+        self.derivatives = {}  # path -> size of thumbnails and previews beside the file
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of generated files with a TTL.
+
+    Entries live as <key>.<ext> files in the sharded layout under a folder,
+    so results survive restarts and can be served as static files directly.
+    Thumbnails and previews of an entry are kept beside it as
+    <key>.<name>.<format>, count towards its size and go with it.
+    """
+
+    def __init__(self, folder: str, max_entries: int = 500, max_bytes: int = 512 * 1024 * 1024, ttl: int = 86400):
+        """
+        Initialize the cache and index any files already in its folder.
+
+        Args:
+            folder: Folder holding cached files
+            max_entries: Maximum number of cached results
+            max_bytes: Maximum total size of cached results
+            ttl: Seconds a result stays valid
+        """
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, _CacheEntry]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(folder, exist_ok=True)
+        self._load_existing()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, prompt: str, candidates: int = 1) -> str:
+        """
+        Build a cache key from normalized image bytes and the final prompt.
+
+        Args:
+            image_bytes: Image bytes after validation and resizing
+            prompt: Prompt sent to the model
+            candidates: Images requested from the model (the edits n parameter)
+
+        Returns:
+            Hex digest identifying the request
+        """
+        digest = hashlib.sha256()
+        digest.update(image_bytes)
+        digest.update(b'\0')
+        digest.update(prompt.encode('utf-8'))
+        if candidates > 1:
+            digest.update(f"\0n={candidates}".encode('ascii'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def candidate_key(key: str, index: int) -> str:
+        """
+        Cache key for one image of a multi-candidate request.
+
+        Args:
+            key: Request key from make_key
+            index: Position of the image in the response
+
+        Returns:
+            key itself for the first image, '<key>-<index>' for the others
+        """
+        return key if index == 0 else f"{key}-{index}"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached result.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Path to the cached file, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created_at > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.path
+
+    def put(self, key: str, data: bytes, extension: str = 'png') -> str:
+        """
+        Store a result and evict older entries if over budget.
+
+        Args:
+            key: Cache key from make_key
+            data: File contents
+            extension: File extension for the cached file
+
+        Returns:
+            Path to the cached file
+        """
+        path = self._path(key, extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._index(key, path, len(data))
+        return path
+
+    def put_file(self, key: str, source_path: str, extension: str = 'png') -> str:
+        """
+        Move an existing file into the cache without reading it.
+
+        Args:
+            key: Cache key from make_key
+            source_path: File to move; must be on the same filesystem
+            extension: File extension for the cached file
+
+        Returns:
+            Path to the cached file
+        """
+        path = self._path(key, extension)
+        os.replace(source_path, path)
+        self._index(key, path, os.path.getsize(path))
+        return path
+
+    @staticmethod
+    def derivative_path(path: str, name: str, image_format: str) -> str:
+        """Path of a thumbnail or preview kept beside the cached file at path."""
+        return f"{os.path.splitext(path)[0]}.{name}.{image_format}"
+
+    def add_derivatives(self, key: str, paths: Iterable[str]):
+        """
+        Count derivatives written beside an entry (see derivative_path) towards its size.
+
+        Args:
+            key: Cache key of the entry
+            paths: Files written beside the entry's file
+        """
+        sizes = {}
+        for path in paths:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                continue
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Evicted while they were rendered
+                for path in sizes:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                return
+            for path, size in sizes.items():
+                delta = size - entry.derivatives.get(path, 0)
+                entry.derivatives[path] = size
+                entry.size += delta
+                self._total_bytes += delta
+            self._evict()
+
+    def _path(self, key: str, extension: str) -> str:
+        """Sharded path for an entry, with its folders created."""
+        path = os.path.join(self.folder, *shard_path(f"{key}.{extension}").split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _index(self, key: str, path: str, size: int):
+        """Record a stored file and evict older entries if over budget."""
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous.size
+                for derived in previous.derivatives:
+                    try:
+                        os.remove(derived)  # rendered from the replaced file
+                    except OSError:
+                        pass
+            self._entries[key] = _CacheEntry(path, size, time.time())
+            self._entries.move_to_end(key)
+            self._total_bytes += size
+            self._evict()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
+
+    def _evict(self):
+        """Drop least recently used entries until within budget. Caller holds the lock."""
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        """Forget an entry and delete its file. Caller holds the lock."""
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+        # Also drop thumbnails and previews stored beside the entry
+        stem = os.path.splitext(entry.path)[0]
+        for path in [entry.path] + glob.glob(glob.escape(stem) + '.*.*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_existing(self):
+        """Rebuild the index from files on disk, oldest first."""
+        files = []
+        derivatives = []
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue  # partial writes
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                key = filename.split('.', 1)[0]
+                if filename.count('.') > 1:
+                    derivatives.append((key, path, stat.st_size))
+                else:
+                    files.append((stat.st_mtime, key, path, stat.st_size))
+
+        for mtime, key, path, size in sorted(files):
+            self._entries[key] = _CacheEntry(path, size, mtime)
+            self._total_bytes += size
+        for key, path, size in derivatives:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.derivatives[path] = size
+                entry.size += size
+                self._total_bytes += size
+        self._evict()
@@ -0,0 +1,100 @@
+"""
+TryScape - Production Server
+Runs the Flask app under gunicorn with tunable workers and timeouts.
+"""
+from app.config import Config
+
+
+def build_server_options(
+    bind: str = None,
+    workers: int = None,
+    threads: int = None,
+    worker_class: str = None,
+    timeout: int = None,
+    graceful_timeout: int = None,
+    preload: bool = None
+) -> dict:
+    """
+    Merge explicit server options over the Config defaults.
+
+    Args:
+        bind: host:port to listen on
+        workers: Number of worker processes
+        threads: Threads per worker (gthread worker class)
+        worker_class: gunicorn worker class: 'sync', 'gthread', 'gevent', ...
+        timeout: Seconds a silent worker is allowed before it is restarted
+        graceful_timeout: Seconds workers get to finish in-flight work on restart
+        preload: Load the app in the master before forking workers
+
+    Returns:
+        gunicorn settings dictionary
+    """
+    def pick(value, default):
+        return default if value is None else value
+
+    return {
+        'bind': pick(bind, f"{Config.FLASK_RUN_HOST}:{Config.FLASK_RUN_PORT}"),
+        'workers': pick(workers, Config.SERVER_WORKERS),
+        'threads': pick(threads, Config.SERVER_THREADS),
+        'worker_class': pick(worker_class, Config.SERVER_WORKER_CLASS),
+        'timeout': pick(timeout, Config.SERVER_TIMEOUT),
+        'graceful_timeout': pick(graceful_timeout, Config.SERVER_GRACEFUL_TIMEOUT),
+        'preload_app': pick(preload, Config.SERVER_PRELOAD),
+        'keepalive': Config.SERVER_KEEPALIVE,
+        'accesslog': '-',
+        'worker_exit': _worker_exit,
+    }
+
+
+def _worker_exit(server, worker):
+    """
+    Let queued generations finish before a worker goes away.
+
+    SORA jobs still being polled are left to the job store, which resumes
+    them in the next worker.
+    """
+    app = getattr(worker, 'wsgi', None)
+    extensions = getattr(app, 'extensions', {}) if app else {}
+    janitor = extensions.get('janitor')
+    if janitor is not None:
+        janitor.stop()
+    job_manager = extensions.get('job_manager')
+    if job_manager is not None:
+        job_manager.shutdown(wait=True)
+    azure_service = extensions.get('azure_service')
+    if azure_service is not None:
+        azure_service.sora_create_executor.shutdown(wait=True)
+        azure_service.sora_poller.shutdown(wait=True)
+
+
+def serve(**options):
+    """
+    Run create_app() under gunicorn. Blocks until the server exits.
+
+    Args:
+        **options: Overrides accepted by build_server_options
+    """
+    # gunicorn is Unix-only, so only require it for this entry point
+    from gunicorn.app.base import BaseApplication
+    from app.app import create_app
+
+    class TryScapeApplication(BaseApplication):
+        """gunicorn application configured from a dictionary."""
+
+        def __init__(self, settings: dict):
+            self.settings = settings
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    settings = build_server_options(**options)
+    print(
+        f"Starting TryScape on {settings['bind']} with {settings['workers']} "
+        f"{settings['worker_class']} worker(s) x {settings['threads']} thread(s)"
+    )
+    TryScapeApplication(settings).run()
@@ -0,0 +1,139 @@
+"""
+TryScape - Single-Flight Request Coalescing
+Lets concurrent identical requests share one upstream call.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+
+class _Call:
+    """One in-flight call: its shared future and the listeners of every caller."""
+
+    __slots__ = ('future', 'listeners', 'notices')
+
+    def __init__(self):
+        self.future = Future()
+        self.listeners: List[Callable] = []
+        self.notices: List[object] = []
+
+
+class SingleFlight:
+    """
+    Deduplicate in-flight work by key.
+
+    The first caller for a key runs the work; callers arriving while it is
+    still in flight receive the same result instead of starting their own.
+    Values the work learns along the way, such as an upstream job id, reach
+    every caller through notify.
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        self.shared = 0  # calls that joined an in-flight call
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable, *args, **kwargs):
+        """
+        Run fn once per key among concurrent callers and block for its result.
+
+        Args:
+            key: Identifies equivalent requests
+            fn: Callable producing the result
+
+        Returns:
+            The result of fn, shared by all callers with the same key
+        """
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._forget(key, future)
+        return future.result()
+
+    def do_async(self, key: str, start: Callable[[], Future], listener: Optional[Callable] = None) -> Future:
+        """
+        Non-blocking variant for work that already returns a Future.
+
+        Args:
+            key: Identifies equivalent requests
+            start: Callable that starts the work and returns its Future
+            listener: Optional callable given each value passed to notify for
+                this call, including ones notified before this caller joined
+
+        Returns:
+            Future shared by all callers with the same key
+        """
+        future, leader = self._join(key, listener)
+        if leader:
+            try:
+                upstream = start()
+            except BaseException as e:
+                future.set_exception(e)
+                self._forget(key, future)
+                return future
+
+            def _relay(done: Future):
+                try:
+                    future.set_result(done.result())
+                except BaseException as e:
+                    future.set_exception(e)
+                finally:
+                    self._forget(key, future)
+
+            upstream.add_done_callback(_relay)
+        return future
+
+    def notify(self, key: str, value):
+        """
+        Pass a value to the listeners of every caller sharing the call for key.
+
+        Called by the work while it is in flight; ignored once it has finished.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                return
+            call.notices.append(value)
+            listeners = list(call.listeners)
+        for listener in listeners:
+            self._deliver(listener, value)
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently in flight."""
+        with self._lock:
+            return len(self._calls)
+
+    def _join(self, key: str, listener: Optional[Callable] = None):
+        """Return the in-flight future for key and whether the caller must run the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+            if listener is not None:
+                call.listeners.append(listener)
+            notices = list(call.notices)
+        for value in notices:
+            self._deliver(listener, value)
+        return call.future, leader
+
+    def _forget(self, key: str, future: Future):
+        """Drop a finished call so later requests start fresh."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.future is future:
+                del self._calls[key]
+
+    @staticmethod
+    def _deliver(listener: Callable, value):
+        try:
+            listener(value)
+        except Exception as e:
+            print(f"Error notifying a coalesced caller: {e}")
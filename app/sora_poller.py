@@ -0,0 +1,226 @@
+"""
+TryScape - SORA Job Poller
+Tracks all outstanding SORA video jobs from a single background thread.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+
+# SORA job states that mean the job is still in progress
+PENDING_STATUSES = ('queued', 'preprocessing', 'notStarted', 'running', 'processing')
+
+
+class _TrackedJob:
+    """Polling state for one SORA job."""
+
+    def __init__(
+        self,
+        job_id: str,
+        callback: Callable,
+        interval: float,
+        deadline: float,
+        on_status: Optional[Callable] = None,
+        on_error: Optional[Callable] = None
+    ):
+        self.job_id = job_id
+        self.callback = callback
+        self.on_status = on_status
+        self.on_error = on_error
+        self.last_status = None
+        self.interval = interval
+        self.next_check = time.monotonic() + interval
+        self.deadline = deadline
+
+
+class SoraJobPoller:
+    """
+    Single-thread poller for SORA jobs.
+
+    Due jobs are checked together in one batch per wake-up, and each job backs
+    off geometrically while it is still pending. Completion callbacks run on a
+    small fixed pool so downloads never stall the polling loop. A failure
+    while handling one job is reported to that job's on_error and never stops
+    the loop.
+    """
+
+    def __init__(
+        self,
+        fetch_statuses: Callable[[Iterable[str]], Dict[str, dict]],
+        initial_interval: float = 2.0,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        timeout: float = 300.0,
+        callback_workers: int = 2
+    ):
+        """
+        Initialize the poller.
+
+        Args:
+            fetch_statuses: Callable taking job ids and returning {job_id: status_data}
+            initial_interval: Seconds before the first status check
+            max_interval: Upper bound on the per-job check interval
+            backoff: Interval multiplier applied after each pending check
+            timeout: Seconds after which a job is reported as timed out
+            callback_workers: Threads used to run completion callbacks
+        """
+        self.fetch_statuses = fetch_statuses
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.callback_workers = callback_workers
+        self._jobs: Dict[str, _TrackedJob] = {}
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._callback_executor = None
+        self._stopping = False
+
+    def track(
+        self,
+        job_id: str,
+        callback: Callable[[str, dict], None],
+        on_status: Optional[Callable[[str], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None
+    ):
+        """
+        Start tracking a SORA job.
+
+        The callback receives the final status ('succeeded', 'failed',
+        'timeout' or an unknown status) and the last status payload.
+
+        Args:
+            job_id: SORA job id
+            callback: Completion callback
+            on_status: Called from the polling thread whenever the pending
+                status changes; must return quickly
+            on_error: Called with the exception if the job cannot be handled,
+                e.g. its callback could not be scheduled or raised
+
+        Raises:
+            RuntimeError: If the poller has been shut down
+        """
+        now = time.monotonic()
+        with self._wakeup:
+            if self._stopping:
+                raise RuntimeError('SORA poller has been shut down')
+            self._ensure_started()
+            self._jobs[job_id] = _TrackedJob(
+                job_id, callback, self.initial_interval, now + self.timeout, on_status, on_error
+            )
+            self._wakeup.notify()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop polling and wait for running completion callbacks.
+
+        Jobs still pending are dropped without being resolved: they keep
+        running upstream, and a durable job store resumes them after restart.
+        """
+        with self._wakeup:
+            self._stopping = True
+            self._jobs.clear()
+            self._wakeup.notify_all()
+            thread, executor = self._thread, self._callback_executor
+        if thread is not None and wait:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def pending_count(self) -> int:
+        """Number of jobs currently being tracked."""
+        with self._wakeup:
+            return len(self._jobs)
+
+    def _ensure_started(self):
+        """Start the polling thread lazily so forked workers get their own. Caller holds the lock."""
+        if self._thread is None or not self._thread.is_alive():
+            self._callback_executor = ThreadPoolExecutor(
+                max_workers=self.callback_workers, thread_name_prefix='sora-callback'
+            )
+            self._thread = threading.Thread(target=self._run, name='sora-poller', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Polling loop: sleep until the earliest check is due, then check every due job."""
+        while True:
+            with self._wakeup:
+                while not self._jobs and not self._stopping:
+                    self._wakeup.wait()
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                next_check = min(job.next_check for job in self._jobs.values())
+                if next_check > now:
+                    self._wakeup.wait(next_check - now)
+                    continue
+                due = [job for job in self._jobs.values() if job.next_check <= now]
+
+            try:
+                statuses = self.fetch_statuses([job.job_id for job in due])
+            except Exception as e:
+                print(f"Error polling SORA jobs: {e}")
+                statuses = {}
+
+            now = time.monotonic()
+            for job in due:
+                try:
+                    self._check(job, statuses.get(job.job_id), now)
+                except Exception as e:
+                    with self._wakeup:
+                        self._jobs.pop(job.job_id, None)
+                        if self._stopping:
+                            return  # the callback pool is gone; pending jobs are dropped
+                    print(f"Error handling SORA job {job.job_id}: {e}")
+                    self._fail(job, e)
+
+    def _check(self, job: _TrackedJob, status_data: Optional[dict], now: float):
+        """Handle one due job: report its status, reschedule it or complete it."""
+        status = status_data.get('status') if status_data else None
+
+        if status is None or status in PENDING_STATUSES:
+            if status is not None and status != job.last_status:
+                job.last_status = status
+                self._report_status(job, status)
+            if now >= job.deadline:
+                self._complete(job, 'timeout', status_data or {})
+            else:
+                job.interval = min(job.interval * self.backoff, self.max_interval)
+                job.next_check = now + job.interval
+            return
+
+        self._complete(job, status, status_data)
+
+    def _complete(self, job: _TrackedJob, status: str, status_data: dict):
+        """Stop tracking a job and hand its outcome to the callback pool."""
+        with self._wakeup:
+            self._jobs.pop(job.job_id, None)
+        self._callback_executor.submit(self._invoke, job, status, status_data)
+
+    @staticmethod
+    def _report_status(job: _TrackedJob, status: str):
+        if job.on_status is None:
+            return
+        try:
+            job.on_status(status)
+        except Exception as e:
+            print(f"Error in SORA status callback for {job.job_id}: {e}")
+
+    @classmethod
+    def _invoke(cls, job: _TrackedJob, status: str, status_data: dict):
+        try:
+            job.callback(status, status_data)
+        except Exception as e:
+            print(f"Error in SORA completion callback for {job.job_id}: {e}")
+            cls._fail(job, e)
+
+    @staticmethod
+    def _fail(job: _TrackedJob, error: Exception):
+        """Report a job that could not be handled to its on_error callback."""
+        if job.on_error is None:
+            return
+        try:
+            job.on_error(error)
+        except Exception as e:
+            print(f"Error in SORA error callback for {job.job_id}: {e}")
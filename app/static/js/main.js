@@ -1,5 +1,16 @@
 // TryScape JavaScript
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
+// Loading text for each job progress stage
+const STAGE_MESSAGES = {
+    queued: 'Waiting for a free worker...',
+    uploading: 'Sending your photo...',
+    notStarted: 'Waiting for the video service...',
+    running: 'Generating your TryScape...',
+    downloading: 'Saving your result...'
+};
+
 document.addEventListener('DOMContentLoaded', function() {
     const form = document.getElementById('tryscape-form');
     const userImageInput = document.getElementById('user_image');
@@ -7,6 +18,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const userFilename = document.getElementById('user-filename');
     const clothingFilename = document.getElementById('clothing-filename');
     const loadingOverlay = document.getElementById('loading');
+    const loadingStage = document.getElementById('loading-stage');
     const resultCard = document.getElementById('result');
     const generatedImage = document.getElementById('generated-image');
     const generatedVideo = document.getElementById('generated-video');
@@ -47,21 +59,26 @@ document.addEventListener('DOMContentLoaded', function() {
         resultCard.style.display = 'none';
 
         // Show loading overlay
+        showStage('queued');
         loadingOverlay.style.display = 'flex';
 
         // Prepare form data
         const formData = new FormData(form);
 
         try {
-            // Send request to generate image
+            // Queue the generation; the server answers with a job to poll
             const response = await fetch('/generate', {
                 method: 'POST',
                 body: formData
             });
 
-            const data = await response.json();
+            let data = await response.json();
 
             if (response.ok && data.success) {
+                data = await waitForJob(data.events_url, data.status_url);
+            }
+
+            if (data.success) {
                 // Show generated media (image or video)
                 if (data.media_type === 'video') {
                     generatedVideo.querySelector('source').src = data.generated_media_url;
@@ -100,6 +117,57 @@ document.addEventListener('DOMContentLoaded', function() {
         hideError();
     });
 
+    // Follow a job's progress events until it succeeds or fails
+    function waitForJob(eventsUrl, statusUrl) {
+        if (!window.EventSource) {
+            return pollJob(statusUrl);
+        }
+
+        return new Promise(resolve => {
+            const source = new EventSource(eventsUrl);
+
+            source.addEventListener('status', function(event) {
+                const job = JSON.parse(event.data);
+                showStage(job.stage);
+                if (job.status === 'failed') {
+                    source.close();
+                    resolve({ success: false, error: job.error });
+                } else if (job.status === 'succeeded') {
+                    source.close();
+                    resolve(job);
+                }
+            });
+
+            // The stream ends after the final event; anything else falls back to polling
+            source.onerror = function() {
+                source.close();
+                resolve(pollJob(statusUrl));
+            };
+        });
+    }
+
+    // Poll a job until it succeeds or fails
+    async function pollJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+
+            if (!response.ok || job.status === 'failed') {
+                return { success: false, error: job.error };
+            }
+            if (job.status === 'succeeded') {
+                return job;
+            }
+            showStage(job.stage);
+
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        }
+    }
+
+    function showStage(stage) {
+        loadingStage.textContent = STAGE_MESSAGES[stage] || STAGE_MESSAGES.running;
+    }
+
     function showError(message) {
         errorText.textContent = message;
         errorDiv.style.display = 'block';
@@ -0,0 +1,342 @@
+"""
+TryScape - Media Storage
+Pluggable backends for uploads and generated media: local disk or S3-compatible object storage.
+"""
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import BinaryIO, List, Optional, Tuple
+
+from app.config import Config
+
+
+# Key prefixes for each kind of stored file
+UPLOAD_PREFIX = 'uploads'
+GENERATED_PREFIX = 'generated'
+
+# Bytes copied per chunk when streaming into storage
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Fan-out of the sharded layout: SHARD_LEVELS folders of SHARD_WIDTH hex digits
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def shard_path(filename: str) -> str:
+    """
+    Place a file in the sharded layout, e.g. 'ab/cd/<filename>'.
+
+    The shard folders come from a hash of the name, so any writer can
+    derive them and files spread evenly whatever their naming scheme.
+
+    Args:
+        filename: Bare file name
+
+    Returns:
+        '/'-separated relative path
+    """
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return '/'.join(shards + [filename])
+
+
+def migrate_flat_folder(folder: str, key_prefix: str, index=None) -> int:
+    """
+    Move files sitting directly in folder into the sharded layout.
+
+    Files already in shard folders are left alone, so the migration can be
+    re-run safely.
+
+    Args:
+        folder: Local folder written with the old flat layout
+        key_prefix: Storage key prefix for files in folder
+        index: Optional ExpiryIndex whose keys are updated to match
+
+    Returns:
+        Number of files moved
+    """
+    if not os.path.isdir(folder):
+        return 0
+
+    moved = 0
+    renames: List[Tuple[str, str]] = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('.') or entry.name.endswith('.part'):
+                continue
+            relative = shard_path(entry.name)
+            dest = os.path.join(folder, *relative.split('/'))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(entry.path, dest)
+            moved += 1
+
+            if index is not None:
+                renames.append((f"{key_prefix}/{entry.name}", f"{key_prefix}/{relative}"))
+                if len(renames) >= 1000:
+                    index.rename_many(renames)
+                    renames = []
+
+    if renames:
+        index.rename_many(renames)
+    return moved
+
+
+def generated_key(local_path: str) -> str:
+    """
+    Storage key for a file staged under GENERATED_FOLDER.
+
+    Args:
+        local_path: Path inside GENERATED_FOLDER
+
+    Returns:
+        Key such as 'generated/ab/cd/generated_<id>.png'
+    """
+    relative = os.path.relpath(local_path, Config.GENERATED_FOLDER).replace(os.sep, '/')
+    return f"{GENERATED_PREFIX}/{relative}"
+
+
+def derivative_key(key: str, name: str, image_format: str) -> str:
+    """
+    Key of a downscaled copy stored beside an image.
+
+    Args:
+        key: Key of the original image
+        name: Derivative size name, e.g. 'thumb'
+        image_format: Derivative format, e.g. 'webp'
+
+    Returns:
+        Key such as 'generated/ab/cd/generated_<id>.thumb.webp'
+    """
+    stem = key.rsplit('.', 1)[0]
+    return f"{stem}.{name}.{image_format}"
+
+
+class Storage(ABC):
+    """
+    Interface for storing media by key.
+
+    Keys are '/'-separated relative paths such as 'generated/<name>.png'.
+    Generation work is staged in local files first and then handed over
+    with put_file, so backends only need whole-object writes.
+    """
+
+    @abstractmethod
+    def put_file(self, key: str, source_path: str, keep_source: bool = False) -> str:
+        """
+        Store a local file under key.
+
+        Args:
+            key: Destination key
+            source_path: Local file to store
+            keep_source: Leave the local file in place instead of consuming it
+
+        Returns:
+            The key
+        """
+
+    @abstractmethod
+    def put_fileobj(self, key: str, fileobj: BinaryIO) -> str:
+        """
+        Stream a readable binary file object into storage under key.
+
+        Returns:
+            The key
+        """
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored object for streaming reads. The caller closes it."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under key."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove the object stored under key, if any."""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """URL clients can fetch the object from."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of the object, or None for remote backends."""
+        return None
+
+
+class LocalStorage(Storage):
+    """Files under a local folder, served by the web server as static files."""
+
+    def __init__(self, root: str, base_url: str = '/static'):
+        """
+        Args:
+            root: Folder keys are relative to
+            base_url: URL prefix the folder is served under
+        """
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, key: str, source_path: str, keep_source: bool = False) -> str:
+        dest = self.local_path(key)
+        if os.path.abspath(source_path) == os.path.abspath(dest):
+            return key  # already staged in place
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if keep_source:
+            with open(source_path, 'rb') as source:
+                return self.put_fileobj(key, source)
+        shutil.move(source_path, dest)
+        return key
+
+    def put_fileobj(self, key: str, fileobj: BinaryIO) -> str:
+        dest = self.local_path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_path = f"{dest}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return key
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), 'rb')
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.local_path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket (AWS S3, MinIO, Azure via an S3 gateway).
+
+    Uploads use boto3's managed transfers, which stream files in parts.
+    Clients fetch objects through presigned URLs, or through public_url when
+    the bucket sits behind a CDN.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = '',
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        url_expiry: int = 3600,
+        public_url: Optional[str] = None,
+        client=None
+    ):
+        """
+        Args:
+            bucket: Bucket name
+            prefix: Key prefix inside the bucket
+            endpoint_url: Custom endpoint, e.g. a MinIO server
+            region: Bucket region
+            url_expiry: Seconds presigned URLs stay valid
+            public_url: Base URL serving the bucket publicly; disables presigning
+            client: Preconfigured boto3 S3 client, mainly for tests
+        """
+        if client is None:
+            # boto3 is only needed for this backend
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.url_expiry = url_expiry
+        self.public_url = public_url.rstrip('/') if public_url else None
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _extra_args(key: str) -> dict:
+        content_type = mimetypes.guess_type(key)[0]
+        return {'ContentType': content_type} if content_type else {}
+
+    def put_file(self, key: str, source_path: str, keep_source: bool = False) -> str:
+        self.client.upload_file(source_path, self.bucket, self._object_key(key), ExtraArgs=self._extra_args(key))
+        if not keep_source:
+            os.remove(source_path)
+        return key
+
+    def put_fileobj(self, key: str, fileobj: BinaryIO) -> str:
+        self.client.upload_fileobj(fileobj, self.bucket, self._object_key(key), ExtraArgs=self._extra_args(key))
+        return key
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{self._object_key(key)}"
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._object_key(key)},
+            ExpiresIn=self.url_expiry
+        )
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage() -> Storage:
+    """
+    Build the storage backend selected by STORAGE_BACKEND.
+
+    Raises:
+        ValueError: If the backend is unknown or misconfigured
+    """
+    if Config.STORAGE_BACKEND == 'local':
+        return LocalStorage(Config.STORAGE_LOCAL_ROOT, base_url=Config.STORAGE_LOCAL_URL)
+    if Config.STORAGE_BACKEND == 's3':
+        if not Config.S3_BUCKET:
+            raise ValueError('S3_BUCKET is required when STORAGE_BACKEND=s3')
+        return S3Storage(
+            Config.S3_BUCKET,
+            prefix=Config.S3_PREFIX,
+            endpoint_url=Config.S3_ENDPOINT_URL,
+            region=Config.S3_REGION,
+            url_expiry=Config.S3_URL_EXPIRY,
+            public_url=Config.S3_PUBLIC_URL
+        )
+    raise ValueError(f"Unknown storage backend: {Config.STORAGE_BACKEND}")
+
+
+def get_storage() -> Storage:
+    """Return the process-wide storage backend, creating it on first use."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
@@ -0,0 +1,147 @@
+"""
+TryScape - Streaming b64_json Decoding
+Decodes base64 image fields out of a JSON response body as it streams in.
+"""
+import binascii
+import json
+from typing import BinaryIO, Callable, Iterable, List
+
+
+_KEY = b'"b64_json"'
+
+# Decoder states
+_SCAN = 0       # outside any b64_json value
+_PRE_VALUE = 1  # after the key, before the opening quote
+_VALUE = 2      # inside the base64 string
+
+
+class StreamingB64JsonDecoder:
+    """
+    Incremental decoder for JSON bodies carrying large "b64_json" strings.
+
+    Each b64_json value is base64-decoded chunk by chunk into a sink opened
+    for it, so the encoded string and the decoded image are never held in
+    memory whole. Everything else is kept as a small JSON skeleton, with
+    each b64_json value replaced by an empty string, and parsed at the end.
+    """
+
+    def __init__(self, open_sink: Callable[[int], BinaryIO]):
+        """
+        Args:
+            open_sink: Called with the index of each b64_json value (0, 1, ...)
+                and returning a writable binary file for its decoded bytes
+        """
+        self.open_sink = open_sink
+        self.sinks: List[BinaryIO] = []
+        self._state = _SCAN
+        self._skeleton = bytearray()
+        self._pending = b''      # bytes that may hold the start of a key
+        self._b64_carry = b''    # base64 characters not yet forming a full quantum
+        self._escape = False     # previous chunk ended inside a JSON escape
+        self._sink = None
+
+    def feed(self, chunk: bytes):
+        """
+        Consume the next chunk of the response body.
+
+        Args:
+            chunk: Raw body bytes
+        """
+        while chunk:
+            if self._state == _SCAN:
+                data = self._pending + chunk
+                self._pending = b''
+                index = data.find(_KEY)
+                if index < 0:
+                    # Hold back enough bytes to match a key split across chunks
+                    keep = min(len(data), len(_KEY) - 1)
+                    self._skeleton += data[:len(data) - keep]
+                    self._pending = data[len(data) - keep:]
+                    return
+                end = index + len(_KEY)
+                self._skeleton += data[:end]
+                chunk = data[end:]
+                self._state = _PRE_VALUE
+
+            elif self._state == _PRE_VALUE:
+                quote = chunk.find(b'"')
+                if quote < 0:
+                    self._skeleton += chunk
+                    return
+                self._skeleton += chunk[:quote + 1]
+                chunk = chunk[quote + 1:]
+                self._sink = self.open_sink(len(self.sinks))
+                self.sinks.append(self._sink)
+                self._state = _VALUE
+
+            else:
+                # Base64 never contains quotes, so the first one ends the string
+                quote = chunk.find(b'"')
+                segment = chunk if quote < 0 else chunk[:quote]
+                self._write_base64(segment)
+                if quote < 0:
+                    return
+                self._finish_value()
+                self._skeleton += b'"'
+                chunk = chunk[quote + 1:]
+                self._state = _SCAN
+
+    def close(self) -> dict:
+        """
+        Finish decoding and parse the rest of the response.
+
+        Returns:
+            The response JSON with every b64_json value set to ""
+
+        Raises:
+            ValueError: If the body ended inside a value or is not valid JSON
+        """
+        if self._state != _SCAN:
+            raise ValueError('Response ended inside a b64_json value')
+        self._skeleton += self._pending
+        self._pending = b''
+        return json.loads(bytes(self._skeleton))
+
+    def _write_base64(self, segment: bytes):
+        """Decode and write every complete 4-character quantum in segment."""
+        if self._escape:
+            segment = b'\\' + segment
+            self._escape = False
+        if segment.endswith(b'\\'):
+            # Escape split across chunks; resolve it with the next one
+            segment = segment[:-1]
+            self._escape = True
+        if b'\\' in segment:
+            # JSON may escape '/' as '\/'
+            segment = segment.replace(b'\\/', b'/')
+
+        data = self._b64_carry + segment
+        usable = len(data) - len(data) % 4
+        if usable:
+            self._sink.write(binascii.a2b_base64(data[:usable]))
+        self._b64_carry = data[usable:]
+
+    def _finish_value(self):
+        """Flush the tail of the current value."""
+        if self._b64_carry:
+            self._sink.write(binascii.a2b_base64(self._b64_carry))
+        self._b64_carry = b''
+        self._escape = False
+        self._sink = None
+
+
+def decode_b64_json_stream(chunks: Iterable[bytes], open_sink: Callable[[int], BinaryIO]) -> dict:
+    """
+    Stream a JSON body through StreamingB64JsonDecoder.
+
+    Args:
+        chunks: Iterable of raw body chunks, e.g. response.iter_content()
+        open_sink: See StreamingB64JsonDecoder
+
+    Returns:
+        The response JSON with every b64_json value set to ""
+    """
+    decoder = StreamingB64JsonDecoder(open_sink)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close()
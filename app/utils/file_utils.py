@@ -4,8 +4,11 @@ Utilities for managing file uploads and storage.
 """
 import os
 import uuid
+from io import BytesIO
 from werkzeug.utils import secure_filename
 from app.config import Config
+from app.janitor import record_media
+from app.storage import UPLOAD_PREFIX, get_storage, shard_path
 
 
 def allowed_file(filename: str) -> bool:
@@ -22,36 +25,54 @@ def allowed_file(filename: str) -> bool:
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
-def save_uploaded_file(file, folder: str, prefix: str = "") -> str:
+def save_uploaded_file(file, folder: str = UPLOAD_PREFIX, prefix: str = "") -> str:
     """
-    Save an uploaded file with a unique filename.
+    Save an uploaded file to media storage with a unique filename.
     
     Args:
         file: FileStorage object from Flask
-        folder: Folder to save the file in
+        folder: Storage folder (key prefix) to save the file in
         prefix: Optional prefix for the filename
     
     Returns:
-        Path to the saved file
+        Storage key of the saved file
     """
     # Generate unique filename
     original_filename = secure_filename(file.filename)
     extension = original_filename.rsplit('.', 1)[1].lower()
     unique_filename = f"{prefix}{uuid.uuid4().hex}.{extension}"
     
-    # Ensure folder exists
-    os.makedirs(folder, exist_ok=True)
+    # Stream the upload into storage
+    key = get_storage().put_fileobj(f"{folder}/{shard_path(unique_filename)}", file.stream)
+    record_media(key, file.stream.tell())
+    return key
+
+
+def save_file_bytes(data: bytes, folder: str = UPLOAD_PREFIX, prefix: str = "", extension: str = "png") -> str:
+    """
+    Save in-memory file contents to media storage with a unique filename.
     
-    # Save file
-    file_path = os.path.join(folder, unique_filename)
-    file.save(file_path)
+    Args:
+        data: File contents
+        folder: Storage folder (key prefix) to save the file in
+        prefix: Optional prefix for the filename
+        extension: File extension without the dot
     
-    return file_path
+    Returns:
+        Storage key of the saved file
+    """
+    unique_filename = f"{prefix}{uuid.uuid4().hex}.{extension}"
+    key = get_storage().put_fileobj(f"{folder}/{shard_path(unique_filename)}", BytesIO(data))
+    record_media(key, len(data))
+    return key
 
 
 def cleanup_old_files(folder: str, max_age_hours: int = 24) -> int:
     """
-    Remove files older than max_age_hours from a folder.
+    Remove files older than max_age_hours from a folder and its shard folders.
+    
+    This stats every file in the folder; routine cleanup is done by the
+    background janitor (app/janitor.py) from its expiry index instead.
     
     Args:
         folder: Folder to clean up
@@ -69,9 +90,9 @@ def cleanup_old_files(folder: str, max_age_hours: int = 24) -> int:
     max_age_seconds = max_age_hours * 3600
     removed_count = 0
     
-    for filename in os.listdir(folder):
-        file_path = os.path.join(folder, filename)
-        if os.path.isfile(file_path):
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
             file_age = current_time - os.path.getmtime(file_path)
             if file_age > max_age_seconds:
                 try:
@@ -3,9 +3,32 @@ TryScape - Image Processing Utilities
 Utilities for processing and analyzing uploaded images.
 """
 import base64
-from PIL import Image
+import math
+import os
+import threading
+from collections import OrderedDict
+from PIL import ExifTags, Image, ImageOps
 from io import BytesIO
-from typing import Tuple, Optional
+from typing import Dict, Iterable, Tuple, Optional
+
+
+# Dimensions resize_image/prepare_image produce for common photo aspect ratios at the 1024 cap
+COMMON_MASK_SIZES = [
+    (1024, 1024),
+    (1024, 768), (768, 1024),    # 4:3
+    (1024, 683), (683, 1024),    # 3:2
+    (1024, 576), (576, 1024),    # 16:9
+    (1024, 819), (819, 1024),    # 5:4
+]
+
+# Downscale ratio above which normalization uses the cheaper bilinear filter
+FAST_RESAMPLE_RATIO = 2.0
+
+# Extra encoder options per derivative format (speed over size for request-time encoding)
+DERIVATIVE_SAVE_OPTIONS = {
+    'webp': {'method': 4},
+    'avif': {'speed': 8},
+}
 
 
 class ImageProcessor:
@@ -47,33 +70,177 @@ class ImageProcessor:
             return None
     
     @staticmethod
-    def resize_image(file_path: str, max_size: int = 1024) -> bool:
+    def normalize_image(
+        img: Image.Image,
+        max_size: int = 1024,
+        fast_resample_ratio: float = FAST_RESAMPLE_RATIO
+    ) -> Tuple[Image.Image, bool]:
+        """
+        Decode, orient and downscale an opened image in a single pass.
+        
+        JPEGs are decoded at a reduced DCT scale whenever that still leaves
+        at least max_size pixels, so phone photos are never decoded at full
+        resolution. EXIF orientation is applied to the pixels and the EXIF
+        block dropped. Reductions by more than fast_resample_ratio use a
+        bilinear filter; smaller ones keep LANCZOS. Modes other than RGB and
+        RGBA become RGBA when they carry alpha or a transparency key (LA, PA,
+        or P with transparency) so transparent areas are kept, and RGB
+        otherwise.
+        
+        The full decode also rejects truncated or corrupt files, so no
+        separate validate_image pass is needed.
+        
+        Args:
+            img: Image freshly returned by Image.open
+            max_size: Maximum dimension size
+            fast_resample_ratio: Downscale ratio above which to use the cheaper filter
+        
+        Returns:
+            Tuple of (normalized image, whether its pixels or metadata changed)
+        
+        Raises:
+            Exception: If the image cannot be decoded
+        """
+        scale = max(img.size) / max_size
+        if img.format == 'JPEG' and scale >= 2:
+            img.draft(img.mode, (math.ceil(img.width / scale), math.ceil(img.height / scale)))
+        img.load()
+        
+        changed = False
+        if img.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+            changed = True
+        if img.info.pop('exif', None) is not None:
+            changed = True
+        
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+            changed = True
+        
+        scale = max(img.size) / max_size
+        if scale > 1:
+            resample = Image.Resampling.BILINEAR if scale > fast_resample_ratio else Image.Resampling.LANCZOS
+            img.thumbnail((max_size, max_size), resample)
+            changed = True
+        
+        return img, changed
+    
+    @staticmethod
+    def resize_image(
+        file_path: str,
+        max_size: int = 1024,
+        fast_resample_ratio: float = FAST_RESAMPLE_RATIO
+    ) -> bool:
         """
         Resize image to fit within max_size while maintaining aspect ratio.
         
+        Files that are already upright, EXIF-free RGB/RGBA images within
+        max_size are left untouched rather than re-encoded.
+        
         Args:
             file_path: Path to the image file
             max_size: Maximum dimension size
+            fast_resample_ratio: Downscale ratio above which to use the cheaper filter
         
         Returns:
             True if successful, False otherwise
         """
         try:
             with Image.open(file_path) as img:
-                # Convert to RGB if necessary
-                if img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
-                
-                # Calculate new size maintaining aspect ratio
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-                # Save resized image
-                img.save(file_path, quality=95, optimize=True)
+                image_format = img.format
+                normalized, changed = ImageProcessor.normalize_image(img, max_size, fast_resample_ratio)
+                if changed:
+                    normalized.save(file_path, format=image_format, quality=95)
             return True
         except Exception as e:
             print(f"Error resizing image: {e}")
             return False
     
+    @staticmethod
+    def prepare_image(
+        data: bytes,
+        max_size: int = 1024,
+        fast_resample_ratio: float = FAST_RESAMPLE_RATIO
+    ) -> Optional[bytes]:
+        """
+        Validate, resize and PNG-encode an uploaded image entirely in memory.
+        
+        The image is decoded once; nothing touches disk. PNG uploads that
+        need no changes are returned as they are instead of re-encoded.
+        
+        Args:
+            data: Raw uploaded file contents
+            max_size: Maximum dimension size
+            fast_resample_ratio: Downscale ratio above which to use the cheaper filter
+        
+        Returns:
+            PNG-encoded bytes, or None if the data is not a valid image
+        """
+        try:
+            with Image.open(BytesIO(data)) as img:
+                image_format = img.format
+                normalized, changed = ImageProcessor.normalize_image(img, max_size, fast_resample_ratio)
+                if image_format == 'PNG' and not changed:
+                    return data
+                
+                buffer = BytesIO()
+                normalized.save(buffer, format='PNG')
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"Error preparing image: {e}")
+            return None
+    
+    @staticmethod
+    def create_derivatives(
+        source_path: str,
+        sizes: Dict[str, int],
+        formats: Iterable[str] = ('webp',),
+        quality: int = 80
+    ) -> Dict[Tuple[str, str], str]:
+        """
+        Write downscaled copies of an image beside it as <stem>.<name>.<format>.
+        
+        The source is decoded once and each size is resized from the next
+        larger one, so the total cost is little more than the largest resize.
+        
+        Args:
+            source_path: Path to the original image
+            sizes: Maximum dimension per derivative name, e.g. {'thumb': 256}
+            formats: Output formats, e.g. ('webp', 'avif')
+            quality: Encoder quality (0-100)
+        
+        Returns:
+            Paths of the written files keyed by (name, format); empty on error
+        """
+        stem = os.path.splitext(source_path)[0]
+        written = {}
+        try:
+            with Image.open(source_path) as img:
+                img.load()
+                current = img
+                if img.mode not in ('RGB', 'RGBA'):
+                    current = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+                
+                for name, max_size in sorted(sizes.items(), key=lambda item: -item[1]):
+                    current = current.copy()
+                    current.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+                    for image_format in formats:
+                        path = f"{stem}.{name}.{image_format}"
+                        current.save(
+                            path,
+                            format=image_format.upper(),
+                            quality=quality,
+                            **DERIVATIVE_SAVE_OPTIONS.get(image_format, {})
+                        )
+                        written[(name, image_format)] = path
+        except Exception as e:
+            print(f"Error creating image derivatives: {e}")
+            for path in written.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            return {}
+        return written
+    
     @staticmethod
     def image_to_base64(file_path: str) -> Optional[str]:
         """
@@ -111,3 +278,62 @@ class ImageProcessor:
                 return f"Image: {width}x{height}, {mode} mode, {format_name} format"
         except Exception:
             return "Unable to analyze image"
+
+
+class MaskProvider:
+    """Memoizes PNG-encoded full-edit masks per image size."""
+    
+    def __init__(self, max_entries: int = 64):
+        """
+        Initialize an empty mask cache.
+        
+        Args:
+            max_entries: Maximum number of distinct sizes kept
+        """
+        self.max_entries = max_entries
+        self._masks: 'OrderedDict[Tuple[int, int], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_mask(self, size: Tuple[int, int]) -> bytes:
+        """
+        Get a full white RGBA mask (edit everywhere) for an image size.
+        
+        Args:
+            size: (width, height) of the image
+        
+        Returns:
+            PNG-encoded mask bytes
+        """
+        with self._lock:
+            mask_bytes = self._masks.get(size)
+            if mask_bytes is not None:
+                self._masks.move_to_end(size)
+                return mask_bytes
+        
+        # Encode outside the lock; a concurrent duplicate encode is harmless
+        mask_bytes = self._encode_mask(size)
+        
+        with self._lock:
+            self._masks[size] = mask_bytes
+            self._masks.move_to_end(size)
+            while len(self._masks) > self.max_entries:
+                self._masks.popitem(last=False)
+        return mask_bytes
+    
+    def prewarm(self, sizes: Iterable[Tuple[int, int]] = COMMON_MASK_SIZES):
+        """
+        Encode masks for the given sizes ahead of the first request.
+        
+        Args:
+            sizes: Image sizes to prepare
+        """
+        for size in sizes:
+            self.get_mask(size)
+    
+    @staticmethod
+    def _encode_mask(size: Tuple[int, int]) -> bytes:
+        # For gpt-image-1, white areas indicate where to edit
+        mask = Image.new('RGBA', size, (255, 255, 255, 255))
+        buffer = BytesIO()
+        mask.save(buffer, 'PNG')
+        return buffer.getvalue()
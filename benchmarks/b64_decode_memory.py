@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+TryScape Benchmark - b64_json Response Decoding Memory
+Compares peak RSS of buffered vs streaming decoding of an images/edits response.
+
+A local HTTP server serves a JSON body shaped like the gpt-image-1 edits
+response. Each strategy runs in a fresh process so its peak RSS reflects only
+that strategy.
+
+Usage:
+    python benchmarks/b64_decode_memory.py [--image-mb 8] [--images 1]
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def buffered_decode(url: str, out_dir: str):
+    """The previous path: response.json(), then b64decode, then write."""
+    import requests
+
+    result = requests.get(url, timeout=60).json()
+    for index, item in enumerate(result['data']):
+        image_bytes = base64.b64decode(item['b64_json'])
+        with open(os.path.join(out_dir, f"buffered_{index}.png"), 'wb') as f:
+            f.write(image_bytes)
+
+
+def streaming_decode(url: str, out_dir: str):
+    """The streaming path used by AzureOpenAIService._edit_image."""
+    import requests
+    from app.utils.b64_stream import StreamingB64JsonDecoder
+
+    def open_sink(index):
+        return open(os.path.join(out_dir, f"streaming_{index}.png"), 'wb')
+
+    with requests.get(url, timeout=60, stream=True) as response:
+        decoder = StreamingB64JsonDecoder(open_sink)
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            decoder.feed(chunk)
+        decoder.close()
+        for sink in decoder.sinks:
+            sink.close()
+
+
+def _peak_rss_kb() -> int:
+    """Peak resident set size of this process in KB."""
+    # ru_maxrss survives exec on Linux, so prefer the per-address-space VmHWM
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(strategy, url, out_dir, queue):
+    import requests  # noqa: F401  (import cost excluded from the measurement)
+    import app.utils.b64_stream  # noqa: F401
+
+    before = _peak_rss_kb()
+    strategy(url, out_dir)
+    after = _peak_rss_kb()
+    queue.put((before, after))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image-mb', type=float, default=8, help='Decoded size of each image in MB')
+    parser.add_argument('--images', type=int, default=1, help='Images per response (the edits n parameter)')
+    args = parser.parse_args()
+
+    image = os.urandom(int(args.image_mb * 1024 * 1024))
+    body = json.dumps({
+        'created': 0,
+        'data': [{'b64_json': base64.b64encode(image).decode('ascii')} for _ in range(args.images)],
+    }).encode('utf-8')
+    del image
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/edits"
+
+    print(f"Response body: {len(body) / 1024 / 1024:.1f} MB "
+          f"({args.images} x {args.image_mb:g} MB decoded)")
+    print(f"{'strategy':<12}{'baseline RSS':>16}{'peak RSS':>14}{'growth':>12}")
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, strategy in (('buffered', buffered_decode), ('streaming', streaming_decode)):
+            queue = context.Queue()
+            process = context.Process(target=_measure, args=(strategy, url, out_dir, queue))
+            process.start()
+            before, after = queue.get()
+            process.join()
+            print(f"{name:<12}{before / 1024:>13.1f} MB{after / 1024:>11.1f} MB{(after - before) / 1024:>9.1f} MB")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
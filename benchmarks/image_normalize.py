@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+TryScape Benchmark - Upload Normalization
+Times the previous and current upload normalization paths over phone-sized photos.
+
+By default a synthetic corpus of 4, 8 and 12 MP JPEGs (half of them with an
+EXIF rotation, as portrait phone shots usually have) is generated. Point
+--corpus at a folder of real photos for representative numbers.
+
+Usage:
+    python benchmarks/image_normalize.py [--corpus DIR] [--per-size 4] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import ExifTags, Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.image_utils import ImageProcessor  # noqa: E402
+
+
+# Typical phone camera resolutions (4:3)
+PHOTO_SIZES = {
+    '4MP': (2304, 1728),
+    '8MP': (3264, 2448),
+    '12MP': (4032, 3024),
+}
+
+
+def previous_prepare_image(data: bytes, max_size: int = 1024) -> bytes:
+    """The previous prepare_image: full decode, LANCZOS thumbnail, PNG encode."""
+    with Image.open(BytesIO(data)) as img:
+        img.load()
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def previous_resize_image(file_path: str, max_size: int = 1024):
+    """The previous validate_image + resize_image pair: verify, decode, LANCZOS, optimized re-encode."""
+    with Image.open(file_path) as img:
+        img.verify()
+    with Image.open(file_path) as img:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        img.save(file_path, quality=95, optimize=True)
+
+
+def make_corpus(folder: str, per_size: int):
+    """Write synthetic photo-like JPEGs: gradients plus sensor-like noise."""
+    for label, (width, height) in PHOTO_SIZES.items():
+        for index in range(per_size):
+            gradient = Image.linear_gradient('L').resize((width, height))
+            noise = Image.effect_noise((width, height), 40 + 10 * index)
+            img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+            exif = Image.Exif()
+            exif[ExifTags.Base.Make] = 'Benchmark'
+            if index % 2:
+                exif[ExifTags.Base.Orientation] = 6  # portrait shot stored sideways
+            img.save(os.path.join(folder, f"{label}_{index}.jpg"), quality=90, exif=exif.tobytes())
+
+
+def time_strategy(paths, run, repeat: int):
+    """Milliseconds per call of run(path), for every path and repeat."""
+    timings = []
+    for _ in range(repeat):
+        for path in paths:
+            start = time.perf_counter()
+            run(path)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Folder of photos to use instead of the synthetic corpus')
+    parser.add_argument('--per-size', type=int, default=4, help='Synthetic photos per resolution')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the corpus per strategy')
+    parser.add_argument('--max-size', type=int, default=1024, help='Maximum output dimension')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(work_dir, 'corpus')
+            os.makedirs(corpus)
+            make_corpus(corpus, args.per_size)
+
+        paths = sorted(
+            os.path.join(corpus, name) for name in os.listdir(corpus)
+            if os.path.isfile(os.path.join(corpus, name))
+        )
+        blobs = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                blobs[path] = f.read()
+        megapixels = {}
+        for path in paths:
+            with Image.open(path) as img:
+                megapixels[path] = img.width * img.height / 1e6
+        print(f"Corpus: {len(paths)} photos, {min(megapixels.values()):.1f}-{max(megapixels.values()):.1f} MP")
+
+        # resize_image rewrites its file, so each call gets a fresh copy
+        def on_copy(resize):
+            def run(path):
+                scratch = os.path.join(work_dir, 'scratch' + os.path.splitext(path)[1])
+                shutil.copyfile(path, scratch)
+                resize(scratch)
+            return run
+
+        strategies = (
+            ('prepare_image (previous)', lambda path: previous_prepare_image(blobs[path], args.max_size)),
+            ('prepare_image', lambda path: ImageProcessor.prepare_image(blobs[path], args.max_size)),
+            ('resize_image (previous)', on_copy(lambda path: previous_resize_image(path, args.max_size))),
+            ('resize_image', on_copy(lambda path: ImageProcessor.resize_image(path, args.max_size))),
+        )
+
+        print(f"{'strategy':<28}{'mean':>10}{'median':>10}{'p95':>10}{'ms/MP':>10}")
+        total_mp = sum(megapixels.values()) * args.repeat
+        for name, run in strategies:
+            run(paths[0])  # warm up imports and codecs
+            timings = time_strategy(paths, run, args.repeat)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            print(
+                f"{name:<28}{statistics.mean(timings):>8.1f}ms{statistics.median(timings):>8.1f}ms"
+                f"{p95:>8.1f}ms{sum(timings) / total_mp:>10.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+TryScape Benchmark - Image Pool Latency Under Mixed Load
+Compares request latency with upload normalization inline vs in the image worker pool.
+
+Client threads play the request threads of a threaded server: each sends a
+mix of large phone photos and small uploads through ImagePool.prepare_image,
+while one more thread times a light, pure-Python request (serializing job
+payloads) to show how image work on request threads delays everything else.
+
+Usage:
+    python benchmarks/image_pool_latency.py [--threads 8] [--duration 20] [--workers 2]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.image_pool import ImagePool  # noqa: E402
+
+
+def make_photo(size) -> bytes:
+    """A photo-like JPEG: gradient plus sensor-like noise."""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 40)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def light_request():
+    """Stand-in for a cheap endpoint such as /jobs/<id>."""
+    payload = {'job_id': 'x' * 32, 'status': 'running', 'stage': 'running', 'derivatives': {}}
+    for _ in range(200):
+        json.dumps(payload)
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_load(pool: ImagePool, uploads, threads: int, duration: float, large_share: float):
+    """Drive the pool from client threads and return latencies (ms) per request kind."""
+    latencies = {'large': [], 'small': [], 'light': []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            kind = 'large' if rng.random() < large_share else 'small'
+            start = time.perf_counter()
+            pool.prepare_image(uploads[kind])
+            with lock:
+                latencies[kind].append((time.perf_counter() - start) * 1000)
+
+    def light_client():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            light_request()
+            with lock:
+                latencies['light'].append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=client, args=(seed,)) for seed in range(threads)]
+    workers.append(threading.Thread(target=light_client))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent upload threads')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per configuration')
+    parser.add_argument('--workers', type=int, default=2, help='Image pool worker processes')
+    parser.add_argument('--large-share', type=float, default=0.25, help='Fraction of uploads that are 12 MP photos')
+    parser.add_argument('--inline-max-bytes', type=int, default=512 * 1024, help='Pool inline threshold')
+    args = parser.parse_args()
+
+    uploads = {'large': make_photo((4032, 3024)), 'small': make_photo((800, 600))}
+    print(f"CPUs: {os.cpu_count()}; uploads: large {len(uploads['large']) / 1024:.0f} KB, "
+          f"small {len(uploads['small']) / 1024:.0f} KB; {args.threads} threads, {args.duration:g}s each")
+    print(f"{'configuration':<16}{'request':<8}{'count':>7}{'p50':>10}{'p99':>10}{'max':>10}")
+
+    configurations = (
+        ('inline', ImagePool(max_workers=0)),
+        (f"pool ({args.workers})", ImagePool(max_workers=args.workers, inline_max_bytes=args.inline_max_bytes)),
+    )
+    for name, pool in configurations:
+        pool.prepare_image(uploads['large'])  # start the workers outside the measurement
+        latencies = run_load(pool, uploads, args.threads, args.duration, args.large_share)
+        pool.shutdown()
+        for kind, values in latencies.items():
+            if values:
+                print(
+                    f"{name:<16}{kind:<8}{len(values):>7}{statistics.median(values):>8.1f}ms"
+                    f"{percentile(values, 99):>8.1f}ms{max(values):>8.1f}ms"
+                )
+
+
+if __name__ == '__main__':
+    main()
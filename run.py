@@ -1,20 +1,89 @@
 """
 TryScape Application Entry Point
+
+Usage:
+    python run.py                 Run the Flask development server
+    python run.py serve [options] Run the production server (gunicorn)
+    python run.py migrate-layout  Move flat upload/generated folders into shard folders
 """
-from app.app import create_app
+import argparse
+
 from app.config import Config
 
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='TryScape')
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help='Run the production server')
+    serve_parser.add_argument('--bind', help='host:port to listen on')
+    serve_parser.add_argument('--workers', type=int, help='Number of worker processes')
+    serve_parser.add_argument('--threads', type=int, help='Threads per worker')
+    serve_parser.add_argument('--worker-class', help="Worker class: 'sync', 'gthread' or an async class such as 'gevent'")
+    serve_parser.add_argument('--timeout', type=int, help='Seconds before a silent worker is restarted')
+    serve_parser.add_argument('--graceful-timeout', type=int, help='Seconds workers get to finish on restart')
+    serve_parser.add_argument('--preload', dest='preload', action='store_true', default=None,
+                              help='Load the app before forking workers')
+    serve_parser.add_argument('--no-preload', dest='preload', action='store_false')
+
+    subparsers.add_parser('migrate-layout', help='Move flat media folders into the sharded layout')
+
+    return parser.parse_args()
+
+
+def migrate_layout():
+    """Shard files written by older versions into the two-level folder layout."""
+    import os
+    from app.janitor import ExpiryIndex
+    from app.storage import GENERATED_PREFIX, UPLOAD_PREFIX, migrate_flat_folder
+
+    # Keep the janitor's expiry index in step with the moved files
+    index = None
+    if Config.JANITOR_ENABLED and os.path.exists(Config.JANITOR_INDEX_PATH):
+        index = ExpiryIndex(Config.JANITOR_INDEX_PATH)
+
+    folders = [
+        (Config.UPLOAD_FOLDER, UPLOAD_PREFIX),
+        (Config.GENERATED_FOLDER, GENERATED_PREFIX),
+        (os.path.join(Config.GENERATED_FOLDER, 'cache'), f"{GENERATED_PREFIX}/cache"),
+    ]
+    for folder, key_prefix in folders:
+        moved = migrate_flat_folder(folder, key_prefix, index)
+        print(f"{folder}: moved {moved} files")
+
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'migrate-layout':
+        # Local files only; no Azure credentials needed
+        migrate_layout()
+        raise SystemExit(0)
+
     try:
         # Validate configuration
         Config.validate()
 
-        # Create and run app
-        app = create_app()
-        # Respect optional env/config values for host/port
-        host = getattr(Config, 'FLASK_RUN_HOST', '0.0.0.0')
-        port = getattr(Config, 'FLASK_RUN_PORT', 5000)
-        app.run(host=host, port=port, debug=Config.DEBUG)
+        if args.command == 'serve':
+            from app.server import serve
+            serve(
+                bind=args.bind,
+                workers=args.workers,
+                threads=args.threads,
+                worker_class=args.worker_class,
+                timeout=args.timeout,
+                graceful_timeout=args.graceful_timeout,
+                preload=args.preload
+            )
+        else:
+            from app.app import create_app
+
+            # Create and run app
+            app = create_app()
+            # Respect optional env/config values for host/port
+            host = getattr(Config, 'FLASK_RUN_HOST', '0.0.0.0')
+            port = getattr(Config, 'FLASK_RUN_PORT', 5000)
+            app.run(host=host, port=port, debug=Config.DEBUG)
         
     except ValueError as e:
         print(f"Configuration Error: {e}")
@@ -12,6 +12,6 @@ mkdir -p /app/app/static/generated
 chmod 755 /app/app/static/uploads
 chmod 755 /app/app/static/generated
 
-# Run the application
-echo "Launching Flask application..."
-python run.py
+# Run the application under the production server
+echo "Launching TryScape production server..."
+python run.py serve
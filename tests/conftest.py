@@ -0,0 +1,53 @@
+"""
+Shared fixtures: the app on temporary storage with process-wide singletons reset.
+"""
+import pytest
+
+import app.app as app_module
+import app.janitor as janitor_module
+import app.storage as storage_module
+from app.config import Config
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """
+    Factory for an app on a temporary local storage root.
+
+    Defaults keep tests offline and quiet: no result cache, janitor or job
+    store, and image work done inline. Keyword arguments override Config.
+    """
+    apps = []
+
+    def make(**overrides):
+        static = tmp_path / 'static'
+        settings = {
+            'AZURE_OPENAI_ENDPOINT': 'http://127.0.0.1:9',
+            'AZURE_OPENAI_API_KEY': 'test',
+            'STORAGE_BACKEND': 'local',
+            'STORAGE_LOCAL_ROOT': str(static),
+            'UPLOAD_FOLDER': str(static / 'uploads'),
+            'GENERATED_FOLDER': str(static / 'generated'),
+            'RESULT_CACHE_ENABLED': False,
+            'JANITOR_ENABLED': False,
+            'JANITOR_INDEX_PATH': str(tmp_path / 'media_index.db'),
+            'JOB_STORE_BACKEND': 'none',
+            'JOB_WORKER_TYPE': 'thread',
+            'PERSIST_UPLOADS': False,
+            'MASK_PREWARM': False,
+            'IMAGE_POOL_WORKERS': 0,
+        }
+        settings.update(overrides)
+        for name, value in settings.items():
+            monkeypatch.setattr(Config, name, value)
+        monkeypatch.setattr(storage_module, '_storage', None)
+        monkeypatch.setattr(janitor_module, '_index', None)
+        monkeypatch.setattr(app_module, '_azure_service', None)
+
+        flask_app = app_module.create_app()
+        apps.append(flask_app)
+        return flask_app
+
+    yield make
+    for flask_app in apps:
+        flask_app.extensions['job_manager'].shutdown()
@@ -0,0 +1,84 @@
+"""
+User images saved for the job store are not left behind by requests that create no job.
+"""
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import app.app as app_module
+from app.config import Config
+
+
+def image_upload(color=(10, 20, 30)):
+    data = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(data, format='PNG')
+    data.seek(0)
+    return data, 'user.png'
+
+
+def saved_uploads():
+    return [
+        name for _, _, filenames in os.walk(Config.UPLOAD_FOLDER)
+        for name in filenames if name.startswith('user_')
+    ]
+
+
+@pytest.fixture
+def gate():
+    """Released to let blocked image generations finish."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def client(make_app, monkeypatch, gate):
+    """App with room for a single job, whose image generations wait for the gate."""
+    flask_app = make_app(JOB_STORE_BACKEND='memory', JOB_MAX_WORKERS=1, JOB_MAX_QUEUE=0)
+
+    def generate(*args, **kwargs):
+        gate.wait(10)
+        return None
+
+    monkeypatch.setattr(app_module.get_azure_service(), 'generate_tryscape_image', generate)
+    return flask_app.test_client()
+
+
+def test_queue_full_discards_upload(client):
+    accepted = client.post('/generate', data={'user_image': image_upload((1, 1, 1))})
+    assert accepted.status_code == 202
+    assert len(saved_uploads()) == 1
+
+    rejected = client.post('/generate', data={'user_image': image_upload((2, 2, 2))})
+    assert rejected.status_code == 429
+    rejected_batch = client.post('/generate/batch', data={
+        'user_image': image_upload((3, 3, 3)),
+        'variants': json.dumps([{'location_description': 'beach'}]),
+    })
+    assert rejected_batch.status_code == 429
+    assert len(saved_uploads()) == 1
+
+
+def test_repeat_request_shares_job_and_upload(client):
+    first = client.post('/generate', data={'user_image': image_upload()})
+    repeat = client.post('/generate', data={'user_image': image_upload()})
+
+    assert repeat.json['job_id'] == first.json['job_id']
+    assert len(saved_uploads()) == 1
+
+
+def test_finished_job_releases_upload(client, gate):
+    accepted = client.post('/generate', data={'user_image': image_upload()})
+    assert len(saved_uploads()) == 1
+
+    gate.set()
+    deadline = time.monotonic() + 10
+    while saved_uploads() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert client.get(accepted.json['status_url']).json['status'] == 'failed'
+    assert saved_uploads() == []
@@ -0,0 +1,41 @@
+"""
+Uploads are normalized to RGB, or to RGBA when they carry transparency.
+"""
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.utils.image_utils import ImageProcessor
+
+
+def encode(img: Image.Image, image_format: str = 'PNG') -> bytes:
+    data = BytesIO()
+    img.save(data, format=image_format)
+    return data.getvalue()
+
+
+def palette_with_transparent_index() -> Image.Image:
+    img = Image.new('P', (8, 8), 0)
+    img.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+    img.putpixel((0, 0), 1)
+    img.info['transparency'] = 0
+    return img
+
+
+@pytest.mark.parametrize('source', [
+    Image.new('LA', (8, 8), (200, 0)),
+    palette_with_transparent_index(),
+])
+def test_transparency_is_kept(source):
+    with Image.open(BytesIO(ImageProcessor.prepare_image(encode(source)))) as prepared:
+        assert prepared.mode == 'RGBA'
+        assert prepared.getpixel((1, 1))[3] == 0
+        if source.mode == 'P':
+            assert prepared.getpixel((0, 0)) == (255, 0, 0, 255)
+
+
+def test_opaque_modes_become_rgb():
+    with Image.open(BytesIO(ImageProcessor.prepare_image(encode(Image.new('L', (8, 8), 100))))) as prepared:
+        assert prepared.mode == 'RGB'
+        assert prepared.getpixel((0, 0)) == (100, 100, 100)
@@ -0,0 +1,70 @@
+"""
+The media janitor deletes expired files and the oldest ones over quota, from its index.
+"""
+import io
+import time
+
+import pytest
+
+from app.janitor import ExpiryIndex, MediaJanitor
+from app.storage import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path / 'media'))
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ExpiryIndex(str(tmp_path / 'media_index.db'))
+
+
+def store(storage, index, key: str, size: int, age: float, ttl: float = 3600):
+    """Write a file of size bytes under key, indexed as created age seconds ago."""
+    storage.put_fileobj(key, io.BytesIO(b'x' * size))
+    index.add(key, size, ttl, created_at=time.time() - age)
+
+
+def test_expired_files_are_reclaimed(storage, index):
+    store(storage, index, 'generated/old.png', 100, age=7200)
+    store(storage, index, 'generated/new.png', 50, age=10)
+
+    report = MediaJanitor(storage, index).run_once()
+
+    assert report['expired_files'] == 1
+    assert report['expired_bytes'] == 100
+    assert not storage.exists('generated/old.png')
+    assert storage.exists('generated/new.png')
+    assert index.count() == 1
+
+
+def test_quota_reclaims_oldest_first(storage, index):
+    for age, key in ((300, 'generated/a.png'), (200, 'generated/b.png'), (100, 'generated/c.png')):
+        store(storage, index, key, 100, age=age)
+
+    report = MediaJanitor(storage, index, max_bytes=150).run_once()
+
+    assert report['quota_files'] == 2
+    assert [storage.exists(key) for key in ('generated/a.png', 'generated/b.png', 'generated/c.png')] == [
+        False, False, True
+    ]
+    assert index.total_bytes() == 100
+
+
+def test_usage_counts_one_key_prefix(storage, index):
+    store(storage, index, 'generated/a.png', 100, age=0)
+    store(storage, index, 'generated/b/c.png', 20, age=0)
+    store(storage, index, 'uploads/user.png', 7, age=0)
+
+    assert index.usage('generated') == (120, 2)
+    assert index.usage('uploads') == (7, 1)
+
+
+def test_lease_admits_one_janitor_until_it_expires(index):
+    now = time.time()
+
+    assert index.claim_lease('host:1', ttl=60, now=now)
+    assert not index.claim_lease('host:2', ttl=60, now=now + 1)
+    assert index.claim_lease('host:1', ttl=60, now=now + 30)
+    assert index.claim_lease('host:2', ttl=60, now=now + 91)
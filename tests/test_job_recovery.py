@@ -0,0 +1,101 @@
+"""
+Jobs left unfinished by an exited process are claimed and resumed by the next one.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+import app.storage as storage_module
+from app.app import INTERRUPTED_JOB_ERROR, recover_jobs
+from app.job_store import MemoryJobStore, RECORD_FIELDS, process_owner
+from app.utils.file_utils import save_file_bytes
+
+
+def exited_owner() -> str:
+    """Owner tag of a process on this host that has already exited."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}"
+
+
+def wait_until_done(job, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        job.wait_for_change(job.version, timeout=0.1)
+
+
+def unfinished_record(job_id: str, owner: str, user_image_key=None) -> dict:
+    now = datetime.now().isoformat()
+    record = dict.fromkeys(RECORD_FIELDS)
+    record.update({
+        'id': job_id,
+        'kind': 'image',
+        'status': 'running',
+        'stage': 'uploading',
+        'inputs_hash': job_id,
+        'request': {
+            'generation_type': 'image',
+            'user_description': 'a person',
+            'clothing_description': 'casual outfit',
+            'location_description': 'outdoor setting',
+            'candidates': 1,
+            'user_image_key': user_image_key,
+        },
+        'owner': owner,
+        'created_at': now,
+        'updated_at': now,
+    })
+    return record
+
+
+@pytest.fixture
+def job_manager(make_app):
+    """Job manager of a DEBUG app (placeholder results, no Azure) on an in-memory store."""
+    return make_app(DEBUG=True, JOB_STORE_BACKEND='memory').extensions['job_manager']
+
+
+def test_store_claim_is_compare_and_set():
+    store = MemoryJobStore()
+    store.save(unfinished_record('job', 'host:1'))
+
+    assert store.claim('job', 'host:1', 'host:2')
+    assert not store.claim('job', 'host:1', 'host:3')
+    assert store.get('job')['owner'] == 'host:2'
+
+
+def test_recovers_job_of_exited_process(job_manager):
+    store = job_manager.store
+    user_image_key = save_file_bytes(b'image', prefix='user_')
+    store.save(unfinished_record('orphan', exited_owner(), user_image_key))
+
+    assert recover_jobs(job_manager, storage_module.get_storage()) == 1
+
+    job = job_manager.get('orphan')
+    wait_until_done(job)
+    assert job.status == 'succeeded'
+    assert store.get('orphan')['owner'] == process_owner()
+
+
+def test_leaves_jobs_of_live_processes(job_manager):
+    store = job_manager.store
+    live_owner = f"{socket.gethostname()}:{os.getppid()}"
+    store.save(unfinished_record('busy', live_owner, save_file_bytes(b'image', prefix='user_')))
+
+    assert recover_jobs(job_manager, storage_module.get_storage()) == 0
+    assert store.get('busy')['owner'] == live_owner
+    assert store.get('busy')['status'] == 'running'
+
+
+def test_fails_job_whose_inputs_are_gone(job_manager):
+    store = job_manager.store
+    store.save(unfinished_record('lost', exited_owner()))
+
+    assert recover_jobs(job_manager, storage_module.get_storage()) == 0
+    record = store.get('lost')
+    assert record['status'] == 'failed'
+    assert record['error'] == INTERRUPTED_JOB_ERROR
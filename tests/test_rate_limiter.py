@@ -0,0 +1,18 @@
+"""
+Deployment limits are totals, shared out between the processes that enforce them.
+"""
+from app.rate_limiter import DeploymentGovernor
+
+
+def test_limits_are_divided_between_processes():
+    governor = DeploymentGovernor('image', requests_per_minute=30, max_concurrency=4, processes=2)
+
+    assert governor.bucket.rate * 60 == 15
+    assert governor.semaphore.limit == 2
+
+
+def test_concurrency_keeps_one_slot_per_process():
+    governor = DeploymentGovernor('sora', requests_per_minute=0, max_concurrency=2, processes=8)
+
+    assert governor.bucket is None
+    assert governor.semaphore.limit == 1
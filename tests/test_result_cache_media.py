@@ -0,0 +1,86 @@
+"""
+Media published from the result cache must outlive the cache entry it came from.
+"""
+import os
+import uuid
+
+import pytest
+from PIL import Image
+
+import app.app as app_module
+import app.storage as storage_module
+from app.config import Config
+from app.image_pool import get_image_pool
+from app.result_cache import ResultCache
+
+
+@pytest.fixture
+def client(make_app):
+    """App with a one-entry result cache."""
+    return make_app(RESULT_CACHE_ENABLED=True, RESULT_CACHE_MAX_ENTRIES=1).test_client()
+
+
+def edit_output(color) -> str:
+    """A decoded edit output staged the way _edit_image leaves it."""
+    path = app_module.get_azure_service()._generated_path(f"generated_{uuid.uuid4().hex}.png") + '.part'
+    Image.new('RGB', (64, 64), color).save(path, format='PNG')
+    return path
+
+
+def test_evicted_cache_entry_keeps_published_media(client):
+    service = app_module.get_azure_service()
+    storage = storage_module.get_storage()
+
+    first = service._keep_edit_output(edit_output((255, 0, 0)), 'a' * 64)
+    second = service._keep_edit_output(edit_output((0, 0, 255)), 'b' * 64)
+
+    # The second entry pushed the first out of the one-entry cache
+    assert service.result_cache.get('a' * 64) is None
+    assert first.storage_key != second.storage_key
+
+    for result in (first, second):
+        response = client.get(storage.url(result.storage_key))
+        assert response.status_code == 200
+        thumb = client.get(storage.url(result.storage_key) + '?size=thumb', headers={'Accept': 'image/webp'})
+        assert thumb.status_code == 200
+        for response in (response, thumb):
+            response.close()
+    assert os.path.exists(storage.local_path(first.storage_key))
+
+
+def test_cache_hit_links_stored_derivatives(client, monkeypatch):
+    service = app_module.get_azure_service()
+    storage = storage_module.get_storage()
+    key = 'c' * 64
+
+    first = service._keep_edit_output(edit_output((0, 255, 0)), key)
+    cached_path = service.result_cache.get(key)
+    cached_derivatives = [
+        ResultCache.derivative_path(cached_path, name, image_format)
+        for name in Config.DERIVATIVE_SIZES
+        for image_format in Config.DERIVATIVE_FORMATS
+    ]
+    assert all(os.path.exists(path) for path in cached_derivatives)
+
+    # A hit publishes the stored thumbnails and previews instead of rendering them again
+    pool = get_image_pool()
+    renders = []
+    original = pool.create_derivatives
+
+    def counting(*args, **kwargs):
+        renders.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pool, 'create_derivatives', counting)
+    hit = service._cached_image_result(key)
+    assert renders == []
+    assert hit.storage_key != first.storage_key
+    for formats in hit.metadata['derivatives'].values():
+        for derived_key in formats.values():
+            assert storage.exists(derived_key)
+
+    # Evicting the entry takes its derivatives along, but not the published copies
+    service._keep_edit_output(edit_output((0, 0, 0)), 'd' * 64)
+    assert not any(os.path.exists(path) for path in cached_derivatives)
+    thumb = hit.metadata['derivatives']['thumb']['webp']
+    assert storage.exists(thumb)
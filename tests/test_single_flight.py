@@ -0,0 +1,78 @@
+"""
+Concurrent identical requests share one call, and every caller hears what the leader learns.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+from app.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    follower.start()
+    deadline = time.monotonic() + 5
+    while flight.shared == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    finish.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert calls == [1]
+    assert results == ['result', 'result']
+    assert flight.in_flight() == 0
+
+
+def test_followers_share_the_leaders_future_and_notices():
+    flight = SingleFlight()
+    upstream = Future()
+    starts = []
+    heard = {'leader': [], 'early': [], 'late': []}
+
+    def start():
+        starts.append(1)
+        return upstream
+
+    leader = flight.do_async('key', start, listener=heard['leader'].append)
+    early = flight.do_async('key', start, listener=heard['early'].append)
+    flight.notify('key', 'job-1')
+    late = flight.do_async('key', start, listener=heard['late'].append)
+
+    assert starts == [1]
+    assert leader is early is late
+    assert heard == {'leader': ['job-1'], 'early': ['job-1'], 'late': ['job-1']}
+
+    upstream.set_result('video')
+    assert late.result(timeout=1) == 'video'
+
+    # Once finished, the next request starts fresh and old notices are gone
+    fresh = []
+    again = flight.do_async('key', lambda: Future(), listener=fresh.append)
+    assert again is not leader
+    assert fresh == []
+
+
+def test_failing_start_fails_every_caller():
+    flight = SingleFlight()
+
+    def start():
+        raise RuntimeError('boom')
+
+    shared = flight.do_async('key', start)
+    assert isinstance(shared.exception(timeout=1), RuntimeError)
+    assert flight.in_flight() == 0